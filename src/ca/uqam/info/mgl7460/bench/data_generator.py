@@ -0,0 +1,54 @@
+import json
+import random
+
+# Ce module génère des documents ayant la forme de data/boutique.json, de
+# taille arbitraire, pour les bancs d'essai
+
+
+# Returns a boutique document with nb_produits produits, and nb_clients
+# clients having each nb_commandes commandes of nb_lignes lignes.
+#
+# 'relations' chooses the kind of the collections: "mixed" (the layout of
+# boutique.json: lignes in a "table_", the other collections in "liste_"),
+# "table" (all collections indexed by id) or "liste" (no indexed collection)
+def generate_boutique(nb_clients: int, nb_commandes: int, nb_lignes: int, nb_produits: int = 100, seed: int = 7460,
+                      relations: str = "mixed") -> dict:
+    if relations not in ("mixed", "table", "liste"):
+        raise ValueError(f"Type de relations inconnu: '{relations}'")
+    generator = random.Random(seed)
+    produits = [{"id": f"P{numero}",
+                 "nom": f"produit {numero}",
+                 "description": f"Description du produit {numero}",
+                 "prixUnitaire": round(generator.uniform(1, 500), 2)} for numero in range(nb_produits)]
+    clients = []
+    for numero_client in range(nb_clients):
+        commandes = []
+        for numero_commande in range(nb_commandes):
+            lignes = [{"id_produit": produit["id"], "quantite": generator.randint(1, 10)}
+                      for produit in generator.sample(produits, min(nb_lignes, nb_produits))]
+            commandes.append({"id": f"COM{numero_client}-{numero_commande}",
+                              **collection("ligne_commande", lignes, "id_produit", relations != "liste")})
+        clients.append({"id": f"CL{numero_client}",
+                        "nom": f"nom {numero_client}",
+                        "prenom": f"prenom {numero_client}",
+                        "adresse": generator.choice(["Montréal", "Québec", "Saguenay", "Laval", "Gatineau"]),
+                        **collection("commande", commandes, "id", relations == "table")})
+    return {"nom": "MGL7460 Bazaar",
+            **collection("produit", produits, "id", relations == "table"),
+            **collection("client", clients, "id", relations == "table")}
+
+
+# Returns the member of a document that holds a collection of elements:
+# {"table_<name>s": {key: element}} if indexed, {"liste_<name>s": [element]}
+# otherwise
+def collection(name: str, elements: list, index_field: str, indexed: bool) -> dict:
+    if indexed:
+        return {f"table_{name}s": {element[index_field]: element for element in elements}}
+    return {f"liste_{name}s": elements}
+
+
+# Writes a generated boutique document to file_name
+def write_boutique(file_name: str, nb_clients: int, nb_commandes: int, nb_lignes: int, nb_produits: int = 100,
+                   relations: str = "mixed"):
+    with open(file_name, 'w') as json_file:
+        json.dump(generate_boutique(nb_clients, nb_commandes, nb_lignes, nb_produits, relations=relations), json_file)
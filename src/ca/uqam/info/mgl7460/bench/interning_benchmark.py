@@ -0,0 +1,51 @@
+import json
+import tracemalloc
+from ca.uqam.info.mgl7460.bench.data_generator import generate_boutique
+from ca.uqam.info.mgl7460.bench.serialization_benchmark import best_time
+from ca.uqam.info.mgl7460.json_loader import json_loader
+
+# Ce banc d'essai mesure l'effet de l'internement des valeurs (voir
+# meta/value_interner.py) sur les attributs qui se répètent d'un objet à
+# l'autre: la mémoire occupée par le graphe d'objets une fois le document
+# json libéré, et le temps de création des objets, avec et sans internement
+
+INTERNED_VALUES = {"client": ["adresse"], "produit": ["nom"], "ligne_commande": ["id_produit"]}
+
+
+# Returns the number of bytes still allocated by the object graph once the
+# json document it was created from has been freed (the document is parsed
+# while the allocations are traced, since the graph holds its strings)
+def graph_size(create_object, text: str) -> int:
+    tracemalloc.start()
+    document = json.loads(text)
+    top_object = create_object(document)
+    del document
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del top_object
+    return size
+
+
+def main(nb_clients: int, nb_commandes: int, nb_lignes: int):
+    # le texte est analysé à chaque création: les chaînes ne sont pas partagées par le document
+    text = json.dumps(generate_boutique(nb_clients, nb_commandes, nb_lignes))
+    print(f"{'mode':<12}{'graphe (Mo)':>14}{'création (ms)':>16}")
+    for interned in (False, True):
+        loader = json_loader("/memory/src/bench_interning_" + ("on" if interned else "off"), use_slots=True)
+        top_class = loader.build_class("boutique", json.loads(text))
+        if interned:
+            loader.intern_values(INTERNED_VALUES)
+        loader.load_classes(in_memory=True)
+        size = graph_size(top_class.create_object, text)
+        # les économies d'une seule création (les suivantes s'y ajouteraient)
+        report = loader.interning_report()
+        documents = [json.loads(text) for _ in range(3)]
+        duration = best_time(lambda: top_class.create_object(documents.pop()))
+        print(f"{'internement' if interned else 'aucun':<12}{size / 1e6:>14.1f}{duration * 1000:>16.1f}")
+        for class_name, class_report in report.items():
+            print(f"  {class_name:<16}{class_report['bytes_saved'] / 1e6:>10.1f} Mo économisés")
+
+
+if __name__ == '__main__':
+
+    main(10000, 5, 5)
@@ -0,0 +1,153 @@
+import importlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from ca.uqam.info.mgl7460.bench.data_generator import write_boutique
+from ca.uqam.info.mgl7460.json_loader import json_loader
+from ca.uqam.info.mgl7460.json_parser import json_parser
+
+# Ce banc d'essai mesure chacune des phases de json_loader.main, sur des
+# documents générés de tailles et de types de relations différents:
+#   parse            lecture du fichier json (read_data)
+#   build_class      inférence des classes
+#   generate_code    écriture du code des classes
+#   load_code        import des modules générés
+#   create_object    création du graphe d'objets
+#
+# Pour chaque phase, on mesure le meilleur temps sur 'repeat' exécutions,
+# puis, dans une exécution séparée (tracemalloc ralentit le code), le pic de
+# mémoire allouée pendant la phase et la mémoire qu'elle laisse allouée.
+# On mesure aussi le débit de la lecture (en Mo/s) de chacun des analyseurs
+# json installés, avec et sans projection du fichier en mémoire (mmap).
+# Les résultats sont écrits en json, pour suivre les régressions
+
+PHASES = ("parse", "build_class", "generate_code", "load_code", "create_object")
+
+# nombre d'exécutions des phases, pour que chacune ait son propre package
+RUNS = 0
+
+
+# Runs the phases of json_loader.main on a data file, with the classes generated
+# in a new package of source_directory. Returns, for each phase, its duration
+# in seconds, or (if traced) its peak and retained memory in bytes
+def run_phases(source_directory: str, data_directory: str, input_data_file_name: str, traced: bool) -> dict:
+    global RUNS
+    RUNS += 1
+    code_output_directory = f"{source_directory}/bench_phases_{RUNS}"
+    os.makedirs(code_output_directory)
+    loader = json_loader(code_output_directory)
+    state = dict()
+
+    def build_class():
+        state["top_class"] = loader.build_class(loader.top_class_name, loader.jsobjet)
+
+    def generate_code():
+        for json_class in loader.classes.values():
+            json_class.generate_code(code_output_directory)
+        importlib.invalidate_caches()
+
+    def load_code():
+        for json_class in loader.classes.values():
+            json_class.load_code()
+
+    def create_object():
+        state["top_object"] = state["top_class"].create_object(loader.jsobjet)
+
+    phases = {"parse": lambda: loader.read_data(data_directory, input_data_file_name),
+              "build_class": build_class,
+              "generate_code": generate_code,
+              "load_code": load_code,
+              "create_object": create_object}
+    measures = dict()
+    for name in PHASES:
+        if traced:
+            tracemalloc.start()
+            phases[name]()
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            measures[name] = {"peak_bytes": peak, "retained_bytes": retained}
+        else:
+            start = time.perf_counter()
+            phases[name]()
+            measures[name] = time.perf_counter() - start
+    return measures
+
+
+# Returns the parse throughput, in bytes per second, of each installed json
+# backend, reading the file normally and through mmap
+def measure_parsers(file_name: str, repeat: int) -> dict:
+    size = os.path.getsize(file_name)
+    throughputs = dict()
+    for backend in json_parser.available_backends():
+        for use_mmap in (False, True):
+            parser = json_parser(backend, use_mmap)
+            durations = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                parser.parse_file(file_name)
+                durations.append(time.perf_counter() - start)
+            throughputs[backend + ("+mmap" if use_mmap else "")] = size / min(durations)
+    return throughputs
+
+
+# Measures the phases for one generated document, and returns the result
+# record of the document
+def measure(source_directory: str, data_directory: str, nb_clients: int, nb_commandes: int, nb_lignes: int,
+            relations: str, repeat: int) -> dict:
+    # un répertoire par document, pour que la classe racine s'appelle boutique
+    document_directory = f"{data_directory}/{nb_clients}_{nb_commandes}_{nb_lignes}_{relations}"
+    input_data_file_name = "boutique.json"
+    os.makedirs(document_directory)
+    write_boutique(document_directory + "/" + input_data_file_name, nb_clients, nb_commandes, nb_lignes, relations=relations)
+
+    durations = [run_phases(source_directory, document_directory, input_data_file_name, False) for _ in range(repeat)]
+    memory = run_phases(source_directory, document_directory, input_data_file_name, True)
+    return {"nb_clients": nb_clients,
+            "nb_commandes": nb_commandes,
+            "nb_lignes": nb_lignes,
+            "relations": relations,
+            "size_bytes": os.path.getsize(document_directory + "/" + input_data_file_name),
+            "phases": {name: {"seconds": min(run[name] for run in durations), **memory[name]} for name in PHASES},
+            "parse_bytes_per_second": measure_parsers(document_directory + "/" + input_data_file_name, repeat)}
+
+
+# Runs the benchmark for each scale (nb_clients, nb_commandes, nb_lignes) and
+# each kind of relations, prints a summary, and writes the results to
+# results_file_name
+def main(scales: list, relations: tuple = ("mixed", "table", "liste"), repeat: int = 3,
+         results_file_name: str = "loader_benchmark.json"):
+    source_directory = tempfile.mkdtemp() + "/src"
+    data_directory = tempfile.mkdtemp()
+    sys.path.insert(0, source_directory)
+
+    results = []
+    for nb_clients, nb_commandes, nb_lignes in scales:
+        for relation_kind in relations:
+            results.append(measure(source_directory, data_directory, nb_clients, nb_commandes, nb_lignes, relation_kind, repeat))
+
+    with open(results_file_name, 'w') as results_file:
+        json.dump({"python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "results": results}, results_file, indent=2)
+
+    print(f"{'document':<36}{'Mo':>8}" + "".join(f"{name:>16}" for name in PHASES))
+    for result in results:
+        document = f"{result['nb_clients']}x{result['nb_commandes']}x{result['nb_lignes']} {result['relations']}"
+        print(f"{document:<36}{result['size_bytes'] / 1e6:>8.1f}"
+              + "".join(f"{result['phases'][name]['seconds'] * 1000:>13.1f} ms" for name in PHASES))
+    parsers = list(results[0]["parse_bytes_per_second"])
+    print(f"\n{'débit de lecture (Mo/s)':<44}" + "".join(f"{name:>16}" for name in parsers))
+    for result in results:
+        document = f"{result['nb_clients']}x{result['nb_commandes']}x{result['nb_lignes']} {result['relations']}"
+        print(f"{document:<44}" + "".join(f"{result['parse_bytes_per_second'][name] / 1e6:>16.1f}" for name in parsers))
+    print("Résultats: " + results_file_name)
+
+
+if __name__ == '__main__':
+
+    main([(100, 5, 5), (1000, 5, 5), (10000, 5, 5)])
@@ -0,0 +1,27 @@
+import os
+from ca.uqam.info.mgl7460.bench.data_generator import generate_boutique
+from ca.uqam.info.mgl7460.bench.serialization_benchmark import load_classes, best_time
+from ca.uqam.info.mgl7460.json_loader import json_loader
+
+# Ce banc d'essai mesure la création des objets d'un gros document par
+# un nombre croissant de processus (json_loader.create_object_parallel),
+# par rapport à la création séquentielle. Le gain dépend du nombre de
+# coeurs disponibles, et du coût du retour des objets au processus parent
+
+
+def main(nb_clients: int, nb_commandes: int, nb_lignes: int, chunk_size: int = 500):
+    document = generate_boutique(nb_clients, nb_commandes, nb_lignes)
+    top_class = load_classes(document, "bench_parallel")
+    loader = json_loader("/memory/src/bench_parallel")
+
+    sequential = best_time(lambda: top_class.create_object(document))
+    print(f"coeurs: {os.cpu_count()}, clients: {nb_clients}, morceaux de {chunk_size}")
+    print(f"{'séquentiel':<20}{sequential * 1000:>10.1f} ms")
+    for workers in (1, 2, 4, 8):
+        duration = best_time(lambda: loader.create_object_parallel(top_class, document, workers, chunk_size), repeat=1)
+        print(f"{str(workers) + ' processus':<20}{duration * 1000:>10.1f} ms{sequential / duration:>10.2f}x")
+
+
+if __name__ == '__main__':
+
+    main(20000, 5, 5)
@@ -0,0 +1,59 @@
+import json
+import time
+from io import StringIO
+from ca.uqam.info.mgl7460.bench.data_generator import generate_boutique
+from ca.uqam.info.mgl7460.json_loader import json_loader
+
+# Ce banc d'essai compare la sérialisation d'un graphe d'objets générés
+# (write_json, to_json) à celle de l'arbre de dictionnaires équivalent
+# par json.dumps, ainsi que les allers-retours json -> objets -> json
+
+
+# Generates and loads, in memory, the classes of a document
+def load_classes(document: dict, package_name: str):
+    loader = json_loader("/memory/src/" + package_name)
+    top_class = loader.build_class("boutique", document)
+    for json_class in loader.classes.values():
+        json_class.generate_code_in_memory()
+        json_class.load_code()
+    return top_class
+
+
+# Returns the best time of 'repeat' executions of function
+def best_time(function, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(nb_clients: int, nb_commandes: int, nb_lignes: int):
+    document = generate_boutique(nb_clients, nb_commandes, nb_lignes)
+    text = json.dumps(document)
+    size = len(text) / 1e6
+    top_class = load_classes(document, "bench_serialization")
+    top_object = top_class.create_object(document)
+
+    # le texte produit par write_json est celui de json.dumps
+    stream = StringIO()
+    top_object.write_json(stream)
+    assert stream.getvalue() == text
+
+    measures = {
+        "json.dumps(dictionnaires)": lambda: json.dumps(document),
+        "write_json(objets)": lambda: top_object.write_json(StringIO()),
+        "json.dumps(to_json(objets))": lambda: json.dumps(top_object.to_json()),
+        "aller-retour dictionnaires": lambda: json.dumps(json.loads(text)),
+        "aller-retour objets": lambda: top_class.create_object(json.loads(text)).write_json(StringIO()),
+    }
+    print(f"document: {size:.1f} Mo")
+    for name, function in measures.items():
+        duration = best_time(function)
+        print(f"{name:<30}{duration * 1000:>10.1f} ms{size / duration:>10.1f} Mo/s")
+
+
+if __name__ == '__main__':
+
+    main(2000, 5, 5)
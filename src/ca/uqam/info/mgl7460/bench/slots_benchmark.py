@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import tracemalloc
+from ca.uqam.info.mgl7460.json_loader import json_loader
+
+# Ce banc d'essai mesure la mémoire occupée par une instance de chacune des
+# classes générées pour boutique.json, avec et sans __slots__.
+#
+# Les classes sont générées dans un répertoire temporaire (un package
+# différent pour chaque mode), pour ne pas écraser le code de 'generated'
+
+
+# Generates and loads the classes of the data file, in a fresh package,
+# and returns the generated types indexed by class name
+def load_classes(data_directory: str, input_data_file_name: str, use_slots: bool) -> dict:
+    source_directory = tempfile.mkdtemp() + "/src"
+    package_name = "bench_slots" if use_slots else "bench_dict"
+    code_output_directory = source_directory + "/" + package_name
+    os.makedirs(code_output_directory)
+    sys.path.insert(0, source_directory)
+
+    loader = json_loader(code_output_directory, use_slots=use_slots)
+    loader.read_data(data_directory, input_data_file_name)
+    loader.build_class(loader.top_class_name, loader.jsobjet)
+    for json_class in loader.classes.values():
+        json_class.generate_code(code_output_directory)
+        json_class.load_code()
+    return {name: json_class for name, json_class in loader.classes.items()}
+
+
+# Returns the average number of bytes allocated per instance, for
+# 'count' instances built with the same attribute values
+def bytes_per_instance(class_type, attribute_values: list, count: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = [class_type(*attribute_values) for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # on retire la place occupée par la liste elle-même
+    return (after - before - sys.getsizeof(instances)) / len(instances)
+
+
+def main(data_directory: str, input_data_file_name: str, count: int):
+    classes_dict = load_classes(data_directory, input_data_file_name, use_slots=False)
+    classes_slots = load_classes(data_directory, input_data_file_name, use_slots=True)
+
+    print(f"{'classe':<16}{'dict (o)':>12}{'slots (o)':>12}{'gain':>8}")
+    for name, json_class in classes_dict.items():
+        # des valeurs partagées, pour ne mesurer que les instances
+        attribute_values = [name] * len(json_class.attributes)
+        size_dict = bytes_per_instance(json_class.type, attribute_values, count)
+        size_slots = bytes_per_instance(classes_slots[name].type, attribute_values, count)
+        print(f"{name:<16}{size_dict:>12.1f}{size_slots:>12.1f}{1 - size_slots / size_dict:>8.0%}")
+
+
+if __name__ == '__main__':
+
+    data_directory = "./data"
+    input_data_file_name = "boutique.json"
+    main(data_directory, input_data_file_name, 100000)
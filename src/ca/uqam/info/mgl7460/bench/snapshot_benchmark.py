@@ -0,0 +1,33 @@
+import json
+import os
+import tempfile
+from ca.uqam.info.mgl7460.bench.data_generator import generate_boutique
+from ca.uqam.info.mgl7460.bench.serialization_benchmark import best_time
+from ca.uqam.info.mgl7460.json_loader import json_loader
+
+# Ce banc d'essai compare le rechargement d'un graphe d'objets à partir d'un
+# snapshot (voir meta/snapshot.py) à sa reconstruction à partir du texte json
+# (analyse, puis create_object), avec et sans __slots__
+
+
+def main(nb_clients: int, nb_commandes: int, nb_lignes: int):
+    document = generate_boutique(nb_clients, nb_commandes, nb_lignes)
+    text = json.dumps(document)
+    snapshot_file_name = tempfile.mkdtemp() + "/boutique.snapshot"
+    print(f"document: {len(text) / 1e6:.1f} Mo")
+    print(f"{'mode':<10}{'json (ms)':>12}{'snapshot (ms)':>16}{'gain':>8}{'snapshot (Mo)':>16}")
+    for use_slots in (False, True):
+        loader = json_loader("/memory/src/bench_snapshot_" + ("slots" if use_slots else "dict"), use_slots=use_slots)
+        top_class = loader.build_class("boutique", document)
+        loader.load_classes(in_memory=True)
+        loader.write_snapshot(snapshot_file_name, top_class.create_object(document))
+
+        from_json = best_time(lambda: top_class.create_object(json.loads(text)))
+        from_snapshot = best_time(lambda: loader.read_snapshot(snapshot_file_name))
+        print(f"{'slots' if use_slots else 'dict':<10}{from_json * 1000:>12.1f}{from_snapshot * 1000:>16.1f}"
+              f"{from_json / from_snapshot:>7.1f}x{os.path.getsize(snapshot_file_name) / 1e6:>16.1f}")
+
+
+if __name__ == '__main__':
+
+    main(10000, 5, 5)
@@ -0,0 +1,29 @@
+import time
+from ca.uqam.info.mgl7460.bench.data_generator import generate_boutique
+from ca.uqam.info.mgl7460.bench.serialization_benchmark import load_classes, best_time
+from ca.uqam.info.mgl7460.meta.validator_compiler import ValidatorCompiler
+
+# Ce banc d'essai mesure le surcoût de la validation pendant la construction
+# (voir meta/validator_compiler.py): la création des objets par les fabriques
+# from_json générées, comparée à leur création par les fabriques validantes,
+# pour chaque type de relations. Le temps de compilation des fabriques
+# validantes, payé une fois par chargement, est mesuré à part
+
+
+def main(nb_clients: int, nb_commandes: int, nb_lignes: int):
+    print(f"{'relations':<12}{'from_json (ms)':>16}{'validé (ms)':>14}{'surcoût':>10}{'compilation (ms)':>18}")
+    for relations in ("mixed", "table", "liste"):
+        document = generate_boutique(nb_clients, nb_commandes, nb_lignes, relations=relations)
+        top_class = load_classes(document, "bench_validation_" + relations)
+
+        start = time.perf_counter()
+        create_object_validated = ValidatorCompiler().compile(top_class)
+        compilation = time.perf_counter() - start
+        from_json = best_time(lambda: top_class.create_object(document))
+        validated = best_time(lambda: create_object_validated(document))
+        print(f"{relations:<12}{from_json * 1000:>16.1f}{validated * 1000:>14.1f}{validated / from_json - 1:>10.0%}{compilation * 1000:>18.2f}")
+
+
+if __name__ == '__main__':
+
+    main(10000, 5, 5)
@@ -1,6 +1,26 @@
+import asyncio
+import copy
+import json
+import os
+import sys
+import tempfile
 import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+from ca.uqam.info.mgl7460.bench.data_generator import generate_boutique
 from ca.uqam.info.mgl7460.json_loader import json_loader
+from ca.uqam.info.mgl7460.json_parser import json_parser
+from ca.uqam.info.mgl7460.json_patch import json_patch
+from ca.uqam.info.mgl7460.json_watcher import json_watcher
+from ca.uqam.info.mgl7460.loader_metrics import loader_metrics
+from ca.uqam.info.mgl7460.meta.identity_set import IdentitySet
+from ca.uqam.info.mgl7460.meta.memory_importer import InMemoryImporter
 from ca.uqam.info.mgl7460.meta.relationship import Relationship
+from ca.uqam.info.mgl7460.meta.schema_cache import SchemaCache
+from ca.uqam.info.mgl7460.meta.snapshot import Snapshot
+from ca.uqam.info.mgl7460.meta.validator_compiler import ValidationError
+from ca.uqam.info.mgl7460.meta.value_interner import ValueInterner
 
 class classe_tests_meta (unittest.TestCase):
 
@@ -198,6 +218,879 @@ class classe_tests_meta (unittest.TestCase):
         self.assertEquals(quantite_tables,1,"Nombre de TAB1 commandés est faux")
 
 
+    #
+    # cette fonction vérifie que la lecture en continu du fichier (streaming)
+    # produit les mêmes classes et les mêmes objets que la lecture complète
+    #
+    def test_lecture_en_continu(self):
+
+        # 1. on lit le fichier par petits blocs, pour forcer plusieurs lectures par élément
+        self.js_loader.stream_data(self.data_directory, self.input_data_file_name, chunk_size=16)
+        self.assertIsNone(self.js_loader.jsobjet, "Le document ne devrait pas être chargé en mémoire")
+
+        # 2. on construit les classes à partir du flux
+        top_class = self.js_loader.build_class_from_stream()
+        self.assertEqual(top_class.name, 'boutique')
+        self.assertEqual(set(self.js_loader.classes.keys()), {'boutique', 'produit', 'client', 'commande', 'ligne_commande'})
+        self.assertEqual(self.js_loader.classes['commande'].relationships['ligne_commande'].index_field, 'id_produit')
+
+        # 3. on génère le code, puis on crée les objets à partir du flux
+        for js_class in iter(self.js_loader.classes.values()):
+            js_class.generate_code(self.code_output_directory)
+            js_class.load_code()
+        top_object = self.js_loader.create_object_from_stream(top_class)
+
+        self.assertIsInstance(top_object, top_class.type)
+        self.assertEqual(top_object.nom, "MGL7460 Bazaar")
+        self.assertEqual([produit.id for produit in top_object.liste_produits], ['CH1', 'TAB1', 'LAM1'])
+        self.assertEqual([client.nom for client in top_object.liste_clients], ['Tremblay', 'Sauvé'])
+        commande_4 = top_object.liste_clients[1].liste_commandes[1]
+        self.assertEqual(commande_4.table_ligne_commandes['LAM1'].quantite, 1)
+
+
+    #
+    # cette fonction vérifie que les formes des éléments d'une liste sont
+    # fusionnées dans une seule classe, et que sample_size limite l'inférence
+    #
+    def test_fusion_des_schemas(self):
+        fragment = {
+            "nom": "Bazaar",
+            "liste_clients": [
+                {"id": "CL1", "nom": "Tremblay", "solde": 10},
+                {"id": "CL2", "adresse": "Montréal", "solde": 12.5,
+                 "liste_commandes": [{"id": "COM1"}]}
+            ]
+        }
+
+        # 1. tous les champs vus dans les éléments sont conservés
+        top_class = self.js_loader.build_class('boutique', fragment)
+        classe_client = self.js_loader.classes['client']
+        self.assertEqual(list(classe_client.attributes.keys()), ['id', 'nom', 'solde', 'adresse'])
+        self.assertEqual(classe_client.attributes['solde'], 'float')
+        self.assertIn('commande', classe_client.relationships)
+        self.assertEqual(top_class.relationships['client'].destination_entity, 'client')
+
+        # 2. avec sample_size=1, seul le premier client est examiné
+        loader = json_loader(self.code_output_directory, sample_size=1)
+        loader.build_class('boutique', fragment)
+        self.assertEqual(list(loader.classes['client'].attributes.keys()), ['id', 'nom', 'solde'])
+        self.assertNotIn('commande', loader.classes)
+
+
+    #
+    # cette fonction vérifie que les fabriques from_json générées créent les
+    # objets directement, sans passer par JSONClass
+    #
+    def test_fabriques_from_json(self):
+        self.js_loader.read_data(self.data_directory, self.input_data_file_name)
+        self.js_loader.build_class('boutique', self.js_loader.jsobjet)
+
+        # les classes sont ordonnées de façon à ce que les classes liées soient générées en premier
+        noms_classes = list(self.js_loader.classes.keys())
+        self.assertLess(noms_classes.index('ligne_commande'), noms_classes.index('commande'))
+        self.assertLess(noms_classes.index('client'), noms_classes.index('boutique'))
+
+        for js_class in iter(self.js_loader.classes.values()):
+            js_class.generate_code(self.code_output_directory)
+            js_class.load_code()
+
+        classe_commande = self.js_loader.classes['commande'].type
+        commande = classe_commande.from_json({"id": "COM9", "table_ligne_commandes": {"CH1": {"id_produit": "CH1", "quantite": 3}}})
+        self.assertIsInstance(commande, classe_commande)
+        self.assertEqual(commande.get_ligne_commande_with_id_produit("CH1").quantite, 3)
+
+        # les clés absentes donnent None, et les relations absentes restent vides
+        commande_vide = classe_commande.from_json({})
+        self.assertIsNone(commande_vide.id)
+        self.assertEqual(commande_vide.table_ligne_commandes, {})
+
+
+    #
+    # cette fonction vérifie qu'en mode compact, les classes générées
+    # déclarent __slots__ et que leurs instances n'ont pas de __dict__
+    #
+    def test_generation_slots(self):
+        # on génère dans un package temporaire pour ne pas écraser 'generated'
+        source_directory = tempfile.mkdtemp() + "/src"
+        code_output_directory = source_directory + "/generated_slots"
+        os.makedirs(code_output_directory)
+        sys.path.insert(0, source_directory)
+
+        loader = json_loader(code_output_directory, use_slots=True)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        for js_class in iter(loader.classes.values()):
+            js_class.generate_code(code_output_directory)
+            js_class.load_code()
+
+        self.assertEqual(loader.classes['client'].type.__slots__, ('id', 'nom', 'prenom', 'adresse', 'liste_commandes'))
+        self.assertEqual(loader.classes['commande'].type.__slots__, ('id', 'table_ligne_commandes'))
+
+        top_object = top_class.create_object(loader.jsobjet)
+        self.assertFalse(hasattr(top_object, '__dict__'))
+        self.assertEqual(len(top_object.liste_clients[0].liste_commandes), 2)
+        self.assertEqual(top_object.liste_clients[0].liste_commandes[0].table_ligne_commandes['TAB1'].quantite, 1)
+
+
+    #
+    # cette fonction vérifie le stockage en colonnes d'une relation ONE_TO_MANY
+    # (liste et table), et les agrégats calculés sur les colonnes
+    #
+    def test_relations_en_colonnes(self):
+        source_directory = tempfile.mkdtemp() + "/src"
+        code_output_directory = source_directory + "/generated_columns"
+        os.makedirs(code_output_directory)
+        sys.path.insert(0, source_directory)
+
+        loader = json_loader(code_output_directory)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        top_class.use_columns('produit')
+        loader.classes['commande'].use_columns('ligne_commande')
+        with self.assertRaises(ValueError):
+            top_class.use_columns('client')
+        for js_class in iter(loader.classes.values()):
+            js_class.generate_code(code_output_directory)
+            js_class.load_code()
+
+        top_object = top_class.create_object(loader.jsobjet)
+
+        # accès par colonnes
+        produits = top_object.liste_produits
+        self.assertEqual(len(produits), 3)
+        self.assertAlmostEqual(produits.sum('prixUnitaire'), 129.95 + 249.95 + 39.95)
+        self.assertEqual(produits.max('prixUnitaire'), 249.95)
+        self.assertEqual(list(produits.columns['id']), ['CH1', 'TAB1', 'LAM1'])
+
+        # accès "objet" par les vues sur les lignes
+        self.assertEqual([produit.nom for produit in top_object.get_liste_produits()], ['chaise', 'Table', 'Lampe'])
+        commande_1 = top_object.liste_clients[0].liste_commandes[0]
+        self.assertEqual(commande_1.get_ligne_commande_with_id_produit('TAB1').quantite, 1)
+        self.assertEqual(commande_1.table_ligne_commandes.sum('quantite'), 2)
+        self.assertIn("CHA1 -> ligne_commande[id_produit = CHA1, quantite = 1]", commande_1.__str__())
+
+        # ajout et retrait passent par les accesseurs générés
+        lampe = produits[2]
+        top_object.remove_produit(lampe)
+        self.assertEqual(len(produits), 2)
+        commande_1.remove_ligne_commande_with_id_produit('CHA1')
+        self.assertIsNone(commande_1.get_ligne_commande_with_id_produit('CHA1'))
+        self.assertEqual(commande_1.get_ligne_commande_with_id_produit('TAB1').quantite, 1)
+        # un entier de plus de 64 bits transforme la colonne en liste
+        commande_1.get_ligne_commande_with_id_produit('TAB1').quantite = 2 ** 70
+        commande_1.table_ligne_commandes.append_json({"id_produit": "CH1", "quantite": 2 ** 70})
+        self.assertEqual(list(commande_1.table_ligne_commandes.column('quantite')), [2 ** 70, 2 ** 70])
+
+        # un retrait marque la ligne; les colonnes sont compactées au besoin
+        self.assertEqual(len(produits.removed), 1)
+        chaise, table = produits
+        top_object.remove_produit(chaise)
+        # une ligne déjà retirée, ou un objet qui n'est pas une ligne, est refusé
+        with self.assertRaises(ValueError):
+            top_object.remove_produit(chaise)
+        with self.assertRaises(ValueError):
+            top_object.remove_produit(top_object.liste_clients[0])
+        self.assertEqual(table.nom, 'Table')
+        self.assertEqual([produit.id for produit in produits], ['TAB1'])
+        self.assertEqual(produits.sum('prixUnitaire'), 249.95)
+        self.assertEqual(list(produits.columns['id']), ['TAB1'])
+        self.assertEqual(produits[0].nom, 'Table')
+
+
+    #
+    # cette fonction vérifie que le code peut être généré et chargé
+    # en mémoire, sans qu'aucun fichier ne soit écrit
+    #
+    def test_generation_en_memoire(self):
+        # le répertoire n'existe pas: il ne sert qu'à calculer le package
+        code_output_directory = tempfile.mkdtemp() + "/src/generated_memory"
+        loader = json_loader(code_output_directory)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+
+        for js_class in iter(loader.classes.values()):
+            js_class.generate_code_in_memory()
+            self.assertIsNone(js_class.generated_class_file_name)
+            self.assertIsNotNone(js_class.load_code())
+            self.assertEqual("generated_memory." + js_class.name, js_class.type.__module__)
+        self.assertFalse(os.path.exists(code_output_directory))
+
+        top_object = top_class.create_object(loader.jsobjet)
+        self.assertEqual(len(top_object.liste_clients[1].liste_commandes), 2)
+
+        # l'export sur disque reste possible, pour déboguer
+        os.makedirs(code_output_directory)
+        top_class.export_code(code_output_directory)
+        with open(code_output_directory + "/boutique.py") as python_file:
+            self.assertEqual(python_file.read(), top_class.generated_source)
+
+
+    #
+    # cette fonction vérifie que le cache de schémas réutilise le code des
+    # classes inchangées, et ne régénère que les classes modifiées
+    #
+    def test_cache_de_schemas(self):
+        cache_directory = tempfile.mkdtemp()
+        code_output_directory = tempfile.mkdtemp() + "/src/generated_cache"
+
+        # 1. premier chargement: toutes les classes sont générées
+        loader = json_loader(code_output_directory)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        loader.build_class('boutique', loader.jsobjet)
+        schema_cache = SchemaCache(cache_directory)
+        for js_class in iter(loader.classes.values()):
+            js_class.generate_code_cached(schema_cache)
+            js_class.load_code()
+        self.assertEqual(schema_cache.get_statistics(), {"hits": 0, "misses": 5})
+
+        # 2. deuxième chargement, avec un nouveau champ dans ligne_commande
+        loader = json_loader(code_output_directory)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        loader.jsobjet['liste_clients'][0]['liste_commandes'][0]['table_ligne_commandes']['TAB1']['remise'] = 0.1
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        schema_cache = SchemaCache(cache_directory)
+        for js_class in iter(loader.classes.values()):
+            js_class.generate_code_cached(schema_cache)
+            js_class.load_code()
+        self.assertEqual(schema_cache.get_statistics(), {"hits": 4, "misses": 1})
+
+        # les classes inchangées utilisent bien la nouvelle version de ligne_commande
+        top_object = top_class.create_object(loader.jsobjet)
+        self.assertEqual(top_object.liste_clients[0].liste_commandes[0].table_ligne_commandes['TAB1'].remise, 0.1)
+
+
+    #
+    # cette fonction vérifie que to_json et write_json produisent le même
+    # document que celui qui a servi à créer les objets
+    #
+    def test_serialisation_json(self):
+        self.js_loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = self.js_loader.build_class('boutique', self.js_loader.jsobjet)
+        for js_class in iter(self.js_loader.classes.values()):
+            js_class.generate_code(self.code_output_directory)
+            js_class.load_code()
+        top_object = top_class.create_object(self.js_loader.jsobjet)
+
+        # 1. to_json reconstruit les dictionnaires lus
+        self.assertEqual(top_object.to_json(), self.js_loader.jsobjet)
+
+        # 2. write_json écrit le même texte que json.dumps, par morceaux
+        stream = StringIO()
+        top_object.write_json(stream)
+        self.assertEqual(stream.getvalue(), json.dumps(self.js_loader.jsobjet))
+
+        # 3. les valeurs manquantes sont écrites comme null
+        commande = self.js_loader.classes['commande'].type.from_json({})
+        stream = StringIO()
+        commande.write_json(stream)
+        self.assertEqual(json.loads(stream.getvalue()), {"id": None, "table_ligne_commandes": {}})
+
+        # 4. une valeur qui n'est pas du type inféré (ou non finie) est écrite comme par json.dumps
+        top_object.liste_produits[0].prixUnitaire = float("nan")
+        top_object.liste_produits[1].prixUnitaire = float("inf")
+        top_object.liste_produits[2].nom = 5
+        top_object.liste_clients[0].liste_commandes[0].table_ligne_commandes['CHA1'].quantite = True
+        stream = StringIO()
+        top_object.write_json(stream)
+        self.assertEqual(stream.getvalue(), json.dumps(top_object.to_json()))
+        self.assertEqual(json.loads(stream.getvalue())["liste_produits"][2]["nom"], 5)
+
+
+    #
+    # cette fonction vérifie l'affichage des objets, complet ou tronqué
+    #
+    def test_affichage_objets(self):
+        self.js_loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = self.js_loader.build_class('boutique', self.js_loader.jsobjet)
+        for js_class in iter(self.js_loader.classes.values()):
+            js_class.generate_code(self.code_output_directory)
+            js_class.load_code()
+        top_object = top_class.create_object(self.js_loader.jsobjet)
+        client = top_object.liste_clients[1]
+
+        self.assertEqual(client.__str__(), "client[id = CL2, nom = Sauvé, prenom = Martin, adresse = Montréal, liste_commandes = ["
+                         "commande[id = COM3, table_ligne_commandes = [CHA1 -> ligne_commande[id_produit = CHA1, quantite = 4]]], "
+                         "commande[id = COM4, table_ligne_commandes = [TAB1 -> ligne_commande[id_produit = TAB1, quantite = 1], "
+                         "LAM1 -> ligne_commande[id_produit = LAM1, quantite = 1]]]]]")
+
+        # troncature en profondeur et en nombre d'objets par relation
+        self.assertEqual(client.to_string(max_depth=1), "client[id = CL2, nom = Sauvé, prenom = Martin, adresse = Montréal, "
+                         "liste_commandes = [commande[id = COM3, table_ligne_commandes = [...]], commande[id = COM4, table_ligne_commandes = [...]]]]")
+        self.assertEqual(top_object.to_string(max_depth=1, max_items=1), "boutique[nom = MGL7460 Bazaar, "
+                         "liste_produits = [produit[id = CH1, nom = chaise, description = Une chaise longue, prixUnitaire = 129.95], ... (+2)], "
+                         "liste_clients = [client[id = CL1, nom = Tremblay, prenom = Sylvie, adresse = Saguenay, liste_commandes = [...]], ... (+1)]]")
+        self.assertEqual(client.to_string(max_items=0), "client[id = CL2, nom = Sauvé, prenom = Martin, adresse = Montréal, liste_commandes = [... (+2)]]")
+
+        # écriture dans un flux
+        stream = StringIO()
+        top_object.write_to(stream)
+        self.assertEqual(stream.getvalue(), top_object.__str__())
+
+
+    #
+    # cette fonction vérifie que, en mode paresseux, les objets liés ne sont
+    # créés qu'au premier accès à leur relation
+    #
+    def test_chargement_paresseux(self):
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_lazy", use_slots=True, lazy=True)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        for js_class in iter(loader.classes.values()):
+            js_class.generate_code_in_memory()
+            js_class.load_code()
+
+        top_object = top_class.create_object(loader.jsobjet)
+        self.assertIsNotNone(top_object._raw_liste_clients)
+        self.assertEqual(top_object._liste_clients, [])
+
+        # le premier accès crée les clients, mais pas leurs commandes
+        sylvie = next(top_object.get_liste_clients())
+        self.assertIsNone(top_object._raw_liste_clients)
+        self.assertEqual(len(top_object.liste_clients), 2)
+        self.assertIsNotNone(sylvie._raw_liste_commandes)
+        martin = top_object.liste_clients[1]
+        self.assertIsNotNone(martin._raw_liste_commandes)
+
+        # les accesseurs indexés et l'affichage matérialisent aussi
+        commande_1 = sylvie.liste_commandes[0]
+        self.assertEqual(commande_1.get_ligne_commande_with_id_produit('TAB1').quantite, 1)
+        self.assertIn("COM4", martin.__str__())
+        self.assertIsNone(martin._raw_liste_commandes)
+
+
+    #
+    # cette fonction vérifie que la création parallèle des objets donne
+    # le même graphe, dans le même ordre, que la création séquentielle
+    #
+    def test_creation_parallele(self):
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_parallel")
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        for js_class in iter(loader.classes.values()):
+            js_class.generate_code_in_memory()
+            js_class.load_code()
+
+        top_object = loader.create_object_parallel(top_class, loader.jsobjet, workers=2, chunk_size=1)
+
+        self.assertIsInstance(top_object, top_class.type)
+        self.assertEqual(top_object.nom, "MGL7460 Bazaar")
+        self.assertEqual([produit.id for produit in top_object.liste_produits], ['CH1', 'TAB1', 'LAM1'])
+        self.assertEqual(top_object.to_json(), top_class.create_object(loader.jsobjet).to_json())
+
+        # une table absente du fragment racine est vide, comme avec from_json
+        commande = loader.create_object_parallel(loader.classes['commande'], {"id": "COM9"}, workers=2)
+        self.assertEqual(commande.to_json(), {"id": "COM9", "table_ligne_commandes": {}})
+
+
+    #
+    # cette fonction vérifie le chargement concurrent de plusieurs fichiers:
+    # les classes sont inférées sur l'ensemble des fichiers, puis générées
+    # une seule fois, et un objet est produit par fichier
+    #
+    def test_chargement_de_plusieurs_documents(self):
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_batch")
+        file_names = [self.input_data_file_name, "boutique2.json"]
+
+        async def load_all():
+            return {file_name: top_object async for file_name, top_object
+                    in loader.load_documents(self.data_directory, file_names, "boutique", max_concurrency=1, in_memory=True)}
+
+        top_objects = asyncio.run(load_all())
+
+        self.assertEqual(set(top_objects), set(file_names))
+        self.assertEqual(top_objects[self.input_data_file_name].nom, "MGL7460 Bazaar")
+        self.assertEqual(top_objects["boutique2.json"].nom, "Boutique XYZ")
+        self.assertIs(type(top_objects["boutique2.json"]), loader.classes['boutique'].type)
+        # 'adresse' n'apparaît que dans le second fichier
+        self.assertIn('adresse', loader.classes['boutique'].attributes)
+
+
+    #
+    # cette fonction vérifie que les classes de même structure, rencontrées
+    # sous des clés différentes, partagent une seule classe générée
+    #
+    def test_internement_des_classes(self):
+        document = {"nom": "Bazaar",
+                    "livraison": {"rue": "Sherbrooke", "ville": "Montréal"},
+                    "facturation": {"rue": "Racine", "ville": "Chicoutimi"},
+                    "liste_clients": [{"nom": "Tremblay", "adresse": {"rue": "Jean-Talon", "ville": "Québec"}}]}
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_intern", intern=True)
+        top_class = loader.build_class('boutique', document)
+
+        self.assertEqual(list(loader.classes), ['livraison', 'client', 'boutique'])
+        self.assertEqual(loader.aliases, {'facturation': 'livraison', 'adresse': 'livraison'})
+        self.assertEqual(top_class.relationships['facturation'].destination_entity, 'livraison')
+        self.assertIs(loader.get_class('adresse'), loader.classes['livraison'])
+
+        for js_class in iter(loader.classes.values()):
+            js_class.generate_code_in_memory()
+            js_class.load_code()
+        top_object = top_class.create_object(document)
+        self.assertIs(type(top_object.facturation), type(top_object.livraison))
+        self.assertIs(type(top_object.liste_clients[0].adresse), type(top_object.livraison))
+        self.assertEqual(top_object.to_json(), document)
+
+        # la forme est recalculée seulement après une modification de la classe
+        shape = top_class.shape()
+        self.assertIs(top_class.shape(), shape)
+        top_class.merge_attribute('telephone', 'str')
+        self.assertNotEqual(top_class.shape(), shape)
+
+
+    #
+    # cette fonction vérifie les index secondaires d'une relation "liste_":
+    # ils sont remplis par from_json, et tenus à jour par add_ et remove_
+    #
+    def test_index_secondaires(self):
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_index", use_slots=True)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        top_class.add_index('client', 'id', unique=True)
+        top_class.add_index('client', 'adresse')
+        with self.assertRaises(ValueError):
+            top_class.add_index('client', 'telephone')
+        for js_class in iter(loader.classes.values()):
+            js_class.generate_code_in_memory()
+            js_class.load_code()
+
+        top_object = top_class.create_object(loader.jsobjet)
+        client = top_object.find_client_by_id('CL2')
+        self.assertEqual(client.nom, top_object.liste_clients[1].nom)
+        self.assertIsNone(top_object.find_client_by_id('CL9'))
+        self.assertEqual(top_object.find_client_by_adresse('Saguenay'), [top_object.liste_clients[0]])
+
+        top_object.remove_client(client)
+        self.assertIsNone(top_object.find_client_by_id('CL2'))
+        self.assertEqual(top_object.find_client_by_adresse('Montréal'), [])
+        top_object.add_client(client)
+        self.assertIs(top_object.find_client_by_id('CL2'), client)
+        top_object.add_client(client)
+        self.assertEqual([client.id for client in top_object.liste_clients], ['CL1', 'CL2'])
+        self.assertEqual(top_object.find_client_by_adresse('Montréal'), [client])
+        # l'index unique refuse un second client 'CL2'
+        with self.assertRaises(ValueError):
+            top_object.add_client(client.__class__.from_json({"id": "CL2", "nom": "Autre"}))
+
+
+    #
+    # cette fonction vérifie une relation "liste_" conservée dans un
+    # IdentitySet: l'ordre d'insertion est préservé, et le retrait se
+    # fait par identité
+    #
+    def test_relations_en_identity_set(self):
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_identity")
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        top_class.use_identity_set('client')
+        with self.assertRaises(ValueError):
+            loader.classes['commande'].use_identity_set('ligne_commande')
+        for js_class in iter(loader.classes.values()):
+            js_class.generate_code_in_memory()
+            js_class.load_code()
+
+        top_object = top_class.create_object(loader.jsobjet)
+        self.assertIsInstance(top_object.liste_clients, IdentitySet)
+        self.assertEqual(top_object.to_json(), loader.jsobjet)
+        first, second = top_object.liste_clients
+        self.assertEqual(list(top_object.get_liste_clients()), [first, second])
+
+        top_object.remove_client(first)
+        self.assertNotIn(first, top_object.liste_clients)
+        top_object.add_client(first)
+        top_object.add_client(first)
+        self.assertEqual(list(top_object.get_liste_clients()), [second, first])
+        self.assertIs(top_object.liste_clients[-1], first)
+        # une copie a de nouveaux identifiants: l'IdentitySet est reconstruit
+        copied = copy.deepcopy(top_object)
+        self.assertIn(copied.liste_clients[0], copied.liste_clients)
+
+        # un élément ajouté de nouveau n'est pas en double dans un index secondaire
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_identity_index")
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        top_class.use_identity_set('client')
+        top_class.add_index('client', 'adresse')
+        loader.load_classes(in_memory=True)
+        top_object = loader.create_object(top_class)
+        client = top_object.liste_clients[0]
+        top_object.add_client(client)
+        self.assertEqual(top_object.find_client_by_adresse('Saguenay'), [client])
+        top_object.remove_client(client)
+        self.assertEqual(top_object.find_client_by_adresse('Saguenay'), [])
+
+
+    #
+    # cette fonction vérifie que les documents générés pour les bancs
+    # d'essai donnent des relations indexées ou non, selon 'relations'
+    #
+    def test_generation_de_documents(self):
+        for relations, indexed in (("table", True), ("liste", False)):
+            document = generate_boutique(3, 2, 2, nb_produits=5, relations=relations)
+            loader = json_loader(tempfile.mkdtemp() + "/src/generated_documents_" + relations)
+            top_class = loader.build_class('boutique', document)
+            self.assertEqual(top_class.relationships['client'].is_indexed(), indexed)
+            self.assertEqual(loader.classes['commande'].relationships['ligne_commande'].is_indexed(), indexed)
+            self.assertEqual(len(document[top_class.relationships['client'].json_key()]), 3)
+        with self.assertRaises(ValueError):
+            generate_boutique(1, 1, 1, relations="arbre")
+
+
+    #
+    # cette fonction vérifie que le loader n'écrit rien par défaut, et que
+    # ses mesures (phases et compteurs) sont transmises à ses crochets
+    #
+    def test_mesures_du_loader(self):
+        output = StringIO()
+        metrics = loader_metrics()
+        events = []
+        with redirect_stdout(output):
+            loader = json_loader(tempfile.mkdtemp() + "/src/generated_metrics")
+            loader.add_hook(metrics)
+            loader.add_hook(lambda kind, name, value: events.append((kind, name)))
+            loader.read_data(self.data_directory, self.input_data_file_name)
+            top_class = loader.build_class('boutique', loader.jsobjet)
+            loader.load_classes(in_memory=True)
+            loader.create_object(top_class)
+        self.assertEqual(output.getvalue(), "")
+
+        self.assertEqual(set(metrics.phases), {"parse", "build_class", "generate_code", "load_code", "create_object"})
+        self.assertEqual(metrics.counters["bytes_parsed"], os.path.getsize(self.data_directory + "/" + self.input_data_file_name))
+        self.assertEqual(metrics.counters["classes_inferred"], 5)
+        self.assertEqual(metrics.counters["objects_created.commande"], 4)
+        self.assertEqual(metrics.counters["objects_created.ligne_commande"], 6)
+        self.assertIn(("phase", "parse"), events)
+
+
+    #
+    # cette fonction vérifie que tous les analyseurs json installés, avec ou
+    # sans projection en mémoire, lisent le même document
+    #
+    def test_analyseurs_json(self):
+        file_name = self.data_directory + "/" + self.input_data_file_name
+        with open(file_name, 'r') as json_file:
+            expected = json.load(json_file)
+        self.assertEqual(json_parser().backend, "stdlib")
+        for backend in json_parser.available_backends() + ["auto"]:
+            for use_mmap in (False, True):
+                self.assertEqual(json_parser(backend, use_mmap).parse_file(file_name), expected)
+        with self.assertRaises(ValueError):
+            json_parser("yaml")
+
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_parser", parser=json_parser("auto", use_mmap=True))
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        self.assertEqual(loader.jsobjet, expected)
+
+
+    #
+    # cette fonction vérifie qu'un graphe d'objets relu d'un snapshot est
+    # identique à l'original, et qu'un snapshot écrit avec un autre schéma
+    # (ou qui n'est pas un snapshot) est rejeté
+    #
+    def test_snapshots(self):
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_snapshot", use_slots=True)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        loader.load_classes(in_memory=True)
+        snapshot_file_name = tempfile.mkdtemp() + "/boutique.snapshot"
+        loader.write_snapshot(snapshot_file_name, loader.create_object(top_class))
+
+        top_object = loader.read_snapshot(snapshot_file_name)
+        self.assertIsInstance(top_object, top_class.type)
+        self.assertEqual(top_object.to_json(), loader.jsobjet)
+        self.assertEqual(Snapshot(snapshot_file_name).read().to_json(), loader.jsobjet)
+        # le code enregistré dans le snapshot n'est exécuté que sur demande
+        for json_class in loader.classes.values():
+            InMemoryImporter.get_instance().remove_module(json_class.fully_qualified_name())
+        with self.assertRaises(ValueError):
+            Snapshot(snapshot_file_name).read()
+        self.assertEqual(Snapshot(snapshot_file_name).read(register_sources=True).to_json(), loader.jsobjet)
+
+        loader.classes['client'].merge_attribute('telephone', 'str')
+        with self.assertRaises(ValueError):
+            loader.read_snapshot(snapshot_file_name)
+        # sans les classes, le module importé est comparé au code enregistré
+        loader.classes['client'].generate_code_in_memory()
+        with self.assertRaises(ValueError):
+            Snapshot(snapshot_file_name).read()
+        with self.assertRaises(ValueError):
+            Snapshot(self.data_directory + "/" + self.input_data_file_name).read()
+
+
+    #
+    # cette fonction vérifie que les prédicats (par classe, ou par chemin de
+    # relations) sont évalués pendant la construction: les objets dont le
+    # fragment ne les satisfait pas ne sont jamais créés
+    #
+    def test_predicats_pendant_le_chargement(self):
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_predicates")
+        metrics = loader_metrics()
+        loader.add_hook(metrics)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        loader.load_classes(in_memory=True)
+
+        top_object = loader.create_object_filtered(top_class, {
+            "produit": lambda fragment: fragment["prixUnitaire"] > 100,
+            "client.commande": lambda fragment: fragment["id"] in ("COM1", "COM4")})
+
+        self.assertEqual([produit.id for produit in top_object.liste_produits], ['CH1', 'TAB1'])
+        self.assertEqual([commande.id for client in top_object.liste_clients for commande in client.liste_commandes], ['COM1', 'COM4'])
+        # les lignes des commandes écartées n'ont pas été créées
+        self.assertEqual(metrics.counters["objects_created.ligne_commande"], 4)
+        self.assertEqual(metrics.counters["objects_created.produit"], 2)
+        self.assertIsNone(loader.create_object_filtered(top_class, {"boutique": lambda fragment: False}))
+        # un nom inconnu (classe, ou chemin de relations) est refusé
+        for name in ("client.commandes", "fournisseur", "client.commande.produit"):
+            with self.assertRaises(ValueError):
+                loader.create_object_filtered(top_class, {name: lambda fragment: True})
+        # un nom qui n'est pas une classe désigne une relation de la classe racine
+        fragment = {"liste_auteurs": [{"nom": "A"}, {"nom": "B"}], "liste_editeurs": [{"nom": "A"}, {"nom": "B"}]}
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_predicates_path", intern=True)
+        top_class = loader.build_class('maison', fragment)
+        loader.load_classes(in_memory=True)
+        top_object = loader.create_object_filtered(top_class, {"editeur": lambda fragment: fragment["nom"] == "A"}, fragment)
+        self.assertEqual(top_object.to_json(), {"liste_auteurs": [{"nom": "A"}, {"nom": "B"}], "liste_editeurs": [{"nom": "A"}]})
+
+
+    #
+    # cette fonction vérifie qu'une projection réduit les classes générées
+    # aux attributs et relations du masque, et que seuls ces champs sont
+    # chargés
+    #
+    def test_projection(self):
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_projection", use_slots=True)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        with self.assertRaises(ValueError):
+            loader.project(top_class, {"client": {"telephone": True}})
+        with self.assertRaises(ValueError):
+            loader.project(top_class, {"client": {"id": 1}})
+        with self.assertRaises(ValueError):
+            loader.project(top_class, {"client": {"id": {"nom": True}}})
+        # un membre à False est exclu
+        loader.project(top_class, {"nom": False, "produit": False, "client": {"id": True, "nom": True, "prenom": False, "commande": {"id": True}}})
+        loader.load_classes(in_memory=True)
+
+        self.assertEqual(list(loader.classes), ['commande', 'client', 'boutique'])
+        self.assertEqual(list(loader.classes['client'].attributes), ['id', 'nom'])
+        top_object = loader.create_object(top_class)
+        self.assertEqual(top_object.to_json(), {"liste_clients": [
+            {"id": "CL1", "nom": "Tremblay", "liste_commandes": [{"id": "COM1"}, {"id": "COM2"}]},
+            {"id": "CL2", "nom": "Sauvé", "liste_commandes": [{"id": "COM3"}, {"id": "COM4"}]}]})
+        self.assertFalse(hasattr(top_object.liste_clients[0], "prenom"))
+
+        # le champ d'indexation d'une relation conservée est toujours conservé
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_projection_index")
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        loader.project(top_class, {"client": {"commande": {"ligne_commande": {"quantite": True}}}})
+        self.assertEqual(list(loader.classes['ligne_commande'].attributes), ['id_produit', 'quantite'])
+
+        # une classe récursive, avec plusieurs relations, est conservée en entier
+        fragment = {"liste_categories": [{"nom": "Meubles", "liste_categories": [{"nom": "Chaises", "liste_categories": [], "liste_produits": []}],
+                                          "liste_produits": [{"id": "CH1"}]}]}
+        for mask in (True, {"categorie": True}):
+            loader = json_loader(tempfile.mkdtemp() + "/src/generated_projection_recursive")
+            top_class = loader.build_class('catalogue', fragment)
+            loader.project(top_class, mask)
+            self.assertEqual(list(loader.classes['categorie'].relationships), ['categorie', 'produit'])
+            loader.load_classes(in_memory=True)
+            self.assertEqual(loader.create_object(top_class, fragment).to_json(), fragment)
+
+
+    #
+    # cette fonction vérifie qu'un JSON Patch, et un merge patch, modifient
+    # le graphe d'objets chargé en passant par les accesseurs indexés et les
+    # méthodes add_ et remove_ générées
+    #
+    def test_application_de_patchs(self):
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_patch")
+        metrics = loader_metrics()
+        loader.add_hook(metrics)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        top_class.add_index("produit", "id", unique=True)
+        loader.load_classes(in_memory=True)
+        top_object = loader.create_object(top_class)
+
+        loader.apply_patch(top_class, top_object, [
+            {"op": "add", "path": "/liste_clients/id=CL1/liste_commandes/-",
+             "value": {"id": "COM5", "table_ligne_commandes": {"CH1": {"id_produit": "CH1", "quantite": 2}}}},
+            {"op": "remove", "path": "/liste_clients/0/liste_commandes/0/table_ligne_commandes/TAB1"},
+            {"op": "replace", "path": "/liste_clients/1/nom", "value": "Roy"},
+            {"op": "replace", "path": "/liste_produits/2/id", "value": "LAM2"},
+            {"op": "test", "path": "/liste_produits/2/nom", "value": "Lampe"}])
+
+        client = top_object.liste_clients[0]
+        self.assertEqual([commande.id for commande in client.liste_commandes], ['COM1', 'COM2', 'COM5'])
+        self.assertEqual(list(client.liste_commandes[0].table_ligne_commandes), ['CHA1'])
+        self.assertEqual(top_object.liste_clients[1].nom, "Roy")
+        # l'index secondaire suit la nouvelle valeur, et la position est conservée
+        self.assertIs(top_object.find_produit_by_id("LAM2"), top_object.liste_produits[2])
+        self.assertIsNone(top_object.find_produit_by_id("LAM1"))
+        self.assertEqual(metrics.counters["patch_operations"], 5)
+        with self.assertRaises(ValueError):
+            loader.apply_patch(top_class, top_object, [{"op": "test", "path": "/nom", "value": "Autre"}])
+        with self.assertRaises(ValueError):
+            loader.apply_patch(top_class, top_object, [{"op": "remove", "path": "/liste_clients/0/liste_commandes/0/table_ligne_commandes/XYZ"}])
+        # un remplacement qui échoue laisse le graphe intact
+        with self.assertRaises(ValueError):
+            loader.apply_patch(top_class, top_object, [{"op": "replace", "path": "/liste_clients/0", "value": 5}])
+        self.assertEqual([client.id for client in top_object.liste_clients], ['CL1', 'CL2'])
+        # un élément désigné par un sélecteur est remplacé à sa position
+        loader.apply_patch(top_class, top_object, [
+            {"op": "replace", "path": "/liste_clients/id=CL1", "value": dict(client.to_json(), nom="Gagnon")}])
+        self.assertEqual([(client.id, client.nom) for client in top_object.liste_clients], [('CL1', 'Gagnon'), ('CL2', 'Roy')])
+        client = top_object.liste_clients[0]
+
+        loader.apply_merge_patch(top_class, top_object, {"nom": "Bazaar", "liste_clients": [{"id": "CL3", "liste_commandes": []}]})
+        self.assertEqual(top_object.nom, "Bazaar")
+        self.assertEqual([client.id for client in top_object.liste_clients], ['CL3'])
+        loader.apply_merge_patch(top_class, top_object, {"liste_clients": None})
+        self.assertEqual(top_object.liste_clients, [])
+        # les éléments d'une table sont fusionnés un par un
+        commande = client.liste_commandes[1]
+        json_patch(loader.classes['commande']).apply_merge(commande, {"table_ligne_commandes": {"LAM1": {"quantite": 4}, "CH1": {}}})
+        self.assertEqual(commande.to_json(), {"id": "COM2", "table_ligne_commandes": {
+            "LAM1": {"id_produit": "LAM1", "quantite": 4}, "CH1": {"id_produit": "CH1", "quantite": None}}})
+
+
+    #
+    # cette fonction vérifie que le mode surveillance ne régénère, et ne
+    # recharge, que les classes dont le schéma a changé (et celles qui y
+    # font référence)
+    #
+    def test_mode_surveillance(self):
+        data_directory = tempfile.mkdtemp()
+        with open(self.data_directory + "/" + self.input_data_file_name, 'r') as json_file:
+            data = json.load(json_file)
+        with open(data_directory + "/boutique.json", 'w') as json_file:
+            json.dump(data, json_file)
+        watcher = json_watcher(data_directory, "boutique.json", tempfile.mkdtemp() + "/src/generated_watch", in_memory=True)
+        watcher.refresh()
+        self.assertEqual(set(watcher.reload_times), {'produit', 'ligne_commande', 'commande', 'client', 'boutique'})
+        self.assertFalse(watcher.has_changed())
+        produit = watcher.loader.classes['produit'].type
+
+        data["liste_clients"][0]["telephone"] = "514-555-0199"
+        with open(data_directory + "/boutique.json", 'w') as json_file:
+            json.dump(data, json_file)
+        top_object = watcher.watch(interval=0, max_changes=1)
+
+        self.assertEqual(list(watcher.reload_times), ['client', 'boutique'])
+        self.assertIs(watcher.loader.classes['produit'].type, produit)
+        self.assertIs(type(top_object.liste_produits[0]), produit)
+        self.assertEqual(top_object.liste_clients[0].telephone, "514-555-0199")
+        self.assertIsNone(top_object.liste_clients[1].telephone)
+
+        # un fichier qui disparaît pendant un chargement raté est rechargé quand il revient
+        def failing_refresh():
+            watcher.refresh = refresh
+            os.remove(data_directory + "/boutique.json")
+            raise ValueError("fichier en cours d'écriture")
+
+        def restore_file(interval):
+            if not os.path.exists(data_directory + "/boutique.json"):
+                with open(data_directory + "/boutique.json", 'w') as json_file:
+                    json.dump(data, json_file)
+
+        refresh = watcher.refresh
+        watcher.refresh = failing_refresh
+        data["nom"] = "Bazaar"
+        with open(data_directory + "/boutique.json", 'w') as json_file:
+            json.dump(data, json_file)
+        with mock.patch("ca.uqam.info.mgl7460.json_watcher.time.sleep", side_effect=restore_file):
+            top_object = watcher.watch(interval=0, max_changes=1)
+        self.assertEqual(top_object.nom, "Bazaar")
+
+
+    #
+    # cette fonction vérifie que la validation pendant la construction
+    # accepte les données conformes aux types inférés, et rapporte toutes
+    # les erreurs des autres, avec leurs chemins
+    #
+    def test_validation_pendant_la_construction(self):
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_validation")
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        loader.load_classes(in_memory=True)
+        self.assertEqual(loader.create_object_validated(top_class).to_json(), loader.create_object(top_class).to_json())
+
+        json_fragment = copy.deepcopy(loader.jsobjet)
+        json_fragment["liste_produits"][0]["prixUnitaire"] = "cher"
+        json_fragment["liste_produits"][1]["prixUnitaire"] = 250
+        del json_fragment["liste_clients"][0]["nom"]
+        json_fragment["liste_clients"][1]["liste_commandes"][0]["table_ligne_commandes"]["CHA1"]["quantite"] = True
+        json_fragment["liste_clients"][1]["liste_commandes"].append("COM5")
+        with self.assertRaises(ValidationError) as context:
+            loader.create_object_validated(top_class, json_fragment)
+        self.assertEqual([path for path, message in context.exception.errors], [
+            "/liste_produits/0/prixUnitaire",
+            "/liste_clients/0/nom",
+            "/liste_clients/1/liste_commandes/0/table_ligne_commandes/CHA1/quantite",
+            "/liste_clients/1/liste_commandes/2"])
+        self.assertEqual(context.exception.errors[1][1], "membre manquant")
+
+
+    #
+    # cette fonction vérifie que les valeurs des attributs internés sont
+    # partagées par les objets, que la table d'internement est bornée, et
+    # que la mémoire économisée est rapportée par classe
+    #
+    def test_internement_des_valeurs(self):
+        loader = json_loader(tempfile.mkdtemp() + "/src/generated_interning")
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class('boutique', loader.jsobjet)
+        loader.intern_values({"ligne_commande": ["id_produit"]})
+        with self.assertRaises(ValueError):
+            loader.intern_values({"ligne_commande": ["quantite"]})
+        loader.load_classes(in_memory=True)
+        top_object = loader.create_object(top_class)
+
+        lignes = [ligne for client in top_object.liste_clients for commande in client.liste_commandes
+                  for ligne in commande.table_ligne_commandes.values()]
+        self.assertEqual([ligne.id_produit for ligne in lignes], ['CHA1', 'TAB1', 'LAM1', 'CHA1', 'TAB1', 'LAM1'])
+        self.assertIs(lignes[0].id_produit, lignes[3].id_produit)
+        report = loader.interning_report()
+        self.assertEqual(list(report), ['ligne_commande'])
+        self.assertEqual(report['ligne_commande']['attributes']['id_produit']['hits'], 3)
+        self.assertEqual(report['ligne_commande']['bytes_saved'], 3 * sys.getsizeof('CHA1'))
+
+        # au-delà de max_size valeurs, la plus ancienne est évincée
+        interner = ValueInterner("test", "id_produit", max_size=2)
+        for value in ('CHA1', 'TAB1', 'LAM1'):
+            interner.intern(value)
+        self.assertEqual(list(interner.table), ['TAB1', 'LAM1'])
+        self.assertEqual(interner.get_statistics()["evictions"], 1)
+
+
+    #
+    # cette fonction vérifie que des classes qui se font référence l'une à
+    # l'autre (auteur <-> livre) sont générées et chargées: leurs modules ne
+    # s'importent pas, et leurs fabriques sont liées au premier appel
+    #
+    def test_relations_mutuelles(self):
+        fragment = {"liste_auteurs": [
+            {"nom": "Hébert", "liste_livres": [{"titre": "Kamouraska", "liste_auteurs": [{"nom": "Tremblay", "liste_livres": []}]}]}]}
+        source_directory = tempfile.mkdtemp() + "/src"
+        code_output_directory = source_directory + "/generated_mutual"
+        os.makedirs(code_output_directory)
+        sys.path.insert(0, source_directory)
+        for in_memory in (False, True):
+            loader = json_loader(code_output_directory if not in_memory else tempfile.mkdtemp() + "/src/generated_mutual_memory")
+            top_class = loader.build_class('bibliotheque', fragment)
+            self.assertEqual(list(loader.classes), ['auteur', 'livre', 'bibliotheque'])
+            self.assertEqual(loader.classes['auteur'].deferred_class_names, {'livre'})
+            self.assertEqual(loader.classes['livre'].deferred_class_names, {'auteur'})
+            self.assertEqual(loader.classes['bibliotheque'].deferred_class_names, set())
+            loader.load_classes(in_memory=in_memory)
+            top_object = loader.create_object(top_class, fragment)
+            self.assertEqual(top_object.to_json(), fragment)
+            livre = top_object.liste_auteurs[0].liste_livres[0]
+            self.assertIsInstance(livre, loader.classes['livre'].type)
+            self.assertIsInstance(livre.liste_auteurs[0], loader.classes['auteur'].type)
+
+
     # tear down
     def tearDown(self):
         print('Bye, bye!')
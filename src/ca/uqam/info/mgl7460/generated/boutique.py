@@ -1,3 +1,9 @@
+from json import dumps as _dumps
+from json.encoder import encode_basestring_ascii as _encode_string
+from ca.uqam.info.mgl7460.generated.produit import produit
+from ca.uqam.info.mgl7460.generated.client import client
+
+
 class boutique:
     def __init__(self, nom: str):
         self.nom = nom
@@ -25,17 +31,103 @@ class boutique:
         return iter(self.liste_clients)
 
     def __str__(self) -> str:
-        return_string = "boutique["
-        return_string += "nom = " + self.nom.__str__() + ", " 
-        relation_str_ = "liste_produits" + " = ["
-        for related in iter(self.liste_produits):
-            relation_str_ += related.__str__() + ", "
-        relation_str_ = relation_str_[:-2] + "]"
-        return_string += relation_str_ + ", "
-        relation_str_ = "liste_clients" + " = ["
-        for related in iter(self.liste_clients):
-            relation_str_ += related.__str__() + ", "
-        relation_str_ = relation_str_[:-2] + "]"
-        return_string += relation_str_ + ", "
-        return_string = return_string[:-2] + "]"
-        return return_string
+        parts = []
+        self.str_parts(parts)
+        return "".join(parts)
+
+    def to_string(self, max_depth: int = None, max_items: int = None) -> str:
+        parts = []
+        self.str_parts(parts, max_depth, max_items)
+        return "".join(parts)
+
+    def write_to(self, stream, max_depth: int = None, max_items: int = None):
+        parts = []
+        self.str_parts(parts, max_depth, max_items, stream)
+        stream.write("".join(parts))
+
+    def str_parts(self, parts: list, max_depth: int = None, max_items: int = None, stream=None):
+        append = parts.append
+        related_depth = None if max_depth is None else max_depth - 1
+        append("boutique[nom = ")
+        append(str(self.nom))
+        append(", liste_produits = [")
+        if max_depth == 0:
+            append("...")
+        else:
+            count = 0
+            for related in self.liste_produits:
+                if count:
+                    append(", ")
+                if count == max_items:
+                    append("... (+" + str(len(self.liste_produits) - count) + ")")
+                    break
+                related.str_parts(parts, related_depth, max_items, stream)
+                count += 1
+        append("]")
+        append(", liste_clients = [")
+        if max_depth == 0:
+            append("...")
+        else:
+            count = 0
+            for related in self.liste_clients:
+                if count:
+                    append(", ")
+                if count == max_items:
+                    append("... (+" + str(len(self.liste_clients) - count) + ")")
+                    break
+                related.str_parts(parts, related_depth, max_items, stream)
+                count += 1
+        append("]")
+        append("]")
+        if stream is not None and len(parts) > 8192:
+            stream.write("".join(parts))
+            parts.clear()
+
+    def to_json(self) -> dict:
+        json_fragment = {"nom": self.nom}
+        json_fragment["liste_produits"] = [related.to_json() for related in self.liste_produits]
+        json_fragment["liste_clients"] = [related.to_json() for related in self.liste_clients]
+        return json_fragment
+
+    def write_json(self, stream, parts: list = None):
+        top = parts is None
+        if top:
+            parts = []
+        append = parts.append
+        append("{")
+        append("\"nom\": ")
+        append(_encode_string(self.nom) if self.nom.__class__ is str else _dumps(self.nom))
+        append(", \"liste_produits\": [")
+        item_separator = ""
+        for related in self.liste_produits:
+            append(item_separator)
+            related.write_json(stream, parts)
+            item_separator = ", "
+        append("]")
+        append(", \"liste_clients\": [")
+        item_separator = ""
+        for related in self.liste_clients:
+            append(item_separator)
+            related.write_json(stream, parts)
+            item_separator = ", "
+        append("]")
+        append("}")
+        if top or len(parts) > 8192:
+            stream.write("".join(parts))
+            parts.clear()
+
+    @classmethod
+    def from_json(cls, json_fragment: dict):
+        get = json_fragment.get
+        new_object = cls(get("nom"))
+        add_produit = new_object.add_produit
+        for related_fragment in get("liste_produits", ()):
+            add_produit(_produit_from_json(related_fragment))
+        add_client = new_object.add_client
+        for related_fragment in get("liste_clients", ()):
+            add_client(_client_from_json(related_fragment))
+        return new_object
+
+
+_produit_from_json = produit.from_json
+_client_from_json = client.from_json
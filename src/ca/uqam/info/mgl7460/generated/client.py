@@ -1,3 +1,8 @@
+from json import dumps as _dumps
+from json.encoder import encode_basestring_ascii as _encode_string
+from ca.uqam.info.mgl7460.generated.commande import commande
+
+
 class client:
     def __init__(self, id: str, nom: str, prenom: str, adresse: str):
         self.id = id
@@ -17,15 +22,89 @@ class client:
         return iter(self.liste_commandes)
 
     def __str__(self) -> str:
-        return_string = "client["
-        return_string += "id = " + self.id.__str__() + ", " 
-        return_string += "nom = " + self.nom.__str__() + ", " 
-        return_string += "prenom = " + self.prenom.__str__() + ", " 
-        return_string += "adresse = " + self.adresse.__str__() + ", " 
-        relation_str_ = "liste_commandes" + " = ["
-        for related in iter(self.liste_commandes):
-            relation_str_ += related.__str__() + ", "
-        relation_str_ = relation_str_[:-2] + "]"
-        return_string += relation_str_ + ", "
-        return_string = return_string[:-2] + "]"
-        return return_string
+        parts = []
+        self.str_parts(parts)
+        return "".join(parts)
+
+    def to_string(self, max_depth: int = None, max_items: int = None) -> str:
+        parts = []
+        self.str_parts(parts, max_depth, max_items)
+        return "".join(parts)
+
+    def write_to(self, stream, max_depth: int = None, max_items: int = None):
+        parts = []
+        self.str_parts(parts, max_depth, max_items, stream)
+        stream.write("".join(parts))
+
+    def str_parts(self, parts: list, max_depth: int = None, max_items: int = None, stream=None):
+        append = parts.append
+        related_depth = None if max_depth is None else max_depth - 1
+        append("client[id = ")
+        append(str(self.id))
+        append(", nom = ")
+        append(str(self.nom))
+        append(", prenom = ")
+        append(str(self.prenom))
+        append(", adresse = ")
+        append(str(self.adresse))
+        append(", liste_commandes = [")
+        if max_depth == 0:
+            append("...")
+        else:
+            count = 0
+            for related in self.liste_commandes:
+                if count:
+                    append(", ")
+                if count == max_items:
+                    append("... (+" + str(len(self.liste_commandes) - count) + ")")
+                    break
+                related.str_parts(parts, related_depth, max_items, stream)
+                count += 1
+        append("]")
+        append("]")
+        if stream is not None and len(parts) > 8192:
+            stream.write("".join(parts))
+            parts.clear()
+
+    def to_json(self) -> dict:
+        json_fragment = {"id": self.id, "nom": self.nom, "prenom": self.prenom, "adresse": self.adresse}
+        json_fragment["liste_commandes"] = [related.to_json() for related in self.liste_commandes]
+        return json_fragment
+
+    def write_json(self, stream, parts: list = None):
+        top = parts is None
+        if top:
+            parts = []
+        append = parts.append
+        append("{")
+        append("\"id\": ")
+        append(_encode_string(self.id) if self.id.__class__ is str else _dumps(self.id))
+        append(", \"nom\": ")
+        append(_encode_string(self.nom) if self.nom.__class__ is str else _dumps(self.nom))
+        append(", \"prenom\": ")
+        append(_encode_string(self.prenom) if self.prenom.__class__ is str else _dumps(self.prenom))
+        append(", \"adresse\": ")
+        append(_encode_string(self.adresse) if self.adresse.__class__ is str else _dumps(self.adresse))
+        append(", \"liste_commandes\": [")
+        item_separator = ""
+        for related in self.liste_commandes:
+            append(item_separator)
+            related.write_json(stream, parts)
+            item_separator = ", "
+        append("]")
+        append("}")
+        if top or len(parts) > 8192:
+            stream.write("".join(parts))
+            parts.clear()
+
+    @classmethod
+    def from_json(cls, json_fragment: dict):
+        get = json_fragment.get
+        new_object = cls(get("id"), get("nom"), get("prenom"), get("adresse"))
+        add_commande = new_object.add_commande
+        for related_fragment in get("liste_commandes", ()):
+            add_commande(_commande_from_json(related_fragment))
+        return new_object
+
+
+_commande_from_json = commande.from_json
@@ -1,3 +1,8 @@
+from json import dumps as _dumps
+from json.encoder import encode_basestring_ascii as _encode_string
+from ca.uqam.info.mgl7460.generated.ligne_commande import ligne_commande
+
+
 class commande:
     def __init__(self, id: str):
         self.id = id
@@ -17,12 +22,81 @@ class commande:
         return self.table_ligne_commandes.get(id_produit, None)
 
     def __str__(self) -> str:
-        return_string = "commande["
-        return_string += "id = " + self.id.__str__() + ", " 
-        relation_str_ = "table_ligne_commandes" + " = ["
-        for key in iter(self.table_ligne_commandes.keys()):
-            relation_str_ += key + " -> " + self.table_ligne_commandes[key].__str__() + ", "
-        relation_str_ = relation_str_[:-2] + "]"
-        return_string += relation_str_ + ", "
-        return_string = return_string[:-2] + "]"
-        return return_string
+        parts = []
+        self.str_parts(parts)
+        return "".join(parts)
+
+    def to_string(self, max_depth: int = None, max_items: int = None) -> str:
+        parts = []
+        self.str_parts(parts, max_depth, max_items)
+        return "".join(parts)
+
+    def write_to(self, stream, max_depth: int = None, max_items: int = None):
+        parts = []
+        self.str_parts(parts, max_depth, max_items, stream)
+        stream.write("".join(parts))
+
+    def str_parts(self, parts: list, max_depth: int = None, max_items: int = None, stream=None):
+        append = parts.append
+        related_depth = None if max_depth is None else max_depth - 1
+        append("commande[id = ")
+        append(str(self.id))
+        append(", table_ligne_commandes = [")
+        if max_depth == 0:
+            append("...")
+        else:
+            count = 0
+            for key, related in self.table_ligne_commandes.items():
+                if count:
+                    append(", ")
+                if count == max_items:
+                    append("... (+" + str(len(self.table_ligne_commandes) - count) + ")")
+                    break
+                append(str(key))
+                append(" -> ")
+                related.str_parts(parts, related_depth, max_items, stream)
+                count += 1
+        append("]")
+        append("]")
+        if stream is not None and len(parts) > 8192:
+            stream.write("".join(parts))
+            parts.clear()
+
+    def to_json(self) -> dict:
+        json_fragment = {"id": self.id}
+        json_fragment["table_ligne_commandes"] = {key: related.to_json() for key, related in self.table_ligne_commandes.items()}
+        return json_fragment
+
+    def write_json(self, stream, parts: list = None):
+        top = parts is None
+        if top:
+            parts = []
+        append = parts.append
+        append("{")
+        append("\"id\": ")
+        append(_encode_string(self.id) if self.id.__class__ is str else _dumps(self.id))
+        append(", \"table_ligne_commandes\": {")
+        item_separator = ""
+        for key, related in self.table_ligne_commandes.items():
+            append(item_separator)
+            append(_encode_string(str(key)))
+            append(": ")
+            related.write_json(stream, parts)
+            item_separator = ", "
+        append("}")
+        append("}")
+        if top or len(parts) > 8192:
+            stream.write("".join(parts))
+            parts.clear()
+
+    @classmethod
+    def from_json(cls, json_fragment: dict):
+        get = json_fragment.get
+        new_object = cls(get("id"))
+        add_ligne_commande = new_object.add_ligne_commande
+        for related_fragment in get("table_ligne_commandes", {}).values():
+            add_ligne_commande(_ligne_commande_from_json(related_fragment))
+        return new_object
+
+
+_ligne_commande_from_json = ligne_commande.from_json
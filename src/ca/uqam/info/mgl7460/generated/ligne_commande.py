@@ -1,11 +1,59 @@
+from json import dumps as _dumps
+from json.encoder import encode_basestring_ascii as _encode_string
+
+
 class ligne_commande:
     def __init__(self, id_produit: str, quantite: int):
         self.id_produit = id_produit
         self.quantite = quantite
 
     def __str__(self) -> str:
-        return_string = "ligne_commande["
-        return_string += "id_produit = " + self.id_produit.__str__() + ", " 
-        return_string += "quantite = " + self.quantite.__str__() + ", " 
-        return_string = return_string[:-2] + "]"
-        return return_string
+        parts = []
+        self.str_parts(parts)
+        return "".join(parts)
+
+    def to_string(self, max_depth: int = None, max_items: int = None) -> str:
+        parts = []
+        self.str_parts(parts, max_depth, max_items)
+        return "".join(parts)
+
+    def write_to(self, stream, max_depth: int = None, max_items: int = None):
+        parts = []
+        self.str_parts(parts, max_depth, max_items, stream)
+        stream.write("".join(parts))
+
+    def str_parts(self, parts: list, max_depth: int = None, max_items: int = None, stream=None):
+        append = parts.append
+        append("ligne_commande[id_produit = ")
+        append(str(self.id_produit))
+        append(", quantite = ")
+        append(str(self.quantite))
+        append("]")
+        if stream is not None and len(parts) > 8192:
+            stream.write("".join(parts))
+            parts.clear()
+
+    def to_json(self) -> dict:
+        json_fragment = {"id_produit": self.id_produit, "quantite": self.quantite}
+        return json_fragment
+
+    def write_json(self, stream, parts: list = None):
+        top = parts is None
+        if top:
+            parts = []
+        append = parts.append
+        append("{")
+        append("\"id_produit\": ")
+        append(_encode_string(self.id_produit) if self.id_produit.__class__ is str else _dumps(self.id_produit))
+        append(", \"quantite\": ")
+        append(repr(self.quantite) if self.quantite.__class__ is int else _dumps(self.quantite))
+        append("}")
+        if top or len(parts) > 8192:
+            stream.write("".join(parts))
+            parts.clear()
+
+    @classmethod
+    def from_json(cls, json_fragment: dict):
+        get = json_fragment.get
+        new_object = cls(get("id_produit"), get("quantite"))
+        return new_object
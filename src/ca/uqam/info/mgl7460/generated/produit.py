@@ -1,3 +1,8 @@
+from json import dumps as _dumps
+from json.encoder import encode_basestring_ascii as _encode_string
+from math import isfinite as _isfinite
+
+
 class produit:
     def __init__(self, id: str, nom: str, description: str, prixUnitaire: float):
         self.id = id
@@ -6,10 +11,60 @@ class produit:
         self.prixUnitaire = prixUnitaire
 
     def __str__(self) -> str:
-        return_string = "produit["
-        return_string += "id = " + self.id.__str__() + ", " 
-        return_string += "nom = " + self.nom.__str__() + ", " 
-        return_string += "description = " + self.description.__str__() + ", " 
-        return_string += "prixUnitaire = " + self.prixUnitaire.__str__() + ", " 
-        return_string = return_string[:-2] + "]"
-        return return_string
+        parts = []
+        self.str_parts(parts)
+        return "".join(parts)
+
+    def to_string(self, max_depth: int = None, max_items: int = None) -> str:
+        parts = []
+        self.str_parts(parts, max_depth, max_items)
+        return "".join(parts)
+
+    def write_to(self, stream, max_depth: int = None, max_items: int = None):
+        parts = []
+        self.str_parts(parts, max_depth, max_items, stream)
+        stream.write("".join(parts))
+
+    def str_parts(self, parts: list, max_depth: int = None, max_items: int = None, stream=None):
+        append = parts.append
+        append("produit[id = ")
+        append(str(self.id))
+        append(", nom = ")
+        append(str(self.nom))
+        append(", description = ")
+        append(str(self.description))
+        append(", prixUnitaire = ")
+        append(str(self.prixUnitaire))
+        append("]")
+        if stream is not None and len(parts) > 8192:
+            stream.write("".join(parts))
+            parts.clear()
+
+    def to_json(self) -> dict:
+        json_fragment = {"id": self.id, "nom": self.nom, "description": self.description, "prixUnitaire": self.prixUnitaire}
+        return json_fragment
+
+    def write_json(self, stream, parts: list = None):
+        top = parts is None
+        if top:
+            parts = []
+        append = parts.append
+        append("{")
+        append("\"id\": ")
+        append(_encode_string(self.id) if self.id.__class__ is str else _dumps(self.id))
+        append(", \"nom\": ")
+        append(_encode_string(self.nom) if self.nom.__class__ is str else _dumps(self.nom))
+        append(", \"description\": ")
+        append(_encode_string(self.description) if self.description.__class__ is str else _dumps(self.description))
+        append(", \"prixUnitaire\": ")
+        append(repr(self.prixUnitaire) if self.prixUnitaire.__class__ is float and _isfinite(self.prixUnitaire) else _dumps(self.prixUnitaire))
+        append("}")
+        if top or len(parts) > 8192:
+            stream.write("".join(parts))
+            parts.clear()
+
+    @classmethod
+    def from_json(cls, json_fragment: dict):
+        get = json_fragment.get
+        new_object = cls(get("id"), get("nom"), get("description"), get("prixUnitaire"))
+        return new_object
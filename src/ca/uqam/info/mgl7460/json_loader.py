@@ -1,6 +1,29 @@
-import json
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from ca.uqam.info.mgl7460 import parallel_worker
+from ca.uqam.info.mgl7460.json_parser import json_parser
+from ca.uqam.info.mgl7460.json_patch import json_patch
+from ca.uqam.info.mgl7460.json_stream import json_stream_reader
+from ca.uqam.info.mgl7460.loader_metrics import loader_metrics
+from ca.uqam.info.mgl7460.meta.factory_compiler import FactoryCompiler
 from ca.uqam.info.mgl7460.meta.jsonclass import JSONClass
+from ca.uqam.info.mgl7460.meta.memory_importer import InMemoryImporter
 from ca.uqam.info.mgl7460.meta.relationship import Relationship
+from ca.uqam.info.mgl7460.meta.schema_cache import SchemaCache
+from ca.uqam.info.mgl7460.meta.snapshot import Snapshot
+from ca.uqam.info.mgl7460.meta.validator_compiler import ValidatorCompiler
+from ca.uqam.info.mgl7460.meta.value_interner import ValueInterner
+
+# Les traces du loader sont émises au niveau DEBUG: elles ne coûtent (presque)
+# rien tant que le logging n'est pas configuré pour les afficher
+logger = logging.getLogger(__name__)
 
 class json_loader:
 
@@ -15,14 +38,99 @@ class json_loader:
     # 
     # Ici, je me sers du répertoire dans lequel je vais générer le code
     # pour "calculer" le "package cible" des classes générées
-    def __init__(self, output_path: str):
+    # 
+    # sample_size limite le nombre d'éléments fusionnés pour inférer
+    # chaque classe (None: tous les éléments sont fusionnés). Il borne le
+    # travail d'inférence, pas la lecture: le document est toujours lu en
+    # entier, en mémoire comme en streaming (voir merge_sample), use_slots
+    # demande de générer des classes compactes, avec __slots__, et lazy
+    # des classes dont les objets liés sont créés au premier accès.
+    # Avec intern, les classes de même structure sont fusionnées en une
+    # seule classe générée (voir intern_classes)
+    # 
+    # parser est le json_parser qui lit les fichiers de données (par défaut,
+    # celui de la librairie standard)
+    def __init__(self, output_path: str, sample_size: int = None, use_slots: bool = False, lazy: bool = False, intern: bool = False,
+                 parser: json_parser = None):
         self.output_path = output_path
         # the package is derived from the output path. It is whatever
         # comes after the first src, from which we replace "/" by "."
         position_of_src = self.output_path.index("/src/")
         self.class_package = self.output_path[position_of_src+5:].replace("/",".")
-        print("Package: " + self.class_package)
+        logger.debug("Package: %s", self.class_package)
         self.classes = dict()
+        self.sample_size = sample_size
+        self.use_slots = use_slots
+        self.lazy = lazy
+        self.intern = intern
+        # nom de la classe canonique, pour chaque classe fusionnée par intern_classes
+        self.aliases = dict()
+        # nombre d'éléments examinés jusqu'ici, par nom de classe
+        self.sample_counts = dict()
+        # les crochets qui reçoivent les mesures du loader (voir add_hook)
+        self.hooks = []
+        self.parser = parser or json_parser()
+        # hash du schéma du code chargé, par nom de classe (voir reload_classes)
+        self.schema_hashes = dict()
+
+
+    # Adds a hook, a callable hook(kind, name, value) that receives the measures
+    # of the loader:
+    #   ("phase", <phase>, seconds)   the duration of a phase: parse, build_class,
+    #                                 generate_code, load_code, create_object
+    #                                 or apply_patch
+    #   ("counter", <name>, count)    an increment of a counter: bytes_parsed,
+    #                                 classes_inferred, objects_created.<class>,
+    #                                 patch_operations
+    # 
+    # The measures are only taken when there is at least one hook. A
+    # loader_metrics object is a hook that accumulates them
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+
+    def notify(self, kind: str, name: str, value):
+        for hook in self.hooks:
+            hook(kind, name, value)
+
+
+    # Times the statements of a 'with' block as the phase named phase_name
+    @contextmanager
+    def phase(self, phase_name: str):
+        if not self.hooks:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.notify("phase", phase_name, time.perf_counter() - start)
+
+
+    # Notifies the number of objects of each class in the graph of top_object (the
+    # objects of a lazy relationship are counted once they have been created)
+    def count_objects(self, top_object: object):
+        if not self.hooks:
+            return
+        classes = {json_class.type: json_class for json_class in self.classes.values()}
+        counts = dict()
+        pending = [top_object]
+        while pending:
+            an_object = pending.pop()
+            json_class = classes[type(an_object)]
+            counts[json_class.name] = counts.get(json_class.name, 0) + 1
+            for relation in json_class.relationships.values():
+                if relation.multiplicity == Relationship.ONE_TO_ONE:
+                    related_object = getattr(an_object, relation.name)
+                    if related_object is not None:
+                        pending.append(related_object)
+                elif relation.storage != Relationship.COLUMNS:
+                    # on ne passe pas par la propriété, qui créerait les objets
+                    key = "_" + relation.json_key() if json_class.is_lazy(relation) else relation.json_key()
+                    related_objects = getattr(an_object, key)
+                    pending.extend(related_objects.values() if relation.is_indexed() else related_objects)
+        for class_name, count in counts.items():
+            self.notify("counter", "objects_created." + class_name, count)
 
 
     # Cette méthode lit un fichier json contenu dans un 
@@ -43,11 +151,35 @@ class json_loader:
         # Compute root class name based on file name
         self.top_class_name = self.input_file_name.split(".")[0]
         
-        # Open the file
-        json_file = open(self.input_path + '/' + self.input_file_name,'r')
-    
         # Load the file into a json object
-        self.jsobjet = json.load(json_file)
+        with self.phase("parse"):
+            self.jsobjet = self.parser.parse_file(self.input_path + '/' + self.input_file_name)
+        if self.hooks:
+            self.notify("counter", "bytes_parsed", os.path.getsize(self.input_path + '/' + self.input_file_name))
+
+
+    # Cette méthode prépare la lecture en continu ("streaming") du fichier
+    # json. Contrairement à read_data, le document n'est jamais chargé au
+    # complet: l'inférence des classes (build_class_from_stream) et la
+    # création des objets (create_object_from_stream) relisent chacune
+    # le fichier, élément par élément. En mémoire, on ne garde donc que
+    # le graphe d'objets et l'élément en cours de traitement
+    def stream_data(self, input_path: str, file_name: str, chunk_size: int = 65536):
+        self.input_path = input_path
+        self.input_file_name = file_name
+        self.chunk_size = chunk_size
+        self.jsobjet = None
+
+        # Compute root class name based on file name
+        self.top_class_name = self.input_file_name.split(".")[0]
+
+
+    # Generates the events of the json_stream_reader for the input file
+    def stream_events(self):
+        with open(self.input_path + '/' + self.input_file_name,'r') as json_file:
+            yield from json_stream_reader(json_file, self.chunk_size).events()
+            if self.hooks:
+                self.notify("counter", "bytes_parsed", os.fstat(json_file.fileno()).st_size)
 
 
     # This method creates a JSONClass object with name class_name based 
@@ -64,89 +196,711 @@ class json_loader:
     # 
     # Voir la méthode main(...) de cette classe pour un exemple de "premier appel"
     # de la méthode
+    # 
+    # L'inférence se fait en une seule passe: la forme de chaque élément d'une
+    # collection est fusionnée dans l'unique JSONClass de ses éléments, de sorte
+    # qu'un champ présent dans un seul élément n'est jamais perdu
     def build_class(self, class_name: str, json_fragment: dict):
-        print ("entering build_class ...\n class_name is: " + class_name + " and json fragment is: " + json_fragment.__str__())
+        logger.debug("entering build_class ...\n class_name is: %s", class_name)
 
-        # Crée un objet JSONClass pour la classe actuelle
-        current_class = JSONClass(class_name, self.class_package)
+        known_classes = len(self.classes)
+        with self.phase("build_class"):
+            # Obtient (ou crée) l'objet JSONClass pour la classe actuelle
+            current_class = self.get_class(class_name)
 
-        # Itére sur le fragment json
-        for key, value in json_fragment.items():
-            if isinstance(value, list):
-                self.proccess_list(current_class, key, value)
-            elif isinstance(value, dict):
-                self.proccess_dict(current_class,key,value)
+            # Fusionne la forme du fragment json dans la classe
+            self.merge_fragment(current_class, json_fragment)
+            self.sort_classes()
+            # la classe peut avoir été fusionnée avec une autre par intern_classes
+            current_class = self.get_class(current_class.name)
+        self.notify("counter", "classes_inferred", len(self.classes) - known_classes)
+
+        logger.debug("The current class is: \n%s", current_class)
+
+        # return the constructed class
+        return current_class
+
+
+    # Returns the JSONClass named class_name, creating it and inserting it
+    # in the classes dictionary the first time it is encountered
+    def get_class(self, class_name: str) -> JSONClass:
+        class_name = self.aliases.get(class_name, class_name)
+        current_class = self.classes.get(class_name)
+        if current_class is None:
+            current_class = JSONClass(class_name, self.class_package)
+            current_class.use_slots = self.use_slots
+            current_class.lazy = self.lazy
+            self.classes[class_name] = current_class
+        return current_class
+
+
+    # Reorders the classes dictionary so that each class comes after the classes
+    # it refers to. Generating and loading the classes in this order guarantees
+    # that the modules imported by a generated module have been generated first
+    # 
+    # Classes that refer to each other, directly or not (a strongly connected
+    # component of the graph of relationships, e.g. auteur <-> livre), cannot
+    # all come first: they do not import each other, and each one binds the
+    # factories of the others on first call (see JSONClass.deferred_class_names)
+    # 
+    # With intern=True, the structurally identical classes are then merged,
+    # and the classes are sorted again
+    def sort_classes(self):
+        self.sort_components()
+        if self.intern:
+            self.intern_classes()
+            self.sort_components()
+
+
+    def sort_components(self):
+        sorted_classes = dict()
+        numbers = dict()
+        for current_class in list(self.classes.values()):
+            if current_class.name not in numbers:
+                self.visit_class(current_class, sorted_classes, numbers, [])
+        self.classes = sorted_classes
+
+
+    # Asks for the values of some attributes to be interned by the generated
+    # factories (see JSONClass.intern_attribute), e.g. for the strings that
+    # repeat across many objects. 'attributes' gives, by class name, the list
+    # of the attributes to intern, or a dictionary of the maximum number of
+    # values kept for each of them
+    def intern_values(self, attributes: dict):
+        for class_name, attribute_names in attributes.items():
+            json_class = self.classes.get(self.aliases.get(class_name, class_name))
+            if json_class is None:
+                raise ValueError(f"Classe inconnue: '{class_name}'")
+            if not isinstance(attribute_names, dict):
+                attribute_names = dict.fromkeys(attribute_names, ValueInterner.DEFAULT_MAX_SIZE)
+            for attribute_name, max_size in attribute_names.items():
+                json_class.intern_attribute(attribute_name, max_size)
+
+
+    # Returns, by class name, the memory saved by interning since the classes
+    # were loaded: the total number of bytes saved, and the statistics of the
+    # interner of each interned attribute (see ValueInterner.get_statistics)
+    def interning_report(self) -> dict:
+        report = dict()
+        for class_name, json_class in self.classes.items():
+            interners = json_class.get_interners()
+            if interners:
+                statistics = {attribute_name: interner.get_statistics() for attribute_name, interner in interners.items()}
+                report[class_name] = {"bytes_saved": sum(attribute["bytes_saved"] for attribute in statistics.values()),
+                                      "attributes": statistics}
+        return report
+
+
+    # Restricts the classes to a projection of the document, given by a nested
+    # mask that starts at top_class. The keys of a mask are the names of the
+    # attributes (with the value True) and of the relationships (with the mask
+    # of the related class, or True for all of it) to keep, e.g.
+    #   {"nom": True, "client": {"id": True, "nom": True, "commande": {"date": True}}}
+    # A member with the value False is excluded, like a missing one; any other
+    # value raises a ValueError
+    # 
+    # The classes are projected before their code is generated: the excluded
+    # attributes have no field in the generated classes, and the excluded
+    # relationships are never followed by the from_json factories, so their
+    # objects are never created. The classes that are no longer reachable are
+    # dropped. A class reached by several paths keeps the union of its masks,
+    # and the fields used to index a kept relationship are always kept
+    def project(self, top_class: JSONClass, mask: dict):
+        projections = dict()
+        self.collect_projection(top_class, mask, projections)
+        for class_name, (attribute_names, relationship_names) in projections.items():
+            self.classes[class_name].project(attribute_names, relationship_names)
+        self.classes = {name: json_class for name, json_class in self.classes.items() if name in projections}
+
+
+    # Adds, to projections, the attribute and relationship names kept by 'mask'
+    # for json_class and, recursively, for its related classes
+    def collect_projection(self, json_class: JSONClass, mask, projections: dict):
+        attribute_names, relationship_names = projections.setdefault(json_class.name, (set(), set()))
+        if mask is True:
+            # toute la classe est conservée: on s'arrête si c'était déjà le cas (relations récursives)
+            if attribute_names.issuperset(json_class.attributes) and relationship_names.issuperset(json_class.relationships):
+                return
+            # les noms sont ajoutés avant de descendre dans les relations, pour que ce test arrête la récursion
+            attribute_names.update(json_class.attributes)
+            relationship_names.update(json_class.relationships)
+            mask = dict.fromkeys(list(json_class.attributes) + list(json_class.relationships), True)
+        for name, sub_mask in mask.items():
+            if sub_mask is False:
+                continue
+            if sub_mask is not True and (name in json_class.attributes or not isinstance(sub_mask, dict)):
+                raise ValueError(f"Valeur invalide pour '{name}' dans le masque de la classe '{json_class.name}': {sub_mask!r}")
+            if name in json_class.attributes:
+                attribute_names.add(name)
+            elif name in json_class.relationships:
+                relation = json_class.relationships[name]
+                relationship_names.add(name)
+                related_class = json_class.get_related_class(relation.destination_entity)
+                # les champs d'indexation sont nécessaires aux méthodes add_
+                index_fields = {relation.index_field} - {None} | set(relation.secondary_indexes)
+                related_attributes, _ = projections.setdefault(related_class.name, (set(), set()))
+                related_attributes.update(index_fields)
+                self.collect_projection(related_class, sub_mask, projections)
+            else:
+                raise ValueError(f"'{name}' n'est ni un attribut ni une relation de la classe '{json_class.name}'")
+
+
+    # Hash-consing of the classes: the classes with the same shape (see
+    # JSONClass.shape) are replaced by a single, canonical, class (the first one
+    # in dependency order), so that a shape that appears under many keys gives
+    # a single generated module. The relationships that led to a merged class
+    # are redirected to the canonical class, and the name of the merged class
+    # becomes an alias of the canonical class for get_class.
+    # 
+    # The classes are visited children first: when a class is visited, its
+    # related classes are already canonical, so comparing the names of the
+    # related classes amounts to comparing their structures
+    def intern_classes(self):
+        canonical_classes = dict()
+        interned_classes = dict()
+        for current_class in self.classes.values():
+            for related_class_name in current_class.get_related_class_names():
+                if related_class_name in self.aliases:
+                    current_class.rename_related_class(related_class_name, self.aliases[related_class_name])
+            canonical_class = canonical_classes.setdefault(current_class.shape(), current_class)
+            if canonical_class is current_class:
+                interned_classes[current_class.name] = current_class
             else:
-                # Attribut simple
-                current_class.add_attribute(key, type(value).__name__)
+                self.aliases[current_class.name] = canonical_class.name
+                for alias, canonical_name in self.aliases.items():
+                    if canonical_name == current_class.name:
+                        self.aliases[alias] = canonical_class.name
+                JSONClass.JSON_CLASSES.pop(current_class.fully_qualified_name(), None)
+        self.classes = interned_classes
 
-        print ('The current class is: \n'+current_class.__str__())
 
-        #insert class in classes dictionary
-        self.classes[class_name] = current_class
+    # Depth-first visit used by sort_classes (Tarjan's algorithm): 'numbers'
+    # gives the visit order of the classes, and 'stack' holds the visited
+    # classes whose component is not complete. A component is inserted in
+    # sorted_classes after the components it refers to. Returns the lowest
+    # number reachable from current_class
+    def visit_class(self, current_class: JSONClass, sorted_classes: dict, numbers: dict, stack: list) -> int:
+        number = lowest = numbers[current_class.name] = len(numbers)
+        stack.append(current_class)
+        for related_class_name in current_class.get_related_class_names():
+            related_class = self.classes.get(related_class_name)
+            if related_class is None:
+                continue
+            if related_class_name not in numbers:
+                lowest = min(lowest, self.visit_class(related_class, sorted_classes, numbers, stack))
+            elif related_class_name not in sorted_classes:
+                # classe de la composante en cours (encore sur la pile)
+                lowest = min(lowest, numbers[related_class_name])
+        if lowest == number:
+            position = stack.index(current_class)
+            component = stack[position:]
+            del stack[position:]
+            component_names = {member.name for member in component}
+            for member in component:
+                member.deferred_class_names = component_names.intersection(member.get_related_class_names()) - {member.name}
+                sorted_classes[member.name] = member
+        return lowest
+
+
+    # Merges the attributes and relationships found in json_fragment into
+    # current_class, descending recursively into the nested objects
+    def merge_fragment(self, current_class: JSONClass, json_fragment: dict):
+        for key, value in json_fragment.items():
+            self.proccess_value(current_class, key, value)
+
+
+    # Merges one element of a collection into the class of the elements, unless
+    # sample_size elements of that class have already been merged. Returns
+    # False once the cap has been reached, so that callers can stop iterating.
+    # The cap only saves the merging: the elements have already been parsed
+    # (by read_data, or one by one by the stream reader, which still decodes
+    # the elements past the cap, since skipping them in python is slower than
+    # letting the json decoder build them)
+    def merge_sample(self, class_name: str, json_fragment: dict) -> bool:
+        count = self.sample_counts.get(class_name, 0)
+        if self.sample_size is not None and count >= self.sample_size:
+            return False
+        self.sample_counts[class_name] = count + 1
+        self.merge_fragment(self.get_class(class_name), json_fragment)
+        return True
+
+
+    # This method builds the class corresponding to the json file read by
+    # stream_data, without loading the file: the members of the root object
+    # are handled one by one, as they are parsed
+    # 
+    # Since the file is parsed as the classes are built, the parsing time is
+    # part of the build_class phase
+    def build_class_from_stream(self):
+        logger.debug("entering build_class_from_stream ...\n class_name is: %s", self.top_class_name)
+
+        known_classes = len(self.classes)
+        with self.phase("build_class"):
+            current_class = self.get_class(self.top_class_name)
+
+            for event, key, item_key, value in self.stream_events():
+                if event == 'value':
+                    self.proccess_value(current_class, key, value)
+                elif event == 'start_list':
+                    # la relation est ajoutée même si la liste est vide
+                    self.proccess_list(current_class, key, [])
+                elif event == 'start_table':
+                    first_item = True
+                elif event == 'item':
+                    if item_key is not None and first_item:
+                        # le premier élément d'une table sert à identifier le champ d'indexation
+                        self.proccess_dict(current_class, key, {item_key: value})
+                        first_item = False
+                    else:
+                        self.merge_sample(self.get_related_class_name(key), value)
+            self.sort_classes()
+            # la classe peut avoir été fusionnée avec une autre par intern_classes
+            current_class = self.get_class(current_class.name)
+        self.notify("counter", "classes_inferred", len(self.classes) - known_classes)
+
+        logger.debug("The current class is: \n%s", current_class)
 
-        # return the constructed class
         return current_class
-    
+
+
+    # This method creates the root object of the json file read by stream_data.
+    # Each element of a top level collection is converted into an object as soon
+    # as it is parsed, and then discarded. The root object itself is created at
+    # the end, since its attributes may appear after its collections
+    def create_object_from_stream(self, top_class: JSONClass):
+        with self.phase("create_object"):
+            top_object = self.create_object_from_events(top_class)
+        self.count_objects(top_object)
+        return top_object
+
+
+    def create_object_from_events(self, top_class: JSONClass):
+        relations = {relation.json_key(): relation for relation in top_class.relationships.values()}
+        factories = {key: top_class.get_related_class(relation.destination_entity).get_factory() for key, relation in relations.items()}
+        attributes = dict()
+        related_objects = {relation.name: [] for relation in top_class.relationships.values()}
+
+        for event, key, item_key, value in self.stream_events():
+            # les membres exclus par une projection sont ignorés
+            if event == 'value' and (key in top_class.attributes or key in relations):
+                attributes[key] = value
+            elif event == 'item' and key in relations:
+                related_objects[relations[key].name].append(factories[key](value))
+
+        top_object = top_class.create_object(attributes)
+        for relation_name, objects in related_objects.items():
+            adder = getattr(top_object, f"add_{relation_name}")
+            for related_object in objects:
+                adder(related_object)
+        return top_object
+
+
+    # This method creates the object of top_class corresponding to json_fragment
+    # using a pool of 'workers' processes: the elements of the top level ONE_TO_MANY
+    # relationships are split in chunks of chunk_size fragments, the objects of
+    # each chunk are created by a process, and they are added, in order, to the
+    # top object.
+    # 
+    # When processes can be created by fork, they inherit the fragments, and only
+    # receive the bounds of their chunks. The classes generated in memory are
+    # registered in each process, so that the generated classes can be imported
+    def create_object_parallel(self, top_class: JSONClass, json_fragment: dict, workers: int = None, chunk_size: int = 1000):
+        with self.phase("create_object"):
+            top_object = self.create_object_in_pool(top_class, json_fragment, workers, chunk_size)
+        self.count_objects(top_object)
+        return top_object
+
+
+    def create_object_in_pool(self, top_class: JSONClass, json_fragment: dict, workers: int, chunk_size: int):
+        # 1. Les relations à répartir, et l'objet racine sans ces relations
+        relations = [relation for relation in top_class.relationships.values()
+                     if relation.multiplicity == Relationship.ONE_TO_MANY and relation.storage != Relationship.COLUMNS
+                     and not top_class.is_lazy(relation)]
+        keys = {relation.json_key() for relation in relations}
+        top_object = top_class.create_object({key: value for key, value in json_fragment.items() if key not in keys})
+
+        collections = dict()
+        for relation in relations:
+            if relation.is_indexed():
+                collections[relation.json_key()] = list(json_fragment.get(relation.json_key(), {}).values())
+            else:
+                collections[relation.json_key()] = json_fragment.get(relation.json_key(), ())
+
+        # 2. Création des objets par morceaux, dans le pool de processus
+        use_fork = "fork" in multiprocessing.get_all_start_methods()
+        parallel_worker.SHARED_FRAGMENTS = collections if use_fork else None
+        sources = InMemoryImporter.get_instance().sources if InMemoryImporter.INSTANCE else dict()
+        try:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork" if use_fork else None),
+                                     initializer=parallel_worker.init_worker, initargs=(sources,)) as executor:
+                chunks = []
+                for relation in relations:
+                    related_class = top_class.get_related_class(relation.destination_entity)
+                    related_fragments = collections[relation.json_key()]
+                    for start in range(0, len(related_fragments), chunk_size):
+                        if use_fork:
+                            future = executor.submit(parallel_worker.build_shared_objects, related_class.fully_qualified_name(),
+                                                     related_class.name, relation.json_key(), start, start + chunk_size)
+                        else:
+                            future = executor.submit(parallel_worker.build_objects, related_class.fully_qualified_name(),
+                                                     related_class.name, related_fragments[start:start + chunk_size])
+                        chunks.append((relation, future))
+
+                # 3. Ajout des objets à l'objet racine, dans l'ordre des fragments
+                for relation, future in chunks:
+                    adder = getattr(top_object, f"add_{relation.name}")
+                    for related_object in future.result():
+                        adder(related_object)
+        finally:
+            parallel_worker.SHARED_FRAGMENTS = None
+        return top_object
+
+
+    # Creates the object of top_class corresponding to json_fragment (by default,
+    # the data read by read_data), measuring the create_object phase
+    def create_object(self, top_class: JSONClass, json_fragment: dict = None):
+        with self.phase("create_object"):
+            top_object = top_class.create_object(self.jsobjet if json_fragment is None else json_fragment)
+        self.count_objects(top_object)
+        return top_object
+
+
+    # Creates the object of top_class corresponding to json_fragment (by default,
+    # the data read by read_data), keeping only the related objects that satisfy
+    # the predicates: functions of a json fragment, indexed by class name
+    # ("produit") or by path of relationship names from top_class
+    # ("client.commande"), see FactoryCompiler. An unknown name raises a
+    # ValueError
+    # 
+    # The predicates are evaluated on the json fragments, during construction:
+    # the objects of a fragment that does not satisfy its predicate (and those of
+    # its sub-fragments) are never created. Returns None if the top fragment
+    # does not satisfy the predicate of top_class
+    def create_object_filtered(self, top_class: JSONClass, predicates: dict, json_fragment: dict = None):
+        json_fragment = self.jsobjet if json_fragment is None else json_fragment
+        # les noms des prédicats sont vérifiés même si le fragment racine est écarté
+        factory = FactoryCompiler(predicates).compile(top_class)
+        top_predicate = predicates.get(top_class.name)
+        if top_predicate is not None and not top_predicate(json_fragment):
+            return None
+        with self.phase("create_object"):
+            top_object = factory(json_fragment)
+        self.count_objects(top_object)
+        return top_object
+
+
+    # Creates the object of top_class corresponding to json_fragment (by default,
+    # the data read by read_data), checking the fragments against the recorded
+    # types and relationships of the classes as the objects are created. All
+    # the errors are collected, with their paths, and raised at the end in a
+    # ValidationError (see ValidatorCompiler)
+    def create_object_validated(self, top_class: JSONClass, json_fragment: dict = None):
+        with self.phase("create_object"):
+            top_object = ValidatorCompiler().compile(top_class)(self.jsobjet if json_fragment is None else json_fragment)
+        self.count_objects(top_object)
+        return top_object
+
+
+    # Writes top_object (and its related objects) to a snapshot file, with the
+    # schema of the classes of the loader (see Snapshot)
+    def write_snapshot(self, file_name: str, top_object: object):
+        Snapshot(file_name).write(top_object, self.classes.values())
+
+
+    # Reads the object saved in a snapshot file: the snapshot is rejected (with
+    # a ValueError) if it was written with another schema than the current one.
+    # The graph is unpickled, which can run arbitrary code: only read snapshots
+    # from a trusted location (see Snapshot)
+    def read_snapshot(self, file_name: str):
+        with self.phase("create_object"):
+            top_object = Snapshot(file_name).read(self.classes.values())
+        self.count_objects(top_object)
+        return top_object
+
+
+    # Applies a JSON Patch (a list of operations) to top_object, an object of
+    # top_class that is already loaded, instead of reloading the whole document:
+    # only the objects on the paths of the operations are visited (see json_patch)
+    def apply_patch(self, top_class: JSONClass, top_object: object, operations: list):
+        with self.phase("apply_patch"):
+            json_patch(top_class).apply(top_object, operations)
+        if self.hooks:
+            self.notify("counter", "patch_operations", len(operations))
+
+
+    # Applies a JSON merge patch (a partial document) to top_object
+    def apply_merge_patch(self, top_class: JSONClass, top_object: object, merge_patch: dict):
+        with self.phase("apply_patch"):
+            json_patch(top_class).apply_merge(top_object, merge_patch)
+        if self.hooks:
+            self.notify("counter", "patch_operations", 1)
+
+
+    # Parses a json file, and creates the corresponding object of top_class
+    # (executed by the executor of load_documents)
+    def load_file(self, top_class: JSONClass, file_path: str):
+        return top_class.create_object(self.parser.parse_file(file_path))
+
+
+    # Generates and loads the code of all the classes, in dependency order: in
+    # output_path, in memory (in_memory=True), or through a schema cache
+    def load_classes(self, in_memory: bool = False, schema_cache: SchemaCache = None):
+        for json_class in iter(self.classes.values()):
+            with self.phase("generate_code"):
+                if schema_cache is not None:
+                    json_class.generate_code_cached(schema_cache, None if in_memory else self.output_path)
+                elif in_memory:
+                    json_class.generate_code_in_memory()
+                else:
+                    json_class.generate_code(self.output_path)
+            with self.phase("load_code"):
+                json_class.load_code()
+
+
+    # Generates and loads the code of the classes after the schema has been
+    # inferred again (e.g. by json_watcher, when the data file changed), reusing
+    # the classes loaded by previous_loader. Only the classes whose schema hash
+    # changed are regenerated. They are reloaded with importlib.reload, in
+    # dependency order, together with the classes that refer to them, directly
+    # or not: their modules import the changed classes, and bind their
+    # factories. The other classes keep the types already loaded.
+    # 
+    # Returns the duration of the reload of each reloaded class, by name
+    def reload_classes(self, previous_loader=None, in_memory: bool = False) -> dict:
+        previous_classes = previous_loader.classes if previous_loader is not None else dict()
+        previous_hashes = previous_loader.schema_hashes if previous_loader is not None else dict()
+        self.schema_hashes = {name: json_class.schema_hash() for name, json_class in self.classes.items()}
+        changed = {name for name, schema_hash in self.schema_hashes.items()
+                   if previous_hashes.get(name) != schema_hash or previous_classes[name].type is None}
+
+        # 1. Les classes qui font référence (directement ou non) à une classe modifiée
+        reloaded = set(changed)
+        growing = True
+        while growing:
+            growing = False
+            for name, json_class in self.classes.items():
+                if name not in reloaded and any(related_name in reloaded for related_name in json_class.get_related_class_names()):
+                    reloaded.add(name)
+                    growing = True
+        # les modules déjà importés sont rechargés sur place (add_module les retire de sys.modules)
+        modules = {name: sys.modules.get(self.classes[name].fully_qualified_name()) for name in reloaded}
+        if changed and not in_memory:
+            importlib.invalidate_caches()
+
+        # 2. Régénération et rechargement, dans l'ordre des dépendances
+        reload_times = dict()
+        for name, json_class in self.classes.items():
+            if name not in changed:
+                previous_class = previous_classes[name]
+                json_class.generated_source = previous_class.generated_source
+                json_class.generated_class_file_name = previous_class.generated_class_file_name
+                if name not in reloaded:
+                    json_class.type = previous_class.type
+                    continue
+            start = time.perf_counter()
+            if name in changed:
+                with self.phase("generate_code"):
+                    if in_memory:
+                        json_class.generate_code_in_memory()
+                    else:
+                        json_class.generate_code(self.output_path)
+                        # le bytecode en cache peut avoir la même date, et la même taille, que le nouveau fichier
+                        try:
+                            os.remove(importlib.util.cache_from_source(json_class.generated_class_file_name))
+                        except FileNotFoundError:
+                            pass
+            with self.phase("load_code"):
+                module = modules[name]
+                if module is not None:
+                    sys.modules[json_class.fully_qualified_name()] = module
+                    importlib.reload(module)
+                json_class.load_code()
+            reload_times[name] = time.perf_counter() - start
+            logger.info("Class %s %s in %.3f ms", name, "regenerated and reloaded" if name in changed else "reloaded", reload_times[name] * 1000)
+        return reload_times
+
+
+    # This asynchronous generator loads many json files of the same structure
+    # (e.g. one file per store and per day), and yields (file_name, top_object)
+    # pairs as the objects are created, in order of completion.
+    # 
+    # It works in two phases:
+    #   1. the files are parsed concurrently, and their shapes are merged into
+    #      the single class top_class_name (by default, the name of the first
+    #      file): the classes are then generated and loaded once, for all files
+    #   2. the files are parsed again, and their objects are created, concurrently
+    # 
+    # Parsing and object creation are done by 'executor' (the default executor
+    # of the event loop if None), at most max_concurrency files at a time. Only
+    # the documents being processed are in memory at a given time
+    async def load_documents(self, input_path: str, file_names: list, top_class_name: str = None, max_concurrency: int = 4,
+                             in_memory: bool = False, schema_cache: SchemaCache = None, executor=None):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        self.input_path = input_path
+        self.top_class_name = top_class_name or file_names[0].split(".")[0]
+
+        async def run(function, *arguments):
+            async with semaphore:
+                return await loop.run_in_executor(executor, function, *arguments)
+
+        # 1. Inférence: la fusion se fait dans la boucle d'événements, un document à la fois
+        known_classes = len(self.classes)
+        with self.phase("build_class"):
+            top_class = self.get_class(self.top_class_name)
+            for parsing in asyncio.as_completed([run(self.parser.parse_file, input_path + '/' + file_name) for file_name in file_names]):
+                self.merge_fragment(top_class, await parsing)
+            self.sort_classes()
+            top_class = self.get_class(self.top_class_name)
+        if self.hooks:
+            self.notify("counter", "classes_inferred", len(self.classes) - known_classes)
+            self.notify("counter", "bytes_parsed", sum(os.path.getsize(input_path + '/' + file_name) for file_name in file_names))
+        self.load_classes(in_memory, schema_cache)
+
+        # 2. Création des objets, produits au fur et à mesure
+        async def load(file_name: str):
+            return file_name, await run(self.load_file, top_class, input_path + '/' + file_name)
+
+        for loading in asyncio.as_completed([load(file_name) for file_name in file_names]):
+            file_name, top_object = await loading
+            self.count_objects(top_object)
+            yield file_name, top_object
+
+
+    # To reduce the complexity of the build_class method this method was created
+    # it procces a value of the json fragment, depending on its type
+    def proccess_value(self, current_class, key, value):
+        if isinstance(value, list):
+            self.proccess_list(current_class, key, value)
+        elif isinstance(value, dict):
+            self.proccess_dict(current_class,key,value)
+        else:
+            # Attribut simple
+            current_class.merge_attribute(key, type(value).__name__)
+
+
+    # Computes the name of the class of the elements of a "liste_" or
+    # "table_" collection, e.g. "liste_commandes" -> "commande"
+    def get_related_class_name(self, key: str) -> str:
+        related_class_name = key[6:] if key.startswith("liste_") or key.startswith("table_") else key
+        if related_class_name.endswith('s'):
+            related_class_name = related_class_name[:-1]  # Enleve le 's' final
+        return related_class_name
+
+
     # To reduce the complexity of the build_class method this method was created
     # it procces the value being a list
     def proccess_list(self, current_class, key, list:list):
         # Traitement d'une liste : relation ONE_TO_MANY non indexée
-        related_class_name = key[6:] if key.startswith("liste_") else key
-        if related_class_name.endswith('s'):
-            related_class_name = related_class_name[:-1]  # Enleve le 's' final
+        related_class_name = self.get_related_class_name(key)
         relation_name = related_class_name # Nom de la relation
-        current_class.add_relationship(relation_name, related_class_name, Relationship.ONE_TO_MANY)
+        if relation_name not in current_class.relationships:
+            current_class.add_relationship(relation_name, related_class_name, Relationship.ONE_TO_MANY)
 
-        # Appel récursif pour chaque élément de la liste
+        # Fusion de chaque élément de la liste (jusqu'à sample_size)
         for item in list:
-            self.build_class(related_class_name, item)
+            if not self.merge_sample(related_class_name, item):
+                break
 
     # To reduce the complexity of the build_class method this method was created
     # it procces the value being a dictionnary
     def proccess_dict(self, current_class, key, dict:dict):
         if key.startswith("table_"):
             # Traitement d'un dictionnaire : relation ONE_TO_MANY indexée ou attribut complexe
-            related_class_name = key[6:]
-            if related_class_name.endswith('s'):
-                related_class_name = related_class_name[:-1]
+            related_class_name = self.get_related_class_name(key)
             relation_name = related_class_name  # Nom de la relation
-            # Identifie le champ d'indexation en parcourant les clés de l'objet
-            sample_item = next(iter(dict.values()))
-            index_field = next((k for k in sample_item.keys() if k.startswith('id')), 'id_' + related_class_name)
-            current_class.add_relationship(relation_name, related_class_name, Relationship.ONE_TO_MANY, index_field)
+            if relation_name not in current_class.relationships:
+                # Identifie le champ d'indexation en parcourant les clés de l'objet
+                sample_item = next(iter(dict.values()))
+                index_field = next((k for k in sample_item.keys() if k.startswith('id')), 'id_' + related_class_name)
+                current_class.add_relationship(relation_name, related_class_name, Relationship.ONE_TO_MANY, index_field)
 
-            # Appel récursif pour chaque valeur du dictionnaire
+            # Fusion de chaque valeur du dictionnaire (jusqu'à sample_size)
             for item in dict.values():
-                self.build_class(related_class_name, item)
+                if not self.merge_sample(related_class_name, item):
+                    break
         else:
             # Relation ONE_TO_ONE ou attribut complexe
             related_class_name = key  # Le nom de la classe liée est la clé elle-même
             relation_name = related_class_name  # Nom de la relation
-            current_class.add_relationship(relation_name, related_class_name, Relationship.ONE_TO_ONE)
-            self.build_class(related_class_name, dict) # Appel récursif pour l'objet complexe
+            if relation_name not in current_class.relationships:
+                current_class.add_relationship(relation_name, related_class_name, Relationship.ONE_TO_ONE)
+            self.merge_fragment(self.get_class(related_class_name), dict) # Fusion de l'objet complexe
         
 
     # The "main" program
-    def main(data_directory:str, input_data_file_name: str, code_output_directory: str):
+    # 
+    # With streaming=True, the data file is never loaded as a whole: it is
+    # parsed incrementally, once to build the classes and once to create
+    # the objects
+    # 
+    # With in_memory=True, the code of the classes is compiled and imported
+    # without being written to code_output_directory (which is then only
+    # used to compute the package of the classes)
+    # 
+    # With a cache_directory, the generated code is cached by schema hash:
+    # only the classes whose schema changed since the last run are regenerated
+    # 
+    # With intern=True, the classes of identical structure share a single
+    # generated class
+    # 
+    # With verbose=True, the traces of the loader are displayed, followed by
+    # the duration of each phase and the counters of the loader
+    # 
+    # parser names the json decoder ("stdlib", "orjson" or "auto", see
+    # json_parser), and use_mmap asks for the data file to be mapped in memory
+    # 
+    # With a projection (a nested mask, see project), only the attributes and
+    # relationships of the mask are generated and loaded
+    # 
+    # With validate=True, the data is checked against the inferred types while
+    # the objects are created (see create_object_validated)
+    # 
+    # interned_values names, by class, the attributes whose values are interned
+    # (see intern_values): the memory saved is displayed after the top object
+    def main(data_directory:str, input_data_file_name: str, code_output_directory: str, streaming: bool = False, sample_size: int = None, use_slots: bool = False, in_memory: bool = False, cache_directory: str = None, lazy: bool = False, intern: bool = False, verbose: bool = False, parser: str = "stdlib", use_mmap: bool = False, projection: dict = None, validate: bool = False, interned_values: dict = None):
         # 1. create an instance of loader
-        loader = json_loader(code_output_directory)
-
-        # 2. read json data from file
-        loader.read_data(data_directory,input_data_file_name)
+        if verbose:
+            logging.basicConfig(level=logging.DEBUG)
+        loader = json_loader(code_output_directory, sample_size, use_slots, lazy, intern, json_parser(parser, use_mmap))
+        metrics = loader_metrics()
+        if verbose:
+            loader.add_hook(metrics)
 
+        # 2. read json data from file, and
         # 3. build jsonclass objects 
-        top_class = loader.build_class(loader.top_class_name,loader.jsobjet)
+        if streaming:
+            loader.stream_data(data_directory,input_data_file_name)
+            top_class = loader.build_class_from_stream()
+        else:
+            loader.read_data(data_directory,input_data_file_name)
+            top_class = loader.build_class(loader.top_class_name,loader.jsobjet)
+
+        if projection is not None:
+            loader.project(top_class, projection)
+        if interned_values is not None:
+            loader.intern_values(interned_values)
 
         # 4. generate and load python code for python classes corresponding
         # to created jsonclass objets
-        for json_class in iter(loader.classes.values()):
-            json_class.generate_code(code_output_directory)
-            json_class.load_code()
+        schema_cache = SchemaCache(cache_directory) if cache_directory else None
+        loader.load_classes(in_memory, schema_cache)
+        if schema_cache is not None:
+            logger.info("Schema cache: %s", schema_cache)
 
         # 5. read json data and create corresponding python objects
-        top_object = top_class.create_object(loader.jsobjet)
-        print ("\n\nTop object: "+ top_object.__str__())
+        if streaming:
+            top_object = loader.create_object_from_stream(top_class)
+        elif validate:
+            top_object = loader.create_object_validated(top_class)
+        else:
+            top_object = loader.create_object(top_class)
+        # au plus 10 objets par relation: le graphe complet peut être énorme
+        print ("\n\nTop object: "+ top_object.to_string(max_items=10))
+        if interned_values is not None:
+            print("\nInternement: " + ", ".join(f"{class_name} {report['bytes_saved']} octets" for class_name, report in loader.interning_report().items()))
+        if verbose:
+            print("\nMesures: " + metrics.__str__())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,66 @@
+import json
+import logging
+import mmap
+
+# orjson est optionnel: sans lui, seul le décodeur de la librairie standard
+# est disponible
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+class json_parser:
+
+    # The decoders, by name, from the slowest to the fastest. Each one takes the
+    # bytes (or a memoryview on the bytes) of a json document
+    BACKENDS = {"stdlib": lambda data: json.loads(data if isinstance(data, bytes) else bytes(data))}
+    if orjson is not None:
+        BACKENDS["orjson"] = orjson.loads
+
+    # A json_parser reads json files with one of the BACKENDS: "stdlib" (the
+    # json module, the default), "orjson", or "auto" (the fastest backend
+    # installed). A backend that is not installed is replaced by the stdlib one.
+    #
+    # With use_mmap, the file is mapped in memory, and its bytes are given
+    # directly to the decoder (without copy, for the decoders that accept a
+    # memoryview), instead of being read and decoded as text first
+    def __init__(self, backend: str = "stdlib", use_mmap: bool = False):
+        if backend == "auto":
+            backend = list(json_parser.BACKENDS)[-1]
+        elif backend not in json_parser.BACKENDS:
+            if backend != "orjson":
+                raise ValueError(f"Analyseur json inconnu: '{backend}'")
+            logger.warning("L'analyseur json '%s' n'est pas installé: la librairie standard est utilisée", backend)
+            backend = "stdlib"
+        self.backend = backend
+        self.decode = json_parser.BACKENDS[backend]
+        self.use_mmap = use_mmap
+
+
+    @staticmethod
+    def available_backends() -> list:
+        return list(json_parser.BACKENDS)
+
+
+    # Reads and parses the json file named file_name
+    def parse_file(self, file_name: str):
+        if self.use_mmap:
+            return self.parse_mapped_file(file_name)
+        if self.backend == "stdlib":
+            with open(file_name, 'r') as json_file:
+                return json.load(json_file)
+        with open(file_name, 'rb') as json_file:
+            return self.decode(json_file.read())
+
+
+    def parse_mapped_file(self, file_name: str):
+        with open(file_name, 'rb') as json_file:
+            # un fichier vide ne peut pas être projeté en mémoire
+            if json_file.seek(0, 2) == 0:
+                return self.decode(b"")
+            with mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                # la vue doit être libérée avant de fermer la projection
+                with memoryview(mapped_file) as data:
+                    return self.decode(data)
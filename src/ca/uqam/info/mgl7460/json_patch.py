@@ -0,0 +1,442 @@
+import copy
+from ca.uqam.info.mgl7460.meta.jsonclass import JSONClass
+from ca.uqam.info.mgl7460.meta.relationship import Relationship
+
+class json_patch:
+
+    # Un json_patch applique une modification à un graphe d'objets déjà chargé
+    # (par json_loader), au lieu de recharger tout le document: un JSON Patch
+    # (RFC 6902, une liste d'opérations add, remove, replace, move, copy et
+    # test), ou un JSON merge patch (RFC 7396, un fragment fusionné dans le
+    # document).
+    #
+    # Les chemins suivent la structure du document json (celle de to_json):
+    #   /nom                                    un attribut de l'objet racine
+    #   /liste_clients/0/liste_commandes/-      la fin d'une liste
+    #   /liste_clients/0/liste_commandes/1/table_ligne_commandes/TAB1
+    # Dans une liste, un élément peut aussi être désigné par la valeur d'un de
+    # ses attributs, "<attribut>=<valeur>" (p. ex. /liste_clients/id=CL1): la
+    # recherche passe par l'index secondaire unique de l'attribut (voir
+    # JSONClass.add_index) quand il existe.
+    #
+    # Les éléments d'une table sont trouvés par l'accesseur indexé généré
+    # (get_<relation>_with_<champ>), ceux d'une liste par leur position, et
+    # les objets sont ajoutés et retirés par les méthodes add_ et remove_
+    # générées, qui tiennent les index secondaires à jour: le coût d'une
+    # opération ne dépend pas de la taille du document (sauf le retrait d'un
+    # élément d'une liste python, linéaire dans la taille de la liste)
+    def __init__(self, top_class: JSONClass):
+        self.top_class = top_class
+        # les relations de chaque classe, par clé json
+        self.relation_keys = dict()
+
+
+    # Applies the operations of a JSON Patch, in order, to top_object. A failed
+    # operation raises a ValueError; the operations that precede it are not
+    # undone
+    def apply(self, top_object: object, operations: list):
+        for operation in operations:
+            op = operation.get("op")
+            if op in ("add", "replace", "test"):
+                self.check_member(operation, "value")
+            if op in ("move", "copy"):
+                self.check_member(operation, "from")
+            tokens = json_patch.split_pointer(operation.get("path"))
+            if op == "add":
+                self.add(top_object, tokens, operation["value"])
+            elif op == "remove":
+                self.remove(top_object, tokens)
+            elif op == "replace":
+                self.replace(top_object, tokens, operation["value"])
+            elif op == "move":
+                from_tokens = json_patch.split_pointer(operation["from"])
+                if tokens[:len(from_tokens)] == from_tokens and tokens != from_tokens:
+                    raise ValueError(f"Impossible de déplacer '{operation['from']}' dans un de ses descendants")
+                value = self.get(top_object, from_tokens)
+                self.remove(top_object, from_tokens)
+                self.add(top_object, tokens, value)
+            elif op == "copy":
+                self.add(top_object, tokens, copy.deepcopy(self.get(top_object, json_patch.split_pointer(operation["from"]))))
+            elif op == "test":
+                if self.get(top_object, tokens) != operation["value"]:
+                    raise ValueError(f"Test échoué pour '{operation['path']}'")
+            else:
+                raise ValueError(f"Opération de patch inconnue: {op!r}")
+
+
+    # Applies a JSON merge patch to top_object: the attributes of the patch
+    # replace those of the objects (null sets them to None), the objects are
+    # merged recursively, the elements of a table are merged, added or removed
+    # (null) one by one, and a list is replaced as a whole
+    def apply_merge(self, top_object: object, merge_patch: dict):
+        self.merge_object(top_object, self.top_class, merge_patch, None)
+
+
+    @staticmethod
+    def check_member(operation: dict, member: str):
+        if member not in operation:
+            raise ValueError(f"L'opération {operation.get('op')!r} n'a pas de membre '{member}'")
+
+
+    # Splits a json pointer ("/liste_clients/0/nom") into its reference tokens
+    @staticmethod
+    def split_pointer(pointer: str) -> list:
+        if not isinstance(pointer, str) or (pointer and not pointer.startswith("/")):
+            raise ValueError(f"Chemin json invalide: {pointer!r}")
+        if pointer == "":
+            return []
+        return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+    # Returns the relationships of json_class, by json key ("liste_clients",
+    # "table_ligne_commandes", or the name of a ONE_TO_ONE relationship)
+    def get_relation_keys(self, json_class: JSONClass) -> dict:
+        relation_keys = self.relation_keys.get(json_class.name)
+        if relation_keys is None:
+            relation_keys = {relation.json_key(): relation for relation in json_class.relationships.values()}
+            self.relation_keys[json_class.name] = relation_keys
+        return relation_keys
+
+
+    # Follows the tokens of a path from top_object, and returns the location they
+    # lead to, a tuple (object, json class, relation, via):
+    #   - for an object, relation is None, and via is (owner, owner class,
+    #     relation, key) when the object is an element of a collection
+    #   - for the collection of a ONE_TO_MANY relationship, object is its owner
+    def locate(self, top_object: object, tokens: list) -> tuple:
+        location = (top_object, self.top_class, None, None)
+        for token in tokens:
+            an_object, json_class, relation, via = location
+            if relation is None:
+                relation = self.get_relation_keys(json_class).get(token)
+                if relation is None:
+                    raise ValueError(f"'{token}' n'est pas une relation de la classe '{json_class.name}'")
+                location = (an_object, json_class, relation, None)
+                if relation.multiplicity == Relationship.ONE_TO_ONE:
+                    related_object = getattr(an_object, relation.name)
+                    if related_object is None:
+                        raise ValueError(f"La relation '{token}' de '{json_class.name}' est vide")
+                    location = (related_object, json_class.get_related_class(relation.destination_entity), None, None)
+            else:
+                key, element = self.get_element(an_object, json_class, relation, token)
+                location = (element, json_class.get_related_class(relation.destination_entity), None, (an_object, json_class, relation, key))
+        return location
+
+
+    # Returns the key (the value of the index field, or the position) and the
+    # element designated by 'token' in the collection of a relationship
+    def get_element(self, owner: object, owner_class: JSONClass, relation: Relationship, token: str) -> tuple:
+        related_class = owner_class.get_related_class(relation.destination_entity)
+        if relation.is_indexed():
+            key = self.get_value(related_class, relation.index_field, token)
+            element = getattr(owner, f"get_{relation.name}_with_{relation.index_field}")(key)
+        elif "=" in token:
+            field_name, _, token = token.partition("=")
+            if field_name not in related_class.attributes:
+                raise ValueError(f"L'attribut '{field_name}' n'existe pas dans la classe '{related_class.name}'")
+            value = self.get_value(related_class, field_name, token)
+            if relation.secondary_indexes.get(field_name):
+                element = getattr(owner, f"find_{relation.name}_by_{field_name}")(value)
+            else:
+                element = next((element for element in getattr(owner, relation.json_key()) if getattr(element, field_name) == value), None)
+            key = None
+        else:
+            collection = getattr(owner, relation.json_key())
+            key = self.get_position(collection, token)
+            element = collection[key] if key < len(collection) else None
+        if element is None:
+            raise ValueError(f"Pas d'élément '{token}' dans '{relation.json_key()}' de '{owner_class.name}'")
+        return key, element
+
+
+    # Returns the position of an element of a list: its key, for a positional
+    # token, or the position found by a scan, for an "<attribute>=<value>"
+    # selector (the key is then None)
+    @staticmethod
+    def get_element_position(collection, key, element) -> int:
+        if key is not None:
+            return key
+        return next(position for position, other in enumerate(collection) if other is element or other == element)
+
+
+    # Converts a token of a path to the type of an attribute
+    def get_value(self, json_class: JSONClass, attribute_name: str, token: str):
+        attribute_type = json_class.attributes.get(attribute_name)
+        try:
+            if attribute_type == 'int':
+                return int(token)
+            if attribute_type == 'float':
+                return float(token)
+        except ValueError:
+            raise ValueError(f"'{token}' n'est pas une valeur de '{attribute_name}' ({attribute_type})")
+        return token
+
+
+    # Converts a token to a position in a list ("-" is the position after the end)
+    @staticmethod
+    def get_position(collection, token: str) -> int:
+        if token == "-":
+            return len(collection)
+        if not token.isdigit() or (token != "0" and token.startswith("0")):
+            raise ValueError(f"Position invalide dans une liste: '{token}'")
+        return int(token)
+
+
+    # Returns the json value at the end of a path
+    def get(self, top_object: object, tokens: list):
+        if not tokens:
+            return top_object.to_json()
+        an_object, json_class, relation, via = self.locate(top_object, tokens[:-1])
+        token = tokens[-1]
+        if relation is not None:
+            return self.get_element(an_object, json_class, relation, token)[1].to_json()
+        if token in json_class.attributes:
+            return getattr(an_object, token)
+        relation = self.get_relation_keys(json_class).get(token)
+        if relation is None:
+            raise ValueError(f"'{token}' n'est pas un membre de la classe '{json_class.name}'")
+        related = getattr(an_object, relation.json_key())
+        if relation.multiplicity == Relationship.ONE_TO_ONE:
+            return None if related is None else related.to_json()
+        if relation.is_indexed():
+            return {key: element.to_json() for key, element in related.items()}
+        return [element.to_json() for element in related]
+
+
+    def add(self, top_object: object, tokens: list, value):
+        if not tokens:
+            raise ValueError("Le patch ne peut pas remplacer l'objet racine: il faut recharger le document")
+        an_object, json_class, relation, via = self.locate(top_object, tokens[:-1])
+        token = tokens[-1]
+        if relation is None:
+            self.set_member(an_object, json_class, token, value, via)
+        elif relation.is_indexed():
+            self.add_element(an_object, json_class, relation, self.get_fragment(json_class, relation, token, value))
+        else:
+            position = self.get_position(getattr(an_object, relation.json_key()), token)
+            self.insert_element(an_object, json_class, relation, position, value)
+
+
+    def remove(self, top_object: object, tokens: list):
+        if not tokens:
+            raise ValueError("Le patch ne peut pas retirer l'objet racine")
+        an_object, json_class, relation, via = self.locate(top_object, tokens[:-1])
+        token = tokens[-1]
+        if relation is None:
+            # un membre d'un objet généré existe toujours: il est vidé
+            self.set_member(an_object, json_class, token, None, via)
+        else:
+            key, element = self.get_element(an_object, json_class, relation, token)
+            self.remove_element(an_object, relation, key, element)
+
+
+    def replace(self, top_object: object, tokens: list, value):
+        if not tokens:
+            raise ValueError("Le patch ne peut pas remplacer l'objet racine: il faut recharger le document")
+        an_object, json_class, relation, via = self.locate(top_object, tokens[:-1])
+        token = tokens[-1]
+        if relation is None:
+            self.set_member(an_object, json_class, token, value, via)
+            return
+        key, element = self.get_element(an_object, json_class, relation, token)
+        if relation.is_indexed():
+            # l'adder remplace l'élément de même clé
+            self.add_element(an_object, json_class, relation, self.get_fragment(json_class, relation, token, value))
+        else:
+            collection = getattr(an_object, relation.json_key())
+            position = self.get_element_position(collection, key, element)
+            # le nouvel élément est créé avant toute modification: un remplacement qui échoue laisse la liste intacte
+            new_element = self.create_element(json_class, relation, value)
+            if relation.storage == Relationship.COLUMNS:
+                # la ligne est remplacée sur place
+                for attribute_name in collection.columns:
+                    collection.set_value(element.position, attribute_name, new_element.get(attribute_name))
+                return
+            if position < len(collection) - 1 and not isinstance(collection, list):
+                raise ValueError(f"'{relation.json_key()}' de '{json_class.name}' n'accepte des ajouts qu'à la fin")
+            self.remove_element(an_object, relation, key, element)
+            self.append_element(an_object, relation, new_element)
+            if position < len(collection) - 1:
+                collection.insert(position, collection.pop())
+
+
+    # Returns the fragment of a new element of a table: its index field, when
+    # it is given, must be the key of the path
+    def get_fragment(self, json_class: JSONClass, relation: Relationship, token: str, value) -> dict:
+        if not isinstance(value, dict):
+            raise ValueError(f"Un élément de '{relation.json_key()}' doit être un objet json")
+        key = self.get_value(json_class.get_related_class(relation.destination_entity), relation.index_field, token)
+        if relation.index_field not in value:
+            return dict(value, **{relation.index_field: key})
+        if value[relation.index_field] != key:
+            raise ValueError(f"Le champ '{relation.index_field}' ({value[relation.index_field]!r}) ne correspond pas à la clé '{token}'")
+        return value
+
+
+    # Creates the element of a fragment, and adds it to the collection of a
+    # relationship
+    def add_element(self, owner: object, owner_class: JSONClass, relation: Relationship, fragment: dict):
+        self.append_element(owner, relation, self.create_element(owner_class, relation, fragment))
+
+
+    # Creates the element of a fragment, without adding it to the collection:
+    # for a relationship stored column-wise, the element is the fragment itself
+    def create_element(self, owner_class: JSONClass, relation: Relationship, fragment):
+        if not isinstance(fragment, dict):
+            raise ValueError(f"Un élément de '{relation.json_key()}' doit être un objet json")
+        if relation.storage == Relationship.COLUMNS:
+            return fragment
+        return owner_class.get_related_class(relation.destination_entity).get_factory()(fragment)
+
+
+    # Adds an element to the collection of a relationship through the generated
+    # adder (the fragment is appended to the columns of a relationship stored
+    # column-wise)
+    def append_element(self, owner: object, relation: Relationship, element):
+        if relation.storage == Relationship.COLUMNS:
+            getattr(owner, relation.json_key()).append_json(element)
+        else:
+            getattr(owner, "add_" + relation.name)(element)
+
+
+    # Adds an element to a list at a given position (None: at the end). The
+    # adder appends it: it is then moved, in a python list only
+    def insert_element(self, owner: object, owner_class: JSONClass, relation: Relationship, position: int, fragment):
+        collection = getattr(owner, relation.json_key())
+        length = len(collection)
+        if position is not None and position > length:
+            raise ValueError(f"Position {position} hors de '{relation.json_key()}' ({length} éléments)")
+        if position is not None and position < length and not isinstance(collection, list):
+            raise ValueError(f"'{relation.json_key()}' de '{owner_class.name}' n'accepte des ajouts qu'à la fin")
+        self.add_element(owner, owner_class, relation, fragment)
+        if position is not None and position < length:
+            collection.insert(position, collection.pop())
+
+
+    def remove_element(self, owner: object, relation: Relationship, key, element: object):
+        if relation.is_indexed():
+            getattr(owner, f"remove_{relation.name}_with_{relation.index_field}")(getattr(element, relation.index_field))
+        else:
+            getattr(owner, "remove_" + relation.name)(element)
+
+
+    # Removes all the elements of a collection, through the generated removers
+    def clear_collection(self, owner: object, relation: Relationship):
+        collection = getattr(owner, relation.json_key())
+        if relation.is_indexed():
+            remover = getattr(owner, f"remove_{relation.name}_with_{relation.index_field}")
+            for key in list(collection.keys()):
+                remover(key)
+        else:
+            remover = getattr(owner, "remove_" + relation.name)
+            if relation.storage == Relationship.COLUMNS:
+                # les lignes retirées d'un ColumnStore restent valides jusqu'à son compactage
+                for element in list(collection):
+                    remover(element)
+                return
+            # le premier élément est trouvé, et retiré, sans parcourir la liste
+            while len(collection):
+                remover(collection[0])
+
+
+    # Sets a member (attribute or relationship) of an object to a json value
+    def set_member(self, an_object: object, json_class: JSONClass, name: str, value, via: tuple):
+        if name in json_class.attributes:
+            self.set_attribute(an_object, json_class, name, value, via)
+            return
+        relation = self.get_relation_keys(json_class).get(name)
+        if relation is None:
+            raise ValueError(f"'{name}' n'est pas un membre de la classe '{json_class.name}'")
+        related_class = json_class.get_related_class(relation.destination_entity)
+        if relation.multiplicity == Relationship.ONE_TO_ONE:
+            setattr(an_object, relation.name, None if value is None else related_class.get_factory()(value))
+            return
+        # une collection est remplacée au complet
+        self.clear_collection(an_object, relation)
+        if relation.is_indexed():
+            for token, fragment in (value or {}).items():
+                self.add_element(an_object, json_class, relation, self.get_fragment(json_class, relation, str(token), fragment))
+        else:
+            for fragment in value or ():
+                self.insert_element(an_object, json_class, relation, None, fragment)
+
+
+    # Sets an attribute of an object. When the object is an element of a
+    # collection that is indexed by this attribute (index field, or secondary
+    # index), it is removed from the collection and added again, so that the
+    # indexes follow the new value
+    def set_attribute(self, an_object: object, json_class: JSONClass, name: str, value, via: tuple):
+        if via is None:
+            setattr(an_object, name, value)
+            return
+        owner, owner_class, relation, key = via
+        if name != relation.index_field and name not in relation.secondary_indexes:
+            setattr(an_object, name, value)
+            return
+        collection = getattr(owner, relation.json_key())
+        if relation.storage == Relationship.COLUMNS:
+            # une ligne n'existe plus une fois retirée: elle est ajoutée de nouveau à partir de ses valeurs
+            fragment = an_object.to_json()
+            fragment[name] = value
+            self.remove_element(owner, relation, key, an_object)
+            collection.append_json(fragment)
+            return
+        position = self.get_element_position(collection, key, an_object) if isinstance(collection, list) else None
+        self.remove_element(owner, relation, key, an_object)
+        setattr(an_object, name, value)
+        getattr(owner, "add_" + relation.name)(an_object)
+        if position is not None and position < len(collection) - 1:
+            collection.insert(position, collection.pop())
+
+
+    # Merges a merge patch into an object (see apply_merge)
+    def merge_object(self, an_object: object, json_class: JSONClass, merge_patch: dict, via: tuple):
+        if not isinstance(merge_patch, dict):
+            raise ValueError(f"Le patch d'un objet '{json_class.name}' doit être un objet json")
+        for name, value in merge_patch.items():
+            relation = self.get_relation_keys(json_class).get(name)
+            if relation is None or value is None:
+                self.set_member(an_object, json_class, name, value, via)
+            elif relation.multiplicity == Relationship.ONE_TO_ONE:
+                related_object = getattr(an_object, relation.name)
+                if related_object is None:
+                    self.set_member(an_object, json_class, name, json_patch.strip_nulls(value), via)
+                else:
+                    self.merge_object(related_object, json_class.get_related_class(relation.destination_entity), value, None)
+            elif relation.is_indexed() and isinstance(value, dict):
+                self.merge_table(an_object, json_class, relation, value)
+            else:
+                # une liste est remplacée au complet (RFC 7396)
+                self.set_member(an_object, json_class, name, value, via)
+
+
+    # Merges the elements of a table patch one by one: null removes the element
+    # of the key, a fragment is merged into the element, or creates it
+    def merge_table(self, owner: object, owner_class: JSONClass, relation: Relationship, merge_patch: dict):
+        related_class = owner_class.get_related_class(relation.destination_entity)
+        accessor = getattr(owner, f"get_{relation.name}_with_{relation.index_field}")
+        for token, element_patch in merge_patch.items():
+            key = self.get_value(related_class, relation.index_field, str(token))
+            element = accessor(key)
+            if element_patch is None:
+                if element is not None:
+                    self.remove_element(owner, relation, key, element)
+            elif element is None:
+                self.add_element(owner, owner_class, relation, self.get_fragment(owner_class, relation, str(token), json_patch.strip_nulls(element_patch)))
+            elif relation.storage == Relationship.COLUMNS:
+                # une ligne est remplacée par ses valeurs fusionnées (sa classe n'a que des attributs)
+                fragment = element.to_json()
+                fragment.update(element_patch)
+                self.remove_element(owner, relation, key, element)
+                getattr(owner, relation.json_key()).append_json(fragment)
+            else:
+                self.merge_object(element, related_class, element_patch, (owner, owner_class, relation, key))
+
+
+    # A merge patch that creates an object is merged into an empty object: its
+    # null members are dropped
+    @staticmethod
+    def strip_nulls(value):
+        if not isinstance(value, dict):
+            return value
+        return {name: json_patch.strip_nulls(member) for name, member in value.items() if member is not None}
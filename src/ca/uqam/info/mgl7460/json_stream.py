@@ -0,0 +1,139 @@
+import json
+
+class json_stream_reader:
+
+    # Ce lecteur parcourt un fichier json de façon incrémentale, sans
+    # jamais charger le document au complet en mémoire.
+    #
+    # Le document racine doit être un objet json. Le lecteur produit des
+    # "événements" pour chacun de ses membres:
+    #   ('value', key, None, value)       un attribut simple ou un objet imbriqué
+    #   ('start_list', key, None, None)   début d'une liste (relation "liste_")
+    #   ('start_table', key, None, None)  début d'une table (relation "table_")
+    #   ('item', key, item_key, item)     un élément d'une liste ou d'une table
+    #   ('end', key, None, None)          fin de la liste ou de la table
+    #
+    # Chaque élément d'une collection de premier niveau est décodé d'un
+    # seul coup (avec le décodeur C de la librairie standard), puis oublié
+    # par le lecteur: la mémoire utilisée est donc de l'ordre de la taille
+    # du tampon de lecture plus celle du plus gros élément.
+    def __init__(self, json_file, chunk_size: int = 65536):
+        self.json_file = json_file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+
+    # Reads at least 'size' more characters from the file, dropping the part
+    # of the buffer that has already been consumed. Returns False once the
+    # end of the file has been reached
+    def fill(self, size: int = None) -> bool:
+        if self.eof:
+            return False
+        chunk = self.json_file.read(max(size or 0, self.chunk_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+
+    # Skips white space, and returns the next significant character without
+    # consuming it ('' at the end of the file)
+    def peek(self) -> str:
+        while True:
+            buffer = self.buffer
+            position = self.position
+            while position < len(buffer) and buffer[position] in " \t\n\r":
+                position += 1
+            self.position = position
+            if position < len(buffer):
+                return buffer[position]
+            if not self.fill():
+                return ''
+
+
+    def expect(self, character: str):
+        found = self.peek()
+        if found != character:
+            raise ValueError(f"'{character}' attendu à la position {self.position}, '{found}' trouvé")
+        self.position += 1
+
+
+    # Decodes the json value starting at the current position. If the buffer
+    # does not contain the whole value, we read more data and try again,
+    # doubling the amount read each time so that large values are decoded
+    # in amortized linear time
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # un nombre qui termine le tampon pourrait continuer dans le bloc suivant
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill(len(self.buffer) - self.position)
+
+
+    # Generates the events for the members of the root object
+    def events(self):
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(':')
+            opening = self.peek()
+            if opening == '[':
+                self.position += 1
+                yield ('start_list', key, None, None)
+                yield from self.list_items(key)
+                yield ('end', key, None, None)
+            elif opening == '{' and key.startswith("table_"):
+                self.position += 1
+                yield ('start_table', key, None, None)
+                yield from self.table_items(key)
+                yield ('end', key, None, None)
+            else:
+                yield ('value', key, None, self.decode_value())
+            if self.peek() == ',':
+                self.position += 1
+            else:
+                self.expect('}')
+                return
+
+
+    def list_items(self, key: str):
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield ('item', key, None, self.decode_value())
+            if self.peek() == ',':
+                self.position += 1
+            else:
+                self.expect(']')
+                return
+
+
+    def table_items(self, key: str):
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            item_key = self.decode_value()
+            self.expect(':')
+            yield ('item', key, item_key, self.decode_value())
+            if self.peek() == ',':
+                self.position += 1
+            else:
+                self.expect('}')
+                return
@@ -0,0 +1,117 @@
+import logging
+import os
+import time
+from ca.uqam.info.mgl7460.json_loader import json_loader
+
+logger = logging.getLogger(__name__)
+
+class json_watcher:
+
+    # Un json_watcher surveille un fichier de données json (par la date de
+    # modification et la taille du fichier, lues à intervalle régulier), et
+    # recharge le graphe d'objets chaque fois que le fichier change.
+    #
+    # À chaque changement, le schéma est inféré de nouveau, par un nouveau
+    # json_loader (créé avec les options données), mais seules les classes
+    # dont le schéma a changé sont régénérées: elles sont rechargées avec
+    # importlib.reload, avec les classes qui y font référence, et les autres
+    # classes gardent leur code déjà chargé (voir json_loader.reload_classes).
+    # La durée du rechargement de chaque classe est conservée dans
+    # reload_times, et tracée au niveau INFO
+    #
+    # projection est un masque imbriqué (voir json_loader.project), et options
+    # les autres arguments du constructeur de json_loader (sample_size,
+    # use_slots, lazy, intern, parser)
+    def __init__(self, data_directory: str, input_data_file_name: str, code_output_directory: str, in_memory: bool = False,
+                 projection: dict = None, **options):
+        self.data_directory = data_directory
+        self.input_data_file_name = input_data_file_name
+        self.code_output_directory = code_output_directory
+        self.in_memory = in_memory
+        self.projection = projection
+        self.options = options
+        self.hooks = []
+        # date de modification et taille du fichier lors du dernier chargement
+        self.signature = None
+        self.loader = None
+        self.top_class = None
+        self.top_object = None
+        self.reload_times = dict()
+
+
+    # Adds a hook to the loaders of the watcher (see json_loader.add_hook)
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+
+    def get_signature(self) -> tuple:
+        file_stat = os.stat(self.data_directory + '/' + self.input_data_file_name)
+        return file_stat.st_mtime_ns, file_stat.st_size
+
+
+    # Tells whether the data file changed since the last load. A file that
+    # cannot be read (e.g. deleted, or renamed while it is rewritten) has not
+    # changed yet: it is looked at again at the next poll
+    def has_changed(self) -> bool:
+        try:
+            return self.get_signature() != self.signature
+        except OSError:
+            return False
+
+
+    # Loads the data file: infers the schema, reloads the classes whose schema
+    # changed since the previous load, and creates the object graph. Returns
+    # the top object
+    def refresh(self):
+        # la signature est lue avant le fichier: une modification pendant le chargement sera vue
+        signature = self.get_signature()
+        loader = json_loader(self.code_output_directory, **self.options)
+        for hook in self.hooks:
+            loader.add_hook(hook)
+        loader.read_data(self.data_directory, self.input_data_file_name)
+        top_class = loader.build_class(loader.top_class_name, loader.jsobjet)
+        if self.projection is not None:
+            loader.project(top_class, self.projection)
+        self.reload_times = loader.reload_classes(self.loader, self.in_memory)
+        self.top_object = loader.create_object(top_class)
+        self.loader = loader
+        self.top_class = top_class
+        self.signature = signature
+        logger.info("%s loaded, %d classes reloaded: %s", self.input_data_file_name, len(self.reload_times),
+                    ", ".join(f"{name} ({seconds * 1000:.3f} ms)" for name, seconds in self.reload_times.items()))
+        return self.top_object
+
+
+    # Polls the data file every 'interval' seconds, and reloads it each time it
+    # changes (and once at the start), calling on_change with the new top
+    # object. A load that fails (e.g. a file being written) is retried at the
+    # next change, and the previous object graph is kept (if the file has
+    # disappeared meanwhile, the load is retried when it is back). Stops after
+    # max_changes reloads (never, if None)
+    def watch(self, on_change=None, interval: float = 1.0, max_changes: int = None):
+        changes = 0
+        while True:
+            if self.has_changed():
+                try:
+                    top_object = self.refresh()
+                except (ValueError, OSError) as error:
+                    logger.warning("Reload of %s failed: %s", self.input_data_file_name, error)
+                    try:
+                        self.signature = self.get_signature()
+                    except OSError:
+                        # le fichier a disparu: il sera rechargé dès qu'il réapparaîtra
+                        self.signature = None
+                else:
+                    changes += 1
+                    if on_change is not None:
+                        on_change(top_object)
+            if max_changes is not None and changes >= max_changes:
+                return self.top_object
+            time.sleep(interval)
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO)
+    watcher = json_watcher("./data", "boutique.json", "./src/ca/uqam/info/mgl7460/generated")
+    watcher.watch(lambda top_object: print("\n\nTop object: " + top_object.to_string(max_items=10)))
@@ -0,0 +1,29 @@
+import json
+
+class loader_metrics:
+
+    # Un crochet ("hook") de json_loader qui accumule les mesures du loader:
+    # la durée totale de chaque phase (en secondes), et la valeur totale de
+    # chaque compteur. On l'installe avec json_loader.add_hook, puis on
+    # exporte ses mesures avec to_json (ou on les lit directement)
+    #
+    # Un crochet est un simple callable: on peut aussi passer à add_hook sa
+    # propre fonction, pour envoyer les mesures vers un autre système
+    def __init__(self):
+        self.phases = dict()
+        self.counters = dict()
+
+
+    # Receives a measure from the loader: kind is "phase" (value is a duration
+    # in seconds) or "counter" (value is an increment)
+    def __call__(self, kind: str, name: str, value):
+        measures = self.phases if kind == "phase" else self.counters
+        measures[name] = measures.get(name, 0) + value
+
+
+    def to_json(self) -> dict:
+        return {"phases": dict(self.phases), "counters": dict(self.counters)}
+
+
+    def __str__(self) -> str:
+        return json.dumps(self.to_json(), indent=2, ensure_ascii=False)
@@ -0,0 +1,289 @@
+from array import array
+import json
+
+# NumPy est optionnel: sans lui, les colonnes numériques restent des
+# array.array, et les agrégats utilisent les fonctions de base de python
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class ColumnStore:
+
+    # Type codes of the array.array used for the numeric attributes. The other
+    # attributes (str, bool, object...) are stored in plain lists
+    TYPECODES = {'int': 'q', 'float': 'd'}
+
+    # A ColumnStore holds the objects of a ONE_TO_MANY relationship column-wise:
+    # one column per attribute of the destination class. It can replace the
+    # list (or the dictionary, if index_field is given) of the relationship in
+    # the generated code: it offers the same operations, but returns ColumnRow
+    # views instead of objects.
+    #
+    # A removed row is only marked as removed (its position is kept in
+    # 'removed'), so that a removal takes constant time, and the rows obtained
+    # before stay valid. The columns are compacted lazily: before the
+    # operations that need contiguous columns (access by position, column and
+    # aggregates), and by an append once the removed rows outnumber the others.
+    # Rows are therefore addressed by their position in the columns, which can
+    # differ from their rank until the next compaction
+    def __init__(self, class_name: str, attribute_types: dict, index_field: str = None):
+        self.class_name = class_name
+        self.attribute_types = attribute_types
+        self.columns = dict()
+        for attribute_name, attribute_type in attribute_types.items():
+            typecode = ColumnStore.TYPECODES.get(attribute_type)
+            self.columns[attribute_name] = array(typecode) if typecode else []
+        self.index_field = index_field
+        # position de chaque ligne, par valeur du champ d'indexation
+        self.index = dict() if index_field else None
+        # nombre de lignes, sans les lignes retirées
+        self.length = 0
+        self.removed = set()
+
+
+    # Appends a value to a column. A numeric column that receives a value it
+    # cannot hold (None, a float in an int column, or an int too large for
+    # 64 bits) becomes a list
+    def append_value(self, attribute_name: str, value: object):
+        column = self.columns[attribute_name]
+        try:
+            column.append(value)
+        except (TypeError, OverflowError):
+            column = self.columns[attribute_name] = list(column)
+            column.append(value)
+
+
+    # Appends a row built from a json fragment (used by the generated from_json
+    # factories: no object of the destination class is created)
+    def append_json(self, json_fragment: dict):
+        if len(self.removed) > self.length:
+            self.compact()
+        get = json_fragment.get
+        if self.index is not None:
+            position = self.index.get(get(self.index_field))
+            # comme dans un dictionnaire, une clé existante est remplacée
+            if position is not None:
+                for attribute_name in self.columns:
+                    self.set_value(position, attribute_name, get(attribute_name))
+                return
+            self.index[get(self.index_field)] = self.length + len(self.removed)
+        for attribute_name in self.columns:
+            self.append_value(attribute_name, get(attribute_name))
+        self.length += 1
+
+
+    # Appends a row built from the attributes of an object (or of a row: its
+    # values are read before append_json compacts the columns)
+    def append(self, an_object: object):
+        self.append_json({attribute_name: getattr(an_object, attribute_name, None) for attribute_name in self.columns})
+
+
+    # Removes the row at a given position of the columns, in constant time:
+    # the row is only marked as removed
+    def remove_position(self, position: int):
+        self.removed.add(position)
+        self.length -= 1
+        if self.index is not None:
+            del self.index[self.columns[self.index_field][position]]
+
+
+    # Drops the removed rows from the columns. The ColumnRow views obtained
+    # before are no longer valid
+    def compact(self):
+        if not self.removed:
+            return
+        removed = self.removed
+        kept = [position for position in range(self.length + len(removed)) if position not in removed]
+        for attribute_name, column in self.columns.items():
+            compacted = [column[position] for position in kept]
+            self.columns[attribute_name] = array(column.typecode, compacted) if isinstance(column, array) else compacted
+        self.removed = set()
+        if self.index is not None:
+            key_column = self.columns[self.index_field]
+            self.index = {key_column[position]: position for position in range(self.length)}
+
+
+    def row(self, position: int):
+        return ColumnRow(self, position)
+
+
+    def __len__(self) -> int:
+        return self.length
+
+
+    # Like a list (or a dictionary, if the store is indexed), the store is
+    # iterated over its rows (or its keys)
+    def __iter__(self):
+        if self.index is not None:
+            return iter(self.index)
+        removed = self.removed
+        return (ColumnRow(self, position) for position in range(self.length + len(removed)) if position not in removed)
+
+
+    def __getitem__(self, key):
+        if self.index is not None:
+            return ColumnRow(self, self.index[key])
+        self.compact()
+        if key < 0:
+            key += self.length
+        if not 0 <= key < self.length:
+            raise IndexError(f"Position {key} hors du {self.class_name} ColumnStore")
+        return ColumnRow(self, key)
+
+
+    def __contains__(self, key) -> bool:
+        if self.index is not None:
+            return key in self.index
+        return (isinstance(key, ColumnRow) and key.store is self and 0 <= key.position < self.length + len(self.removed)
+                and key.position not in self.removed)
+
+
+    # Operations of the unindexed (list-like) stores. Only a row of the store
+    # can be removed: an object of the destination class, or a row already
+    # removed, raises a ValueError (the generated remover does not test the
+    # membership first, unlike the remover of a list)
+    def remove(self, row):
+        if row not in self:
+            raise ValueError(f"La ligne {row} n'est pas dans le ColumnStore de {self.class_name}")
+        self.remove_position(row.position)
+
+
+    # Operations of the indexed (dictionary-like) stores
+    def __setitem__(self, key, an_object: object):
+        if key in self.index:
+            position = self.index[key]
+            for attribute_name in self.columns:
+                self.set_value(position, attribute_name, getattr(an_object, attribute_name, None))
+        else:
+            self.append(an_object)
+
+
+    def pop(self, key):
+        row = self[key]
+        values = {attribute_name: getattr(row, attribute_name) for attribute_name in self.columns}
+        self.remove_position(row.position)
+        return values
+
+
+    def get(self, key, default=None):
+        position = self.index.get(key)
+        return default if position is None else ColumnRow(self, position)
+
+
+    def keys(self):
+        return self.index.keys()
+
+
+    def values(self):
+        return (ColumnRow(self, position) for position in self.index.values())
+
+
+    def items(self):
+        return ((key, ColumnRow(self, position)) for key, position in self.index.items())
+
+
+    def set_value(self, position: int, attribute_name: str, value: object):
+        column = self.columns[attribute_name]
+        try:
+            column[position] = value
+        except (TypeError, OverflowError):
+            column = self.columns[attribute_name] = list(column)
+            column[position] = value
+
+
+    # Returns the values of an attribute for all the rows: a NumPy array (a copy)
+    # for a numeric column when NumPy is installed, the column itself otherwise
+    def column(self, attribute_name: str):
+        self.compact()
+        column = self.columns[attribute_name]
+        if numpy is not None and isinstance(column, array):
+            return numpy.array(column)
+        return column
+
+
+    # Vectorized aggregates over a numeric column. With NumPy, the computation
+    # works directly on the buffer of the array.array, without copying it
+    def sum(self, attribute_name: str):
+        self.compact()
+        column = self.columns[attribute_name]
+        if numpy is not None and isinstance(column, array):
+            return numpy.frombuffer(column, dtype=column.typecode).sum().item()
+        return sum(column)
+
+
+    def mean(self, attribute_name: str) -> float:
+        if self.length == 0:
+            raise ValueError(f"Moyenne de '{attribute_name}' sur un ColumnStore vide")
+        return self.sum(attribute_name) / self.length
+
+
+    def min(self, attribute_name: str):
+        self.compact()
+        column = self.columns[attribute_name]
+        if numpy is not None and isinstance(column, array):
+            return numpy.frombuffer(column, dtype=column.typecode).min().item()
+        return min(column)
+
+
+    def max(self, attribute_name: str):
+        self.compact()
+        column = self.columns[attribute_name]
+        if numpy is not None and isinstance(column, array):
+            return numpy.frombuffer(column, dtype=column.typecode).max().item()
+        return max(column)
+
+
+class ColumnRow:
+
+    __slots__ = ("store", "position")
+
+    # A lightweight view on one row of a ColumnStore, giving object-style
+    # access to its attributes. A view refers to a position: it is no longer
+    # valid once the store has been compacted (see ColumnStore.compact)
+    def __init__(self, store: ColumnStore, position: int):
+        object.__setattr__(self, "store", store)
+        object.__setattr__(self, "position", position)
+
+
+    def __getattr__(self, attribute_name: str):
+        try:
+            return self.store.columns[attribute_name][self.position]
+        except KeyError:
+            raise AttributeError(f"L'attribut '{attribute_name}' n'existe pas dans la classe '{self.store.class_name}'.")
+
+
+    def __setattr__(self, attribute_name: str, value: object):
+        if attribute_name not in self.store.columns:
+            raise AttributeError(f"L'attribut '{attribute_name}' n'existe pas dans la classe '{self.store.class_name}'.")
+        self.store.set_value(self.position, attribute_name, value)
+
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ColumnRow) and other.store is self.store and other.position == self.position
+
+
+    def __hash__(self) -> int:
+        return hash((id(self.store), self.position))
+
+
+    # Same layout as the to_json and write_json methods of the generated classes
+    def to_json(self) -> dict:
+        return {name: column[self.position] for name, column in self.store.columns.items()}
+
+
+    def write_json(self, stream, parts: list = None):
+        if parts is None:
+            stream.write(json.dumps(self.to_json()))
+        else:
+            parts.append(json.dumps(self.to_json()))
+
+
+    # Same format as the __str__ and str_parts methods of the generated classes
+    def str_parts(self, parts: list, max_depth: int = None, max_items: int = None, stream=None):
+        parts.append(self.__str__())
+
+
+    def __str__(self) -> str:
+        values = ", ".join(f"{name} = {column[self.position]}" for name, column in self.store.columns.items())
+        return f"{self.store.class_name}[{values}]"
@@ -0,0 +1,140 @@
+from ca.uqam.info.mgl7460.meta.relationship import Relationship
+
+class FactoryCompiler:
+
+    # A FactoryCompiler builds, at run time, factories specialized for one load:
+    # functions that create the object of a class from a json fragment, like
+    # the generated from_json factories, but that test the fragments of the
+    # related objects against predicates before creating them. A related
+    # object whose fragment does not satisfy its predicate is not created, and
+    # neither are the objects of its own fragment.
+    #
+    # The predicates are functions of a json fragment (a dictionary), indexed by:
+    #   - the name of a class ("produit"): they apply to all its objects
+    #   - a path of relationship names from the top class ("client.commande"):
+    #     they apply to the objects reached through that path only. A single
+    #     name that is not the name of a class is the path of a relationship of
+    #     the top class
+    # A name that is neither (e.g. a misspelled path) raises a ValueError when
+    # the factory is compiled, rather than being silently ignored.
+    #
+    # A specialized function is generated for a class only when predicates
+    # apply below it; elsewhere, the generated from_json factories are used.
+    # The functions are written in python, like the generated classes, and
+    # compiled with exec
+    def __init__(self, predicates: dict):
+        self.class_predicates = {name: predicate for name, predicate in predicates.items() if "." not in name}
+        self.path_predicates = {tuple(name.split(".")): predicate for name, predicate in predicates.items() if "." in name}
+        # variables of the compiled code: classes, factories and predicates
+        self.namespace = dict()
+        # name of the specialized function of each (class name, path) node
+        self.functions = dict()
+        self.source = []
+
+
+    # Returns the factory of top_class, specialized for the predicates. A
+    # predicate of the top class itself is not applied (see json_loader.create_object_filtered)
+    def compile(self, top_class):
+        self.check_predicates(top_class)
+        factory = self.get_factory(top_class, ())
+        code = compile("".join(self.source), "<compiled factories of " + top_class.fully_qualified_name() + ">", "exec")
+        exec(code, self.namespace)
+        return self.namespace[factory]
+
+
+    # Checks the names of the predicates against the classes reachable from
+    # top_class, and their paths against the relationships
+    def check_predicates(self, top_class):
+        class_names = set()
+        pending = [top_class]
+        while pending:
+            json_class = pending.pop()
+            if json_class.name not in class_names:
+                class_names.add(json_class.name)
+                pending.extend(json_class.get_related_class(relation.destination_entity) for relation in json_class.relationships.values())
+        for name in list(self.class_predicates):
+            if name not in class_names:
+                if name not in top_class.relationships:
+                    raise ValueError(f"'{name}' n'est ni une classe ni une relation de la classe '{top_class.name}'")
+                self.path_predicates[(name,)] = self.class_predicates.pop(name)
+        for path in self.path_predicates:
+            json_class = top_class
+            for relation_name in path:
+                relation = json_class.relationships.get(relation_name)
+                if relation is None:
+                    raise ValueError(f"Chemin '{'.'.join(path)}': '{relation_name}' n'est pas une relation de la classe '{json_class.name}'")
+                json_class = json_class.get_related_class(relation.destination_entity)
+
+
+    # Returns the predicate (or None) of the objects of json_class reached by
+    # 'path': the predicate of the class and the one of the path must both hold
+    def get_predicate(self, json_class, path: tuple):
+        class_predicate = self.class_predicates.get(json_class.name)
+        path_predicate = self.path_predicates.get(path)
+        if class_predicate is None or path_predicate is None:
+            return class_predicate or path_predicate
+        return lambda json_fragment: class_predicate(json_fragment) and path_predicate(json_fragment)
+
+
+    # A path that is no prefix of a path predicate leads to the same objects as
+    # any other such path: the nodes below it are shared (path None)
+    def get_node_path(self, path: tuple):
+        if path is None or not any(predicate_path[:len(path)] == path for predicate_path in self.path_predicates):
+            return None
+        return path
+
+
+    # Tells whether a predicate applies to objects created from the objects of
+    # json_class reached by 'path'. 'visiting' protects against recursive
+    # relationships
+    def has_predicates_below(self, json_class, path: tuple, visiting: set) -> bool:
+        if (json_class.name, path) in visiting:
+            return False
+        visiting.add((json_class.name, path))
+        for relation in json_class.relationships.values():
+            related_class = json_class.get_related_class(relation.destination_entity)
+            child_path = path + (relation.name,) if path is not None else None
+            if self.get_predicate(related_class, child_path) is not None:
+                return True
+            if self.has_predicates_below(related_class, self.get_node_path(child_path), visiting):
+                return True
+        return False
+
+
+    # Returns the name, in the namespace, of the factory of the objects of
+    # json_class reached by 'path', generating it if needed
+    def get_factory(self, json_class, path: tuple) -> str:
+        path = self.get_node_path(path)
+        if not self.has_predicates_below(json_class, path, set()):
+            name = f"_{json_class.name}_from_json"
+            self.namespace[name] = json_class.get_factory()
+            return name
+        node = (json_class.name, path)
+        if node in self.functions:
+            return self.functions[node]
+        name = f"_load_{json_class.name}_{len(self.functions)}"
+        # enregistré avant les relations, pour les relations récursives
+        self.functions[node] = name
+        json_class.get_factory()
+        self.namespace[f"_{json_class.name}_class"] = json_class.type
+        for attribute_name, interner in json_class.get_interners().items():
+            self.namespace[f"_intern_{json_class.name}_{attribute_name}"] = interner.intern
+
+        factories = dict()
+        predicates = dict()
+        for relation in json_class.relationships.values():
+            related_class = json_class.get_related_class(relation.destination_entity)
+            child_path = path + (relation.name,) if path is not None else None
+            predicate = self.get_predicate(related_class, child_path)
+            if predicate is not None:
+                predicates[relation.name] = f"_predicate_{len(self.namespace)}"
+                self.namespace[predicates[relation.name]] = predicate
+            if relation.storage != Relationship.COLUMNS:
+                factory = self.get_factory(related_class, child_path)
+                if factory != f"_{related_class.name}_from_json":
+                    factories[relation.name] = factory
+
+        self.source.append(f"def {name}(json_fragment):\n")
+        self.source.append(json_class.get_from_json_body(f"_{json_class.name}_class", factories, predicates, "    "))
+        self.source.append("\n\n")
+        return name
@@ -0,0 +1,98 @@
+from itertools import islice
+
+class IdentitySet:
+
+    # An IdentitySet holds the objects of an unindexed ONE_TO_MANY relationship
+    # (a "liste_" collection) in insertion order, like a list, but in a
+    # dictionary keyed by the identity (id) of the objects: adding, removing
+    # and testing the membership of an object take constant time, and never
+    # call __eq__.
+    #
+    # Unlike a list, an object is held at most once: adding an object that is
+    # already in the set does nothing. Iteration follows the insertion order
+    def __init__(self, objects=()):
+        self.objects = dict()
+        for an_object in objects:
+            self.append(an_object)
+
+
+    # The set is filled through append, like the list it replaces
+    def append(self, an_object: object):
+        self.objects[id(an_object)] = an_object
+
+
+    def add(self, an_object: object):
+        self.append(an_object)
+
+
+    # Removes an object, raising a ValueError (like list.remove) if it is not in
+    # the set
+    def remove(self, an_object: object):
+        if an_object not in self:
+            raise ValueError(f"L'objet {an_object} n'est pas dans l'IdentitySet")
+        del self.objects[id(an_object)]
+
+
+    def discard(self, an_object: object):
+        if an_object in self:
+            del self.objects[id(an_object)]
+
+
+    def clear(self):
+        self.objects.clear()
+
+
+    # An identifier may be reused once its object has been garbage collected:
+    # the object found must therefore be the object itself
+    def __contains__(self, an_object: object) -> bool:
+        return self.objects.get(id(an_object)) is an_object
+
+
+    def __iter__(self):
+        return iter(self.objects.values())
+
+
+    def __reversed__(self):
+        return reversed(self.objects.values())
+
+
+    def __len__(self) -> int:
+        return len(self.objects)
+
+
+    # Access by position, for compatibility with lists. It is linear in the
+    # position (constant for the first and the last objects)
+    def __getitem__(self, position: int):
+        length = len(self.objects)
+        if position < 0:
+            position += length
+        if not 0 <= position < length:
+            raise IndexError(f"Position {position} hors de l'IdentitySet")
+        if position == length - 1:
+            return next(reversed(self.objects.values()))
+        return next(islice(self.objects.values(), position, None))
+
+
+    # Two sets are equal if they hold the same objects, in the same order. A
+    # set is also equal to the list of its objects
+    def __eq__(self, other) -> bool:
+        if isinstance(other, IdentitySet):
+            other = list(other.objects.values())
+        if not isinstance(other, list) or len(other) != len(self.objects):
+            return False
+        return all(mine is theirs for mine, theirs in zip(self.objects.values(), other))
+
+
+    # The identifiers of the objects change when they are copied or pickled (e.g.
+    # by json_loader.create_object_parallel): only the objects are saved, and
+    # the dictionary is rebuilt with their new identifiers
+    def __getstate__(self) -> list:
+        return list(self.objects.values())
+
+
+    def __setstate__(self, objects: list):
+        self.objects = {id(an_object): an_object for an_object in objects}
+
+
+    def __repr__(self) -> str:
+        return "IdentitySet(" + repr(list(self.objects.values())) + ")"
@@ -1,13 +1,34 @@
-from io import TextIOWrapper
+from io import StringIO, TextIOWrapper
+import hashlib
 import importlib
+import json
+import logging
 
+from ca.uqam.info.mgl7460.meta.column_store import ColumnStore
+from ca.uqam.info.mgl7460.meta.identity_set import IdentitySet
+from ca.uqam.info.mgl7460.meta.memory_importer import InMemoryImporter
 from ca.uqam.info.mgl7460.meta.relationship import Relationship
+from ca.uqam.info.mgl7460.meta.value_interner import ValueInterner
+
+# Les traces de la génération sont émises au niveau DEBUG (voir json_loader)
+logger = logging.getLogger(__name__)
 
 class JSONClass:
 
-    # A dictionary of JSON classes, indexed by fully qualified class name
+    # A dictionary of JSON classes, indexed by fully qualified class name, so
+    # that classes of the same name in different packages do not overwrite
+    # each other
     JSON_CLASSES = dict()
 
+    # Hash of the code of the generator (this file), computed once. It is part
+    # of the schema hash of every class, so that changing the generator
+    # invalidates the cached code
+    GENERATOR_HASH = None
+
+    # Number of pieces of text accumulated by the generated write_json
+    # (and write_to) methods before they are written to the stream
+    WRITE_JSON_CHUNK = 8192
+
     # Creates an instance of a JSONClass, and adds it to the JSON_CLASSES global
     # dictionary, indexed by fully qualified name
     def __init__(self, name: str, package: str):
@@ -17,15 +38,80 @@ class JSONClass:
         self.relationships = dict()
         self.type = None
         self.generated_class_file_name= None
-        JSONClass.JSON_CLASSES[self.name] = self
+        # source code of the class, when it is generated in memory
+        self.generated_source = None
+        # when True, the generated class declares __slots__, so that its
+        # instances do not carry a __dict__
+        self.use_slots = False
+        # when True, the objects of the ONE_TO_MANY relationships are created
+        # from their json fragments on first access only
+        self.lazy = False
+        # attributes whose values are interned by the from_json factory (see
+        # intern_attribute), with the size of their interning table
+        self.interned_attributes = dict()
+        # related classes that refer back to this class, directly or not (see
+        # json_loader.sort_classes): their modules cannot be imported when the
+        # module of this class is, so their factories are bound on first call
+        self.deferred_class_names = set()
+        # structural key of the class, computed by shape() and cleared
+        # whenever the class changes
+        self.shape_key = None
+        JSONClass.JSON_CLASSES[self.fully_qualified_name()] = self
 
 
     def fully_qualified_name(self):
         return self.package + "." + self.name
 
 
+    # Returns the JSONClass named class_name in the package of this class
+    # (e.g. the destination of one of its relationships), or None
+    def get_related_class(self, class_name: str):
+        return JSONClass.JSON_CLASSES.get(self.package + "." + class_name)
+
+
+    # Returns the structural key of the class: two classes with the same key
+    # (same attributes and types, same relationships to the same classes, same
+    # generation options) generate the same code, up to the class name. The key
+    # is computed once, and recomputed only after the class has changed
+    def shape(self) -> tuple:
+        if self.shape_key is None:
+            relationships = sorted((relation.name, relation.destination_entity, relation.multiplicity, str(relation.index_field),
+                                    relation.storage, tuple(sorted(relation.secondary_indexes.items())))
+                                   for relation in self.relationships.values())
+            self.shape_key = (tuple(sorted((name, str(value_type)) for name, value_type in self.attributes.items())),
+                              tuple(relationships), self.use_slots, self.lazy, tuple(sorted(self.interned_attributes.items())))
+        return self.shape_key
+
+
+    # Makes the relationships of this class that lead to the class named
+    # old_name lead to the class named new_name (see json_loader.intern_classes)
+    def rename_related_class(self, old_name: str, new_name: str):
+        for relation in self.relationships.values():
+            if relation.destination_entity == old_name:
+                relation.destination_entity = new_name
+                self.shape_key = None
+
+
     def add_attribute(self, attributeName: str, valueType=object)-> None:
         self.attributes[attributeName]=valueType
+        self.shape_key = None
+
+
+    # Merges the type of an attribute found in a new json fragment with the
+    # type recorded so far: a missing value (NoneType) does not change the type,
+    # int and float are merged into float, and other conflicts give 'object'
+    def merge_attribute(self, attributeName: str, valueType: str)-> None:
+        known_type = self.attributes.get(attributeName)
+        if known_type == valueType:
+            return
+        self.shape_key = None
+        if known_type is None or known_type == 'NoneType':
+            self.attributes[attributeName]=valueType
+        elif known_type != valueType and valueType != 'NoneType':
+            if {known_type, valueType} == {'int', 'float'}:
+                self.attributes[attributeName]='float'
+            else:
+                self.attributes[attributeName]='object'
 
 
     # This method 
@@ -47,6 +133,77 @@ class JSONClass:
 
     def add_relationship_object(self, relationship):
         self.relationships[relationship.name] =relationship
+        self.shape_key = None
+
+
+    # Asks for the objects of a ONE_TO_MANY relationship to be stored column-wise,
+    # in a ColumnStore. Since a column holds attribute values only, the destination
+    # class must not have relationships of its own
+    def use_columns(self, relation_name: str):
+        relation = self.relationships[relation_name]
+        if relation.multiplicity != Relationship.ONE_TO_MANY:
+            raise ValueError(f"La relation '{relation_name}' de '{self.name}' n'est pas ONE_TO_MANY")
+        if self.get_related_class(relation.destination_entity).relationships:
+            raise ValueError(f"La classe '{relation.destination_entity}' a des relations: elle ne peut pas être stockée en colonnes")
+        relation.storage = Relationship.COLUMNS
+        self.shape_key = None
+
+
+    # Asks for the objects of an unindexed ONE_TO_MANY relationship to be kept in
+    # an IdentitySet instead of a list: the generated add_, remove_ and membership
+    # tests then take constant time, and iteration keeps the insertion order
+    def use_identity_set(self, relation_name: str):
+        relation = self.relationships[relation_name]
+        if relation.multiplicity != Relationship.ONE_TO_MANY or relation.is_indexed():
+            raise ValueError(f"La relation '{relation_name}' de '{self.name}' n'est pas une liste ONE_TO_MANY")
+        relation.storage = Relationship.IDENTITY_SET
+        self.shape_key = None
+
+
+    # Restricts the class to a projection: only the attributes named in
+    # attribute_names, and the relationships named in relationship_names, are
+    # kept (in their original order). The generated class then has no field for
+    # the other members, and its from_json factory never reads them
+    def project(self, attribute_names: set, relationship_names: set):
+        self.attributes = {name: value_type for name, value_type in self.attributes.items() if name in attribute_names}
+        self.relationships = {name: relation for name, relation in self.relationships.items() if name in relationship_names}
+        self.interned_attributes = {name: max_size for name, max_size in self.interned_attributes.items() if name in attribute_names}
+        self.shape_key = None
+
+
+    # Asks for the string values of an attribute to be interned by the generated
+    # from_json factory: the equal values read from all the json fragments then
+    # share a single str object. The interning table (see ValueInterner) keeps
+    # at most max_size distinct values
+    def intern_attribute(self, attribute_name: str, max_size: int = ValueInterner.DEFAULT_MAX_SIZE):
+        if self.attributes.get(attribute_name) not in ('str', 'object'):
+            raise ValueError(f"L'attribut '{attribute_name}' de '{self.name}' n'existe pas, ou n'est pas une chaîne")
+        self.interned_attributes[attribute_name] = max_size
+        self.shape_key = None
+
+
+    # Returns the interners of the interned attributes, by attribute name
+    def get_interners(self) -> dict:
+        return {attribute_name: ValueInterner.get_interner(self.fully_qualified_name(), attribute_name, max_size)
+                for attribute_name, max_size in self.interned_attributes.items()}
+
+
+    # Declares a secondary index on the attribute field_name of the objects of a
+    # ONE_TO_MANY relationship. The generated add_/remove_ methods keep the index
+    # up to date, and the generated find_<relation>_by_<field> method looks the
+    # objects up in constant time: it returns the object with the given value
+    # (or None) for a unique index, and the list of such objects otherwise.
+    # 
+    # The index is keyed by the value of the attribute when the object is added:
+    # an object whose attribute changes must be removed and added again
+    def add_index(self, relation_name: str, field_name: str, unique: bool = False):
+        relation = self.relationships[relation_name]
+        if relation.multiplicity != Relationship.ONE_TO_MANY or relation.storage == Relationship.COLUMNS:
+            raise ValueError(f"La relation '{relation_name}' de '{self.name}' doit être ONE_TO_MANY, et stockée par objets")
+        if field_name not in self.get_related_class(relation.destination_entity).attributes:
+            raise ValueError(f"L'attribut '{field_name}' n'existe pas dans la classe '{relation.destination_entity}'")
+        relation.secondary_indexes[field_name] = unique
+        self.shape_key = None
 
 
     def __str__(self) -> str:
@@ -70,24 +227,134 @@ class JSONClass:
         # 1. open the file
         python_file = open(file_name,'w+')
 
-        # 2. print class header
+        # 2. write the code of the module
+        self.write_code(python_file)
+
+        # 3. close the file
+        python_file.close()
+
+        # 4. mark the class as having been generated, by
+        # specifying the name of the code file
+        self.generated_class_file_name= file_name
+
+
+    # This method generates the code for this (self) JSONClass object in memory:
+    # no file is written. The module is registered with the InMemoryImporter, so
+    # that load_code (and the modules of the other generated classes) can import
+    # it as usual
+    def generate_code_in_memory(self):
+        python_file = StringIO()
+        self.write_code(python_file)
+        self.generated_source = python_file.getvalue()
+        InMemoryImporter.get_instance().add_module(self.fully_qualified_name(), self.generated_source)
+
+
+    # Writes the code of a class generated in memory to a file of output_path,
+    # e.g. to debug it. The file is not used to load the class
+    def export_code(self, output_path: str):
+        if self.generated_source is None:
+            raise ValueError(f"Le code de la classe '{self.name}' n'a pas été généré en mémoire")
+        with open(output_path + "/" + self.name + ".py", 'w') as python_file:
+            python_file.write(self.generated_source)
+
+
+    # Generates the code of the class (in memory, or in output_path), reusing
+    # the code cached for its schema hash when there is one. Classes whose
+    # schema did not change are therefore neither regenerated nor recompiled
+    def generate_code_cached(self, schema_cache, output_path: str = None):
+        schema_hash = self.schema_hash()
+        cached_entry = schema_cache.get(schema_hash)
+
+        # 1. Cache miss: generate the code, and add it to the cache
+        if cached_entry is None:
+            if output_path is None:
+                self.generate_code_in_memory()
+                code = InMemoryImporter.get_instance().codes[self.fully_qualified_name()]
+                schema_cache.put(schema_hash, self.generated_source, code)
+            else:
+                self.generate_code(output_path)
+                with open(self.generated_class_file_name, 'r', encoding="utf-8") as python_file:
+                    schema_cache.put(schema_hash, python_file.read())
+            return
+
+        # 2. Cache hit: reuse the cached code
+        source, code = cached_entry
+        if output_path is None:
+            self.generated_source = source
+            InMemoryImporter.get_instance().add_module(self.fully_qualified_name(), source, code)
+            # le code compilé manque si l'entrée a été créée en mode fichier
+            if code is None:
+                schema_cache.put(schema_hash, source, InMemoryImporter.get_instance().codes[self.fully_qualified_name()])
+        else:
+            # le fichier n'est réécrit que s'il a changé, pour que python
+            # puisse réutiliser son propre cache de bytecode (__pycache__)
+            file_name = output_path + "/" + self.name + ".py"
+            try:
+                with open(file_name, 'r', encoding="utf-8") as python_file:
+                    unchanged = python_file.read() == source
+            except FileNotFoundError:
+                unchanged = False
+            if not unchanged:
+                with open(file_name, 'w', encoding="utf-8") as python_file:
+                    python_file.write(source)
+            self.generated_class_file_name = file_name
+
+
+    # Returns a description of everything the generated code depends on: the
+    # attributes and their types, the relationships, the generation options,
+    # and the information used from the related classes
+    def schema_description(self) -> tuple:
+        relationships = []
+        for relation in self.relationships.values():
+            related_class = self.get_related_class(relation.destination_entity)
+            related_description = None
+            if related_class is not None:
+                # le code généré utilise le type du champ d'indexation, et les
+                # types de tous les attributs pour un stockage en colonnes
+                if relation.storage == Relationship.COLUMNS:
+                    related_types = tuple(related_class.attributes.items())
+                else:
+                    related_types = related_class.attributes.get(relation.index_field)
+                related_description = (related_class.fully_qualified_name(), related_types)
+            relationships.append((relation.name, relation.destination_entity, relation.multiplicity,
+                                  relation.index_field, relation.storage, tuple(relation.secondary_indexes.items()), related_description))
+        return (self.package, self.name, tuple(self.attributes.items()), tuple(relationships), self.use_slots, self.lazy,
+                tuple(self.interned_attributes.items()), tuple(sorted(self.deferred_class_names)))
+
+
+    # Returns a stable hash of the schema of the class (see schema_description),
+    # and of the generator, used as a key by the SchemaCache
+    def schema_hash(self) -> str:
+        if JSONClass.GENERATOR_HASH is None:
+            with open(__file__, 'rb') as generator_file:
+                JSONClass.GENERATOR_HASH = hashlib.sha256(generator_file.read()).hexdigest()
+        description = repr((JSONClass.GENERATOR_HASH, self.schema_description()))
+        return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+
+    # Writes the code of the module of the class to python_file
+    def write_code(self, python_file: TextIOWrapper):
+        # 1. print imports of related classes, and class header
+        self.generate_imports(python_file)
         python_file.write("class " + self.name + ":\n")
 
-        # 3. generate constructor
+        # 2. generate constructor, and properties of lazy relationships
         self.generate_constructor(python_file)
+        self.generate_lazy_properties(python_file)
 
-        # 4. generate accessors
+        # 3. generate accessors
         self.generate_accessors(python_file)
 
-        # 5. generate __str__ method
+        # 4. generate __str__ method
         self.generate__str__method(python_file)
 
-        # 6. close the file
-        python_file.close()
+        # 5. generate to_json and write_json serializers
+        self.generate_to_json_method(python_file)
+        self.generate_write_json_method(python_file)
 
-        # 7. mark the class as having been generated, by
-        # specifying the name of the code file
-        self.generated_class_file_name= file_name
+        # 6. generate from_json factory, and bind the factories it calls
+        self.generate_from_json_method(python_file)
+        self.generate_factory_bindings(python_file)
 
 
     # This method loads the code for this (self) JSONClass object,
@@ -96,12 +363,12 @@ class JSONClass:
         # 1. First check whether the code was generated. 
         # if not, it returns None
 
-        if (self.generated_class_file_name == None):
+        if (self.generated_class_file_name == None and self.generated_source == None):
             return None
         
         # 2. now, load the corresponding module
         module = importlib.import_module(self.fully_qualified_name())
-        print("The module is: " + module.__str__())
+        logger.debug("The module is: %s", module)
 
         # 3. Obtenir le type de l'objet qui représente la version 'compilée' de cette JSONClass
         # Le nom de la classe est supposé être le même que self.name
@@ -117,7 +384,13 @@ class JSONClass:
     # It will also initialize ONE_TO_MANY relationships to en empty collection
     # of whichever structure is appropriate: a) a list, or b) a map (if the relationship
     # is indexed)
+    # 
+    # In slots mode (use_slots), the constructor is preceded by a __slots__
+    # declaration covering the attributes and the relationship fields
     def generate_constructor(self, python_file: TextIOWrapper):
+        # 0. Generate __slots__, if requested
+        if self.use_slots:
+            python_file.write(f"    __slots__ = {tuple(self.get_slot_names())!r}\n\n")
         # 1. Generate header
         constructor_header = "    def __init__(self, "
         constructor_header += ", ".join(f"{name}: {type_}" for name, type_ in self.attributes.items())
@@ -133,51 +406,161 @@ class JSONClass:
                 python_file.write(f"        self.{relation.name} = None\n")
             # 3.2 if ONE_TO_MANY, check if the relation is indexed or not
             elif relation.multiplicity == Relationship.ONE_TO_MANY:
-                # 3.2.1 It is indexed
-                if relation.index_field:
+                # 3.2.0 It is lazy: the collection is behind a property, and the
+                # json fragments of its objects are kept until the first access
+                if self.is_lazy(relation):
+                    python_file.write(f"        self._{relation.json_key()} = {self.get_empty_collection(relation)}\n")
+                    python_file.write(f"        self._raw_{relation.json_key()} = None\n")
+                # 3.2.1 It is stored column-wise
+                elif relation.storage == Relationship.COLUMNS:
+                    attribute_types = self.get_related_class(relation.destination_entity).attributes
+                    python_file.write(f"        self.{relation.json_key()} = ColumnStore({relation.destination_entity!r}, {attribute_types!r}, {relation.index_field!r})\n")
+                # 3.2.2 It is indexed
+                elif relation.index_field:
                     python_file.write(f"        self.table_{relation.name}s = {{}}\n")
-                # 3.2.2 It is not indexed
+                # 3.2.3 It is not indexed
                 else:
-                    python_file.write(f"        self.liste_{relation.name}s = []\n")
+                    python_file.write(f"        self.liste_{relation.name}s = {self.get_empty_collection(relation)}\n")
+                # 3.2.4 Its secondary indexes
+                for field_name in relation.secondary_indexes:
+                    python_file.write(f"        self.{relation.index_name(field_name)} = {{}}\n")
 
         python_file.write("\n")    
 
 
+    # Returns the expression of the empty collection of a ONE_TO_MANY relationship
+    # stored as objects: a dictionary if it is indexed, a list or an IdentitySet
+    # otherwise
+    def get_empty_collection(self, relation: Relationship) -> str:
+        if relation.index_field:
+            return "{}"
+        if relation.storage == Relationship.IDENTITY_SET:
+            return "IdentitySet()"
+        return "[]"
+
+
+    # Returns the names of the fields of the generated objects: one per
+    # attribute, and one per relationship (the related object for a ONE_TO_ONE
+    # relationship, the liste_/table_ collection for a ONE_TO_MANY one)
+    def get_slot_names(self) -> list:
+        slot_names = list(self.attributes.keys())
+        for relation in self.relationships.values():
+            if self.is_lazy(relation):
+                slot_names.extend(("_" + relation.json_key(), "_raw_" + relation.json_key()))
+            else:
+                slot_names.append(relation.json_key())
+            slot_names.extend(relation.index_name(field_name) for field_name in relation.secondary_indexes)
+        return slot_names
+
+
+    # A relationship is lazy if its class is, and if its objects are stored
+    # as objects (ONE_TO_MANY relationship, not stored column-wise)
+    def is_lazy(self, relation: Relationship) -> bool:
+        return self.lazy and relation.multiplicity == Relationship.ONE_TO_MANY and relation.storage != Relationship.COLUMNS
+
+
+    # This method generates, for each lazy relationship, a read-only property
+    # giving access to the collection, and the method that creates its objects
+    # from the json fragments kept by from_json, on first access. Since all the
+    # generated methods go through the property, laziness is transparent
+    def generate_lazy_properties(self, python_file: TextIOWrapper):
+        for relation in self.relationships.values():
+            if not self.is_lazy(relation):
+                continue
+            key = relation.json_key()
+            python_file.write("    @property\n")
+            python_file.write(f"    def {key}(self):\n")
+            python_file.write(f"        if self._raw_{key} is not None:\n")
+            python_file.write(f"            self.materialize_{key}()\n")
+            python_file.write(f"        return self._{key}\n\n")
+            python_file.write(f"    def materialize_{key}(self):\n")
+            python_file.write(f"        related_fragments = self._raw_{key}\n")
+            python_file.write(f"        self._raw_{key} = None\n")
+            python_file.write(f"        add_{relation.name} = self.add_{relation.name}\n")
+            python_file.write(f"        for related_fragment in related_fragments{'.values()' if relation.is_indexed() else ''}:\n")
+            python_file.write(f"            add_{relation.name}(_{relation.destination_entity}_from_json(related_fragment))\n\n")
+
+
     # This method generates the __str__ method. it simply prints
     # the attributes and relationships of the object. It will
     # descend recursively if each object in the object tree
     # has a customer __str__() methods that prints its
     # fields      
+    # 
+    # The text is built by the generated str_parts method, which appends its
+    # pieces to a single list for the whole object tree (joined once, so the
+    # cost is linear in the size of the text). to_string can truncate the tree
+    # (max_depth levels of related objects, max_items objects per relationship),
+    # and write_to writes the text to a stream by chunks
     def generate__str__method(self, python_file: TextIOWrapper):
-        # 1. Génére l'en-tête de la fonction
-        python_file.write("    def __str__(self) -> str:\n".format())
-        python_file.write(f"        return_string = \"{self.name}[\"\n")
-
-        # 2. Génére les instructions qui imprimeront les attributs
+        # 1. Génére __str__, to_string et write_to, qui délèguent à str_parts
+        python_file.write("    def __str__(self) -> str:\n")
+        python_file.write("        parts = []\n")
+        python_file.write("        self.str_parts(parts)\n")
+        python_file.write("        return \"\".join(parts)\n\n")
+        python_file.write("    def to_string(self, max_depth: int = None, max_items: int = None) -> str:\n")
+        python_file.write("        parts = []\n")
+        python_file.write("        self.str_parts(parts, max_depth, max_items)\n")
+        python_file.write("        return \"\".join(parts)\n\n")
+        python_file.write("    def write_to(self, stream, max_depth: int = None, max_items: int = None):\n")
+        python_file.write("        parts = []\n")
+        python_file.write("        self.str_parts(parts, max_depth, max_items, stream)\n")
+        python_file.write("        stream.write(\"\".join(parts))\n\n")
+
+        # 2. Génére l'en-tête de str_parts
+        python_file.write("    def str_parts(self, parts: list, max_depth: int = None, max_items: int = None, stream=None):\n")
+        python_file.write("        append = parts.append\n")
+        if self.relationships:
+            python_file.write("        related_depth = None if max_depth is None else max_depth - 1\n")
+
+        # 3. Génére les instructions qui imprimeront les attributs
+        separator = self.name + "["
         for attr_name in self.attributes:
-            python_file.write(f"        return_string += \"{attr_name} = \" + self.{attr_name}.__str__() + \", \" \n")
-        
-        # 3. Génére les instructions qui imprimeront les relations
+            python_file.write(f"        append({json.dumps(separator + attr_name + ' = ')})\n")
+            python_file.write(f"        append(str(self.{attr_name}))\n")
+            separator = ", "
+
+        # 4. Génére les instructions qui imprimeront les relations
         for relation in iter(self.relationships.values()):
-            if relation.index_field:
-                # Pour les relations indexées (comme les dictionnaires)
-                python_file.write(f"        relation_str_ = \"table_{relation.name}s\" + \" = [\"\n")
-                python_file.write(f"        for key in iter(self.table_{relation.name}s.keys()):\n")
-                python_file.write(f"            relation_str_ += key + \" -> \" + self.table_{relation.name}s[key].__str__() + \", \"\n")
-                python_file.write("        relation_str_ = relation_str_[:-2] + \"]\"\n")
-                python_file.write("        return_string += relation_str_ + \", \"\n")
+            key = relation.json_key()
+            if relation.multiplicity == Relationship.ONE_TO_ONE:
+                python_file.write(f"        append({json.dumps(separator + key + ' = ')})\n")
+                python_file.write(f"        if self.{key} is None or max_depth == 0:\n")
+                python_file.write(f"            append(\"None\" if self.{key} is None else \"...\")\n")
+                python_file.write("        else:\n")
+                python_file.write(f"            self.{key}.str_parts(parts, related_depth, max_items, stream)\n")
             else:
-                # Pour les relations non indexées (comme les listes)
-                python_file.write(f"        relation_str_ = \"liste_{relation.name}s\" + \" = [\"\n")
-                python_file.write(f"        for related in iter(self.liste_{relation.name}s):\n")
-                python_file.write("            relation_str_ += related.__str__() + \", \"\n")
-                python_file.write("        relation_str_ = relation_str_[:-2] + \"]\"\n")
-                python_file.write("        return_string += relation_str_ + \", \"\n")
-
-        # 4. Ajoute le retour de la fonction et le retour chariot
-        python_file.write("        return_string = return_string[:-2] + \"]\"\n")
-        python_file.write("        return return_string")
-        python_file.write("\n")
+                python_file.write(f"        append({json.dumps(separator + key + ' = [')})\n")
+                python_file.write("        if max_depth == 0:\n")
+                python_file.write("            append(\"...\")\n")
+                python_file.write("        else:\n")
+                python_file.write("            count = 0\n")
+                if relation.index_field:
+                    # Pour les relations indexées (comme les dictionnaires)
+                    python_file.write(f"            for key, related in self.{key}.items():\n")
+                else:
+                    # Pour les relations non indexées (comme les listes)
+                    python_file.write(f"            for related in self.{key}:\n")
+                python_file.write("                if count:\n")
+                python_file.write("                    append(\", \")\n")
+                python_file.write("                if count == max_items:\n")
+                python_file.write(f"                    append(\"... (+\" + str(len(self.{key}) - count) + \")\")\n")
+                python_file.write("                    break\n")
+                if relation.index_field:
+                    python_file.write("                append(str(key))\n")
+                    python_file.write("                append(\" -> \")\n")
+                python_file.write("                related.str_parts(parts, related_depth, max_items, stream)\n")
+                python_file.write("                count += 1\n")
+                python_file.write("        append(\"]\")\n")
+            separator = ", "
+
+        # 5. Ferme l'objet, et écrit le tampon dans le flux s'il est assez gros
+        if separator != ", ":
+            python_file.write(f"        append({json.dumps(separator)})\n")
+        python_file.write("        append(\"]\")\n")
+        python_file.write(f"        if stream is not None and len(parts) > {JSONClass.WRITE_JSON_CHUNK}:\n")
+        python_file.write("            stream.write(\"\".join(parts))\n")
+        python_file.write("            parts.clear()\n")
 
 
     # This method generates accessors for collection-like attributes, i.e. ONE_TO_MANY
@@ -204,6 +587,10 @@ class JSONClass:
             if (relation.index_field != None):
                 indexed_accessor_string = self.get_indexed_accessor_string(relation_name,relation)
                 python_file.write(indexed_accessor_string)
+
+            # 5. generate the lookups of the secondary indexes
+            for field_name in relation.secondary_indexes:
+                python_file.write(self.get_finder_string(relation_name, relation, field_name))
      
 
     # depending on whether we have a list or table, we will either 
@@ -214,12 +601,46 @@ class JSONClass:
     def get_adder_string(self, relation_name: str, relation: Relationship)-> str:
         # En-tête de la méthode adder
         adder_code = f"    def add_{relation_name}(self, a_{relation_name}):\n"
+        # Un élément déjà dans la liste n'est pas ajouté de nouveau (il serait en double dans les
+        # index secondaires). Pour une liste python, la présence est testée dans le premier index
+        # secondaire, qui contient tous les éléments, plutôt que par un parcours de la liste
+        if relation.storage == Relationship.IDENTITY_SET:
+            adder_code += f"        if a_{relation_name} in self.liste_{relation_name}s:\n"
+            adder_code += "            return\n"
+        elif relation.index_field is None and relation.secondary_indexes:
+            field_name, unique = next(iter(relation.secondary_indexes.items()))
+            index = f"self.{relation.index_name(field_name)}"
+            if unique:
+                adder_code += f"        if {index}.get(a_{relation_name}.{field_name}) is a_{relation_name}:\n"
+            else:
+                adder_code += f"        if any(indexed is a_{relation_name} for indexed in {index}.get(a_{relation_name}.{field_name}, ())):\n"
+            adder_code += "            return\n"
+        # l'élément remplacé dans le dictionnaire (même clé) sort des index secondaires
+        replaced = ""
+        if relation.index_field is not None and relation.secondary_indexes:
+            adder_code += f"        replaced = self.table_{relation_name}s.get(a_{relation_name}.{relation.index_field})\n"
+            replaced = " and indexed is not replaced"
+        # Un index unique refuse un doublon, avant toute modification
+        for field_name, unique in relation.secondary_indexes.items():
+            if unique:
+                adder_code += f"        indexed = self.{relation.index_name(field_name)}.get(a_{relation_name}.{field_name}, a_{relation_name})\n"
+                adder_code += f"        if indexed is not a_{relation_name}{replaced}:\n"
+                adder_code += f"            raise ValueError(f\"{relation_name} en double pour {field_name} = {{a_{relation_name}.{field_name}!r}}\")\n"
         if relation.index_field is None:
             # Cas pour une liste : ajouter l'élément à la liste
             adder_code += f"        self.liste_{relation_name}s.append(a_{relation_name})\n"
         else:
+            if relation.secondary_indexes:
+                adder_code += "        if replaced is not None:\n"
+                adder_code += self.get_unindex_string(relation_name, relation, "replaced", "            ")
             # Cas pour un dictionnaire : ajouter l'élément avec l'index_field comme clé
             adder_code += f"        self.table_{relation_name}s[a_{relation_name}.{relation.index_field}] = a_{relation_name}\n"
+        # Mise à jour des index secondaires
+        for field_name, unique in relation.secondary_indexes.items():
+            if unique:
+                adder_code += f"        self.{relation.index_name(field_name)}[a_{relation_name}.{field_name}] = a_{relation_name}\n"
+            else:
+                adder_code += f"        self.{relation.index_name(field_name)}.setdefault(a_{relation_name}.{field_name}, []).append(a_{relation_name})\n"
 
         return adder_code + "\n"
 
@@ -233,18 +654,60 @@ class JSONClass:
         if relation.index_field is None:
             # En-tête de la méthode remover
             remover_code = f"    def remove_{relation_name}(self, a_{relation_name}):\n"
+            if relation.storage == Relationship.COLUMNS:
+                # Un ColumnStore refuse ce qui n'est pas une de ses lignes (voir ColumnStore.remove)
+                remover_code += f"        self.liste_{relation_name}s.remove(a_{relation_name})\n"
+                return remover_code + "\n"
             # Cas pour une liste : supprimer l'élément de la liste
             remover_code += f"        if a_{relation_name} in self.liste_{relation_name}s:\n"
             remover_code += f"            self.liste_{relation_name}s.remove(a_{relation_name})\n"
+            remover_code += self.get_unindex_string(relation_name, relation, f"a_{relation_name}", "            ")
         else:
             # En-tête de la méthode remover
             remover_code = f"    def remove_{relation_name}_with_{relation.index_field}(self, {relation.index_field}):\n"
             # Cas pour un dictionnaire : supprimer l'élément en utilisant l'index_field comme clé
             remover_code += f"        if {relation.index_field} in self.table_{relation_name}s:\n"
-            remover_code += f"            self.table_{relation_name}s.pop({relation.index_field})\n"
+            if relation.secondary_indexes:
+                remover_code += f"            removed = self.table_{relation_name}s.pop({relation.index_field})\n"
+                remover_code += self.get_unindex_string(relation_name, relation, "removed", "            ")
+            else:
+                remover_code += f"            self.table_{relation_name}s.pop({relation.index_field})\n"
         return remover_code + "\n"
 
 
+    # Generates the statements (indented by 'indent') that remove the object
+    # named variable from the secondary indexes of a relationship
+    def get_unindex_string(self, relation_name: str, relation: Relationship, variable: str, indent: str) -> str:
+        unindex_code = ""
+        for field_name, unique in relation.secondary_indexes.items():
+            index = f"self.{relation.index_name(field_name)}"
+            if unique:
+                unindex_code += f"{indent}if {index}.get({variable}.{field_name}) is {variable}:\n"
+                unindex_code += f"{indent}    del {index}[{variable}.{field_name}]\n"
+            else:
+                unindex_code += f"{indent}indexed_objects = {index}[{variable}.{field_name}]\n"
+                unindex_code += f"{indent}indexed_objects.remove({variable})\n"
+                unindex_code += f"{indent}if not indexed_objects:\n"
+                unindex_code += f"{indent}    del {index}[{variable}.{field_name}]\n"
+        return unindex_code
+
+
+    # Generates the lookup method of a secondary index: find_<relation>_by_<field>
+    # returns the object with the given value (or None) for a unique index, and
+    # the list of the objects with that value otherwise
+    def get_finder_string(self, relation_name: str, relation: Relationship, field_name: str) -> str:
+        field_type = self.get_related_class(relation.destination_entity).attributes.get(field_name, object)
+        finder_code = f"    def find_{relation_name}_by_{field_name}(self, {field_name}: {field_type}):\n"
+        if self.is_lazy(relation):
+            # l'accès à la collection crée ses objets, et remplit les index
+            finder_code += f"        self.{relation.json_key()}\n"
+        if relation.secondary_indexes[field_name]:
+            finder_code += f"        return self.{relation.index_name(field_name)}.get({field_name})\n"
+        else:
+            finder_code += f"        return list(self.{relation.index_name(field_name)}.get({field_name}, ()))\n"
+        return finder_code + "\n"
+
+
     # depending on whether we have a list or table, we will either 
     # use "iter(self.<relation name>)" or 
     # or "iter(self.<relation name>.values())"
@@ -269,7 +732,7 @@ class JSONClass:
         if relation.index_field is None:
             return ""
         # Trouve la classe cible dans le dictionnaire global des classes JSON
-        target_class = JSONClass.JSON_CLASSES.get(relation.destination_entity)
+        target_class = self.get_related_class(relation.destination_entity)
         if target_class is None:
             raise ValueError(f"Classe cible '{relation.destination_entity}' non trouvée.")
         
@@ -285,44 +748,265 @@ class JSONClass:
         return indexed_accessor_code + "\n"
 
 
+    # Returns the names of the classes that are the destination of a
+    # relationship of this class, without duplicates
+    def get_related_class_names(self) -> list:
+        return list(dict.fromkeys(relation.destination_entity for relation in self.relationships.values()))
+
+
+    # Returns the names of the related classes whose from_json factory is
+    # called by the from_json factory of this class: the objects of a
+    # relationship stored column-wise are never created
+    def get_factory_class_names(self) -> list:
+        return list(dict.fromkeys(relation.destination_entity for relation in self.relationships.values()
+                                  if relation.storage != Relationship.COLUMNS))
+
+
+    # This method generates the imports of the related classes, so that the
+    # from_json factory can call their own factories directly
+    def generate_imports(self, python_file: TextIOWrapper):
+        # les fonctions d'encodage utilisées par write_json
+        imports = ["from json import dumps as _dumps\n",
+                   "from json.encoder import encode_basestring_ascii as _encode_string\n"]
+        if 'float' in self.attributes.values():
+            imports.append("from math import isfinite as _isfinite\n")
+        if any(relation.storage == Relationship.COLUMNS for relation in self.relationships.values()):
+            imports.append(f"from {ColumnStore.__module__} import ColumnStore\n")
+        if any(relation.storage == Relationship.IDENTITY_SET for relation in self.relationships.values()):
+            imports.append(f"from {IdentitySet.__module__} import IdentitySet\n")
+        if self.interned_attributes:
+            imports.append(f"from {ValueInterner.__module__} import ValueInterner\n")
+        for related_class_name in self.get_factory_class_names():
+            if related_class_name != self.name and related_class_name not in self.deferred_class_names:
+                related_class = self.get_related_class(related_class_name)
+                imports.append(f"from {related_class.fully_qualified_name()} import {related_class_name}\n")
+        if imports:
+            python_file.write("".join(imports) + "\n\n")
+
+
+    # This method generates the to_json method, which returns the json fragment
+    # (a dictionary) of an object, with the same layout as the fragments read
+    # by from_json: attributes, then liste_/table_ collections
+    def generate_to_json_method(self, python_file: TextIOWrapper):
+        python_file.write("\n")
+        python_file.write("    def to_json(self) -> dict:\n")
+        members = ", ".join(f"\"{name}\": self.{name}" for name in self.attributes)
+        python_file.write(f"        json_fragment = {{{members}}}\n")
+        for relation in self.relationships.values():
+            key = relation.json_key()
+            if relation.multiplicity == Relationship.ONE_TO_ONE:
+                python_file.write(f"        json_fragment[\"{key}\"] = None if self.{key} is None else self.{key}.to_json()\n")
+            elif relation.is_indexed():
+                python_file.write(f"        json_fragment[\"{key}\"] = {{key: related.to_json() for key, related in self.{key}.items()}}\n")
+            else:
+                python_file.write(f"        json_fragment[\"{key}\"] = [related.to_json() for related in self.{key}]\n")
+        python_file.write("        return json_fragment\n")
+
+
+    # Returns the python expression that encodes the value of an attribute in
+    # json, specialized on the type recorded by build_class. The specialized
+    # encoding is only used for a value of exactly that type (a bool is an int,
+    # and nothing prevents another value from being assigned), and a finite
+    # float: json.dumps encodes the other values, None included
+    def get_encoder_expression(self, attribute_name: str) -> str:
+        value = f"self.{attribute_name}"
+        attribute_type = self.attributes[attribute_name]
+        if attribute_type == 'str':
+            encoded, test = f"_encode_string({value})", f"{value}.__class__ is str"
+        elif attribute_type == 'int':
+            encoded, test = f"repr({value})", f"{value}.__class__ is int"
+        elif attribute_type == 'float':
+            encoded, test = f"repr({value})", f"{value}.__class__ is float and _isfinite({value})"
+        elif attribute_type == 'bool':
+            encoded, test = f"(\"true\" if {value} else \"false\")", f"{value}.__class__ is bool"
+        else:
+            return f"_dumps({value})"
+        return f"{encoded} if {test} else _dumps({value})"
+
+
+    # This method generates the write_json method, which writes the json fragment
+    # of an object to a stream (a text file object), in the layout of to_json,
+    # without building the fragment. The pieces of text of a whole object graph
+    # are accumulated in a single list ('parts'), which is written to the stream
+    # in chunks of about WRITE_JSON_CHUNK pieces
+    def generate_write_json_method(self, python_file: TextIOWrapper):
+        # 1. Génére l'en-tête de la fonction
+        python_file.write("\n")
+        python_file.write("    def write_json(self, stream, parts: list = None):\n")
+        python_file.write("        top = parts is None\n")
+        python_file.write("        if top:\n")
+        python_file.write("            parts = []\n")
+        python_file.write("        append = parts.append\n")
+        python_file.write("        append(\"{\")\n")
+
+        # 2. Génére l'écriture des attributs
+        separator = ""
+        for attr_name in self.attributes:
+            python_file.write(f"        append({json.dumps(separator + json.dumps(attr_name) + ': ')})\n")
+            python_file.write(f"        append({self.get_encoder_expression(attr_name)})\n")
+            separator = ", "
+
+        # 3. Génére l'écriture des relations
+        for relation in self.relationships.values():
+            key = relation.json_key()
+            if relation.multiplicity == Relationship.ONE_TO_ONE:
+                python_file.write(f"        append({json.dumps(separator + json.dumps(key) + ': ')})\n")
+                python_file.write(f"        if self.{key} is None:\n")
+                python_file.write("            append(\"null\")\n")
+                python_file.write("        else:\n")
+                python_file.write(f"            self.{key}.write_json(stream, parts)\n")
+            elif relation.is_indexed():
+                python_file.write(f"        append({json.dumps(separator + json.dumps(key) + ': {')})\n")
+                python_file.write("        item_separator = \"\"\n")
+                python_file.write(f"        for key, related in self.{key}.items():\n")
+                python_file.write("            append(item_separator)\n")
+                python_file.write("            append(_encode_string(str(key)))\n")
+                python_file.write("            append(\": \")\n")
+                python_file.write("            related.write_json(stream, parts)\n")
+                python_file.write("            item_separator = \", \"\n")
+                python_file.write("        append(\"}\")\n")
+            else:
+                python_file.write(f"        append({json.dumps(separator + json.dumps(key) + ': [')})\n")
+                python_file.write("        item_separator = \"\"\n")
+                python_file.write(f"        for related in self.{key}:\n")
+                python_file.write("            append(item_separator)\n")
+                python_file.write("            related.write_json(stream, parts)\n")
+                python_file.write("            item_separator = \", \"\n")
+                python_file.write("        append(\"]\")\n")
+            separator = ", "
+
+        # 4. Ferme l'objet, et écrit le tampon s'il est assez gros (ou à la fin)
+        python_file.write("        append(\"}\")\n")
+        python_file.write(f"        if top or len(parts) > {JSONClass.WRITE_JSON_CHUNK}:\n")
+        python_file.write("            stream.write(\"\".join(parts))\n")
+        python_file.write("            parts.clear()\n")
+
+
+    # This method generates the from_json factory, a class method that creates
+    # an object of this class from a json fragment. The attribute keys are
+    # unrolled in the constructor call, and the objects of the related classes
+    # are created by calling their factories directly: no reflection is needed
+    # in the per-object path
+    def generate_from_json_method(self, python_file: TextIOWrapper):
+        # 1. Génére l'en-tête de la fonction
+        python_file.write("\n")
+        python_file.write("    @classmethod\n")
+        python_file.write("    def from_json(cls, json_fragment: dict):\n")
+
+        # 2. Génére le corps de la fonction
+        python_file.write(self.get_from_json_body())
+
+
+    # Returns the body of a function that creates an object of this class from
+    # 'json_fragment', indented by 'indent'. It is the body of the generated
+    # from_json factory, and of the specialized factories of FactoryCompiler:
+    #   class_expression   the expression of the class of the new object
+    #   factories          by relation name, the expression of the factory of
+    #                      the related objects, when it is not the from_json of
+    #                      the related class
+    #   predicates         by relation name, the expression of a function of a
+    #                      json fragment: the related objects whose fragment
+    #                      does not satisfy it are not created
+    def get_from_json_body(self, class_expression: str = "cls", factories: dict = None, predicates: dict = None, indent: str = "        ") -> str:
+        factories = factories or dict()
+        predicates = predicates or dict()
+        lines = ["get = json_fragment.get"]
+
+        # 1. L'appel du constructeur, un argument par attribut (les valeurs
+        # des attributs internés passent par leur interner)
+        constructor_arguments = ", ".join(f"_intern_{self.name}_{name}(get(\"{name}\"))" if name in self.interned_attributes else f"get(\"{name}\")"
+                                          for name in self.attributes)
+        lines.append(f"new_object = {class_expression}({constructor_arguments})")
+
+        # 2. La création des objets liés
+        for relation in self.relationships.values():
+            key = relation.json_key()
+            factory = factories.get(relation.name, f"_{relation.destination_entity}_from_json")
+            predicate = predicates.get(relation.name)
+            test = "" if predicate is None else f"if {predicate}(related_fragment):"
+            if relation.multiplicity == Relationship.ONE_TO_ONE:
+                lines.append(f"related_fragment = get(\"{key}\")")
+                lines.append("if related_fragment is not None" + ("" if predicate is None else f" and {predicate}(related_fragment)") + ":")
+                lines.append(f"    new_object.{relation.name} = {factory}(related_fragment)")
+                continue
+            if relation.is_indexed():
+                related_fragments = f"get(\"{key}\", {{}}).values()"
+            else:
+                related_fragments = f"get(\"{key}\", ())"
+            if self.is_lazy(relation) and relation.name not in factories:
+                # les fragments (qui satisfont le prédicat) sont conservés jusqu'au premier accès
+                if predicate is None:
+                    lines.append(f"new_object._raw_{key} = get(\"{key}\")")
+                elif relation.is_indexed():
+                    lines.append(f"new_object._raw_{key} = {{related_key: related_fragment for related_key, related_fragment in get(\"{key}\", {{}}).items() {test[:-1]}}}")
+                else:
+                    lines.append(f"new_object._raw_{key} = [related_fragment for related_fragment in get(\"{key}\", ()) {test[:-1]}]")
+                continue
+            if relation.storage == Relationship.COLUMNS:
+                # les fragments sont ajoutés directement aux colonnes
+                lines.append(f"append_json = new_object.{key}.append_json")
+                call = "append_json(related_fragment)"
+            else:
+                lines.append(f"add_{relation.name} = new_object.add_{relation.name}")
+                call = f"add_{relation.name}({factory}(related_fragment))"
+            lines.append(f"for related_fragment in {related_fragments}:")
+            if predicate is None:
+                lines.append("    " + call)
+            else:
+                lines.append("    " + test)
+                lines.append("        " + call)
+
+        lines.append("return new_object")
+        return "".join(indent + line + "\n" for line in lines)
+
+
+    # The factories of the related classes (and of the class itself, for
+    # recursive relationships), and the interners of the interned attributes,
+    # are bound to module variables once, when the module is imported. The
+    # factory of a deferred class is bound by a placeholder, which imports the
+    # class and replaces itself on its first call
+    def generate_factory_bindings(self, python_file: TextIOWrapper):
+        related_class_names = self.get_factory_class_names()
+        if related_class_names or self.interned_attributes:
+            python_file.write("\n\n")
+        for related_class_name in related_class_names:
+            if related_class_name in self.deferred_class_names:
+                related_class = self.get_related_class(related_class_name)
+                python_file.write(f"def _{related_class_name}_from_json(json_fragment):\n")
+                python_file.write(f"    global _{related_class_name}_from_json\n")
+                python_file.write(f"    from {related_class.fully_qualified_name()} import {related_class_name}\n")
+                python_file.write(f"    _{related_class_name}_from_json = {related_class_name}.from_json\n")
+                python_file.write(f"    return _{related_class_name}_from_json(json_fragment)\n")
+            else:
+                python_file.write(f"_{related_class_name}_from_json = {related_class_name}.from_json\n")
+        for attribute_name, max_size in self.interned_attributes.items():
+            python_file.write(f"_intern_{self.name}_{attribute_name} = ValueInterner.get_interner({self.fully_qualified_name()!r}, {attribute_name!r}, {max_size}).intern\n")
+
+
+    # Returns the from_json factory of the generated class, loading the
+    # class the first time
+    def get_factory(self):
+        if self.type is None:
+            # Charger le module contenant la classe
+            module = importlib.import_module(self.package + '.' + self.name)
+            if not hasattr(module, self.name):
+                raise ImportError(f"Classe {self.name} non trouvée dans le module {self.package}")
+
+            # Obtenir une référence à la classe
+            class_ref = getattr(module, self.name)
+            # Vérifie si class_ref est bien une classe
+            if not isinstance(class_ref, type):
+                raise TypeError(f"{self.name} dans {self.package} n'est pas une classe")
+            self.type = class_ref
+        return self.type.from_json
+
+
     # This function takes as an argument a class name and a json
     # object/fragment, and creates an object of the corresponding 
     # class and populates its fields with the contents of json_fragment
     # 
     # Depending on the structure of the class, if the class has relationships
     # to other classes, then objects of the other classes are created, 
-    # recursively.
+    # recursively, by the generated from_json factories.
     def create_object(self, json_fragment: dict):
-        # Charger le module contenant la classe
-        module = importlib.import_module(self.package + '.' + self.name)
-        if not hasattr(module, self.name):
-            raise ImportError(f"Classe {self.name} non trouvée dans le module {self.package}")
-        
-        # Obtenir une référence à la classe
-        class_ref = getattr(module, self.name)
-        # Vérifie si class_ref est bien une classe
-        if not isinstance(class_ref, type):
-            raise TypeError(f"{self.name} dans {self.package} n'est pas une classe")
-        
-        # 1. Construire l'objet avec les paramètres du constructeur
-        constructor_params = {attr: json_fragment.get(attr, None) for attr in self.attributes}
-        new_object = class_ref(**constructor_params)
-
-        # 2. Ajouter maintenant les relations
-        for relation in iter(self.relationships.values()):
-            if (relation.is_indexed()):
-                relation_value = json_fragment.get(f"table_{relation.name}s", [])
-                # 2.1.a Gérer comme une table (dictionnaire)
-                for value in relation_value.values():
-                    # Créer l'objet de destination et l'ajouter à la relation
-                    related_object = JSONClass.JSON_CLASSES[relation.destination_entity].create_object(value)
-                    getattr(new_object, f"add_{relation.name}")(related_object)
-            else:
-                relation_value = json_fragment.get(f"liste_{relation.name}s", [])
-                # 2.1.b Gérer comme une simple liste
-                for item in relation_value:
-                    # Créer l'objet de destination et l'ajouter à la relation
-                    related_object = JSONClass.JSON_CLASSES[relation.destination_entity].create_object(item)
-                    getattr(new_object, f"add_{relation.name}")(related_object)
-                    
-        return new_object
\ No newline at end of file
+        return self.get_factory()(json_fragment)
\ No newline at end of file
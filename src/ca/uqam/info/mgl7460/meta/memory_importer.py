@@ -0,0 +1,95 @@
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import linecache
+import sys
+
+class InMemoryImporter(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+
+    # The importer that serves the modules generated in memory. It is
+    # installed at the front of sys.meta_path the first time it is needed
+    INSTANCE = None
+
+    # An import hook that serves modules whose source code (or compiled code)
+    # is kept in memory, so that generated classes can be imported, and
+    # reloaded, without any file being written or read.
+    #
+    # The parent packages of the generated modules are created on the fly
+    # (as empty packages) when they cannot be found on disk
+    def __init__(self):
+        self.sources = dict()
+        self.codes = dict()
+
+
+    # Returns the importer, installing it the first time
+    @staticmethod
+    def get_instance():
+        if InMemoryImporter.INSTANCE is None:
+            InMemoryImporter.INSTANCE = InMemoryImporter()
+            sys.meta_path.insert(0, InMemoryImporter.INSTANCE)
+        return InMemoryImporter.INSTANCE
+
+
+    @staticmethod
+    def get_file_name(module_name: str) -> str:
+        return "<generated " + module_name + ">"
+
+
+    # Registers the source code of a module. If a previous version of the module
+    # has already been imported, it is forgotten, so that the next import executes
+    # the new code. A compiled version of the source code can be given, to avoid
+    # compiling it again
+    def add_module(self, module_name: str, source: str, code=None):
+        if self.sources.get(module_name) != source:
+            self.forget_module(module_name)
+        self.sources[module_name] = source
+        if code is None:
+            code = compile(source, InMemoryImporter.get_file_name(module_name), "exec")
+        self.codes[module_name] = code
+        # pour que les traces d'exécution affichent le code généré
+        linecache.cache[InMemoryImporter.get_file_name(module_name)] = (len(source), None, source.splitlines(True), InMemoryImporter.get_file_name(module_name))
+
+
+    # Removes an imported module from sys.modules, together with the generated
+    # modules that imported it: they refer to its old classes
+    def forget_module(self, module_name: str):
+        if sys.modules.pop(module_name, None) is not None:
+            import_line = "from " + module_name + " import "
+            for other_module_name, other_source in self.sources.items():
+                if import_line in other_source:
+                    self.forget_module(other_module_name)
+
+
+    def remove_module(self, module_name: str):
+        self.sources.pop(module_name, None)
+        self.codes.pop(module_name, None)
+        sys.modules.pop(module_name, None)
+
+
+    def is_package(self, module_name: str) -> bool:
+        prefix = module_name + "."
+        return any(name.startswith(prefix) for name in self.sources)
+
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname in self.codes:
+            return importlib.util.spec_from_loader(fullname, self, origin=InMemoryImporter.get_file_name(fullname))
+        # un package parent qui n'existe pas sur disque est créé vide
+        if self.is_package(fullname) and importlib.machinery.PathFinder.find_spec(fullname, path) is None:
+            return importlib.util.spec_from_loader(fullname, self, is_package=True)
+        return None
+
+
+    def create_module(self, spec):
+        return None
+
+
+    def exec_module(self, module):
+        code = self.codes.get(module.__name__)
+        if code is not None:
+            module.__file__ = InMemoryImporter.get_file_name(module.__name__)
+            exec(code, module.__dict__)
+
+
+    def get_source(self, fullname):
+        return self.sources.get(fullname)
@@ -1,6 +1,14 @@
 class Relationship:
         ONE_TO_ONE = 1
         ONE_TO_MANY = 99
+
+        # Storage of the related objects of a ONE_TO_MANY relationship: one
+        # object per element (ROWS), or one column per attribute (COLUMNS).
+        # The objects of an unindexed relationship can also be kept in an
+        # IdentitySet (IDENTITY_SET), for constant time removal
+        ROWS = 1
+        COLUMNS = 2
+        IDENTITY_SET = 3
         
         def __init__(self, name: str, source_entity: str, destination_entity: str, multiplicity: int, index_field : str = None):
                 self.name = name
@@ -10,14 +18,39 @@ class Relationship:
                 if (multiplicity > 1 ):
                         self.multiplicity = Relationship.ONE_TO_MANY
                 self.index_field = index_field
+                self.storage = Relationship.ROWS
+                # secondary indexes of a ONE_TO_MANY relationship: for each
+                # indexed attribute of the related objects, True if the index
+                # is unique (one object per value), False otherwise
+                self.secondary_indexes = dict()
 
 
         def is_indexed(self) -> bool:
                 return not (self.index_field == None)
 
 
+        # Returns the key under which the relationship appears in a json
+        # fragment: the name itself for a ONE_TO_ONE relationship, and
+        # "table_<name>s" or "liste_<name>s" for ONE_TO_MANY relationships
+        def json_key(self) -> str:
+                if (self.multiplicity == Relationship.ONE_TO_ONE):
+                        return self.name
+                if (self.is_indexed()):
+                        return "table_" + self.name + "s"
+                return "liste_" + self.name + "s"
+
+
+        # Name of the field of the generated objects that holds a secondary index
+        def index_name(self, field_name: str) -> str:
+                return "_index_" + self.name + "_by_" + field_name
+
+
         def __str__(self):
                 structure = "List<"
                 if (not self.index_field == None):
                         structure = "Map<" + self.index_field+","
+                if (self.storage == Relationship.COLUMNS):
+                        structure = "Columns" + structure
+                elif (self.storage == Relationship.IDENTITY_SET):
+                        structure = "IdentitySet<"
                 return self.name + " [" + self.source_entity + " -> " + structure + self.destination_entity+ ">]"
\ No newline at end of file
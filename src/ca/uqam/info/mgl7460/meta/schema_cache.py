@@ -0,0 +1,65 @@
+import marshal
+import os
+import sys
+
+class SchemaCache:
+
+    # A persistent, content-addressed cache of generated code. Each entry is
+    # keyed by the schema hash of a JSONClass (see JSONClass.schema_hash), and
+    # holds the generated source code and its compiled version. The compiled
+    # code is specific to the python version, hence the cache_tag (e.g.
+    # "cpython-311") in the file name
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+
+    def get_source_file_name(self, schema_hash: str) -> str:
+        return self.directory + "/" + schema_hash + ".py"
+
+
+    def get_code_file_name(self, schema_hash: str) -> str:
+        return self.directory + "/" + schema_hash + "." + sys.implementation.cache_tag + ".bin"
+
+
+    # Returns the (source, code) pair cached for schema_hash, or None. The code
+    # is None when only the source has been cached by another python version
+    def get(self, schema_hash: str):
+        try:
+            with open(self.get_source_file_name(schema_hash), 'r', encoding="utf-8") as source_file:
+                source = source_file.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            with open(self.get_code_file_name(schema_hash), 'rb') as code_file:
+                code = marshal.load(code_file)
+        except (FileNotFoundError, EOFError, ValueError, TypeError):
+            code = None
+        return source, code
+
+
+    # Adds an entry to the cache. Files are written under a temporary name,
+    # then renamed, so that concurrent loaders never read a partial entry
+    def put(self, schema_hash: str, source: str, code=None):
+        self.write_file(self.get_source_file_name(schema_hash), source.encode("utf-8"))
+        if code is not None:
+            self.write_file(self.get_code_file_name(schema_hash), marshal.dumps(code))
+
+
+    def write_file(self, file_name: str, content: bytes):
+        temporary_file_name = file_name + "." + str(os.getpid()) + ".tmp"
+        with open(temporary_file_name, 'wb') as cache_file:
+            cache_file.write(content)
+        os.replace(temporary_file_name, file_name)
+
+
+    def get_statistics(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+    def __str__(self) -> str:
+        return "SchemaCache[" + self.directory + ", hits = " + str(self.hits) + ", misses = " + str(self.misses) + "]"
@@ -0,0 +1,140 @@
+import gc
+import hashlib
+import importlib
+import json
+import mmap
+import os
+import pickle
+import struct
+
+from ca.uqam.info.mgl7460.meta.memory_importer import InMemoryImporter
+
+class Snapshot:
+
+    # Start of every snapshot file, followed by the version of the format
+    MAGIC = b"MGLSNAP"
+    VERSION = 1
+
+    # Layout of the fixed part of the file: magic, version, length of the header
+    PREAMBLE = struct.Struct("<7sBQ")
+
+    # A snapshot file holds a graph of generated objects, in binary form, so
+    # that it can be reloaded much faster than by parsing the json data again
+    # and recreating the objects. The file is made of:
+    #   - a preamble: MAGIC, VERSION, and the length of the header
+    #   - a header, in json: the schema hash of the classes of the graph, and
+    #     for each class its fully qualified name, schema hash and source code
+    #   - the graph of objects, pickled
+    #
+    # A snapshot is only valid for the schema it was written with: reading
+    # it with classes whose schema hash differs raises a ValueError.
+    #
+    # Security: reading a snapshot runs code from the file. The graph is
+    # unpickled (pickle can call any function), and read(register_sources=True)
+    # executes the source code saved in the header. Only read snapshots from
+    # a trusted location: the schema hash detects mistakes, not tampering
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+
+
+    # Returns the hash of the schemas of a set of classes (see JSONClass.schema_hash)
+    @staticmethod
+    def get_schema_hash(classes) -> str:
+        class_hashes = sorted(json_class.fully_qualified_name() + ":" + json_class.schema_hash() for json_class in classes)
+        return hashlib.sha256("\n".join(class_hashes).encode("utf-8")).hexdigest()
+
+
+    # Returns the source code of a generated class, in memory or on disk
+    @staticmethod
+    def get_source(json_class) -> str:
+        if json_class.generated_source is not None:
+            return json_class.generated_source
+        if json_class.generated_class_file_name is None:
+            raise ValueError(f"Le code de la classe '{json_class.name}' n'a pas été généré")
+        with open(json_class.generated_class_file_name, 'r', encoding="utf-8") as python_file:
+            return python_file.read()
+
+
+    # Writes top_object, and the graph of its related objects, whose classes
+    # are 'classes' (JSONClass objects). The file is written under a temporary
+    # name, then renamed, so that a reader never sees a partial snapshot
+    def write(self, top_object: object, classes):
+        classes = list(classes)
+        header = {"schema_hash": Snapshot.get_schema_hash(classes),
+                  "classes": [{"module": json_class.fully_qualified_name(),
+                               "schema_hash": json_class.schema_hash(),
+                               "source": Snapshot.get_source(json_class)} for json_class in classes]}
+        encoded_header = json.dumps(header).encode("utf-8")
+        temporary_file_name = self.file_name + "." + str(os.getpid()) + ".tmp"
+        with open(temporary_file_name, 'wb') as snapshot_file:
+            snapshot_file.write(Snapshot.PREAMBLE.pack(Snapshot.MAGIC, Snapshot.VERSION, len(encoded_header)))
+            snapshot_file.write(encoded_header)
+            pickle.dump(top_object, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_file_name, self.file_name)
+
+
+    # Reads the header of the snapshot from a mapped file, and returns it with
+    # the position of the pickled graph
+    def read_header(self, mapped_file) -> tuple:
+        if len(mapped_file) < Snapshot.PREAMBLE.size:
+            raise ValueError(f"'{self.file_name}' n'est pas un snapshot")
+        magic, version, header_length = Snapshot.PREAMBLE.unpack_from(mapped_file)
+        if magic != Snapshot.MAGIC:
+            raise ValueError(f"'{self.file_name}' n'est pas un snapshot")
+        if version != Snapshot.VERSION:
+            raise ValueError(f"Version {version} du snapshot '{self.file_name}' non supportée")
+        start = Snapshot.PREAMBLE.size
+        return json.loads(mapped_file[start:start + header_length]), start + header_length
+
+
+    # Reads the graph of objects of the snapshot, from the file mapped in memory.
+    #
+    # If 'classes' are given (the JSONClass objects of the current schema), the
+    # snapshot must have been written with the same schema. Otherwise, the
+    # classes saved in the snapshot that can be imported must have the saved
+    # source code, and those that cannot be imported are registered in memory
+    # from that source code, so that the graph can be reloaded without the json
+    # data: since this executes code read from the file, it is only done when
+    # the caller opts in with register_sources=True (a missing class raises a
+    # ValueError otherwise)
+    def read(self, classes=None, register_sources: bool = False):
+        with open(self.file_name, 'rb') as snapshot_file, \
+             mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            header, start = self.read_header(mapped_file)
+            if classes is not None:
+                if header["schema_hash"] != Snapshot.get_schema_hash(classes):
+                    raise ValueError(f"Le snapshot '{self.file_name}' a été écrit avec un autre schéma")
+            else:
+                self.register_classes(header["classes"], register_sources)
+            # Le ramasse-miettes est suspendu pendant la lecture: les millions
+            # d'objets créés d'un coup déclencheraient des collectes complètes
+            # inutiles (aucun de ces objets n'est un déchet)
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                # la vue (et sa tranche) doivent être libérées avant de fermer la projection
+                with memoryview(mapped_file) as data, data[start:] as payload:
+                    return pickle.loads(payload)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+
+
+    # Imports the classes saved in the snapshot. A module found on disk, or
+    # already registered in memory, may have been generated from another schema:
+    # its source code is compared with the saved one
+    def register_classes(self, class_entries: list, register_sources: bool = False):
+        for class_entry in class_entries:
+            module_name = class_entry["module"]
+            try:
+                module = importlib.import_module(module_name)
+            except ImportError:
+                if not register_sources:
+                    raise ValueError(f"Le module '{module_name}' du snapshot '{self.file_name}' ne peut pas être importé: "
+                                     "register_sources=True exécute le code enregistré (snapshot de confiance seulement)")
+                InMemoryImporter.get_instance().add_module(module_name, class_entry["source"])
+                continue
+            loader = module.__spec__.loader if module.__spec__ is not None else None
+            source = loader.get_source(module_name) if hasattr(loader, "get_source") else None
+            if source != class_entry["source"]:
+                raise ValueError(f"Le module '{module_name}' ne correspond pas à la classe enregistrée dans le snapshot '{self.file_name}'")
@@ -0,0 +1,190 @@
+from ca.uqam.info.mgl7460.meta.relationship import Relationship
+
+class ValidationError(ValueError):
+
+    # The errors found while creating an object from a json fragment with the
+    # validating factories of ValidatorCompiler: a list of (path, message)
+    # pairs, where path is a json pointer ("/liste_clients/0/nom")
+    def __init__(self, errors: list):
+        self.errors = errors
+        super().__init__(f"{len(errors)} erreur(s) de validation:\n" + "\n".join(f"  {path}: {message}" for path, message in errors))
+
+
+class ValidatorCompiler:
+
+    # Classes accepted for each attribute type recorded by build_class. A bool
+    # is not accepted for an int (although it is one in python), and a float
+    # attribute also accepts ints (see JSONClass.merge_attribute). The types
+    # that are not listed ('object', 'NoneType') accept any value
+    ACCEPTED_CLASSES = {'str': (str,), 'int': (int,), 'float': (float, int), 'bool': (bool,)}
+
+    # Marks a missing member of a json fragment
+    MISSING = object()
+
+    # A ValidatorCompiler builds validating factories: functions that create
+    # the object of a class from a json fragment, like the generated from_json
+    # factories, while checking the fragment against the schema of the class.
+    # The checks are done during construction (there is no second traversal),
+    # and do not stop at the first error: every error is recorded, with the
+    # path of the faulty member, and a ValidationError lists them at the end.
+    #
+    # A fragment is valid when:
+    #   - every attribute and relationship of the class is present
+    #   - every attribute has a value of its recorded type, or null
+    #   - "liste_" members are json arrays, "table_" members json objects, and
+    #     their elements (like the objects of ONE_TO_ONE relationships) are
+    #     valid json objects of the related class
+    # A faulty attribute is set to None, and a faulty related object is not
+    # created, so that the errors of the rest of the document are still found.
+    #
+    # Like FactoryCompiler, the validating factories are written in python, one
+    # per class, from its recorded types and relationships, and compiled with
+    # exec. The objects of the lazy relationships are created at once
+    def __init__(self):
+        self.namespace = {"_missing": ValidatorCompiler.MISSING, "_report": ValidatorCompiler.report}
+        # name of the validating function, and of the checking function (see
+        # get_checker), of each class
+        self.functions = dict()
+        self.checkers = dict()
+        self.source = []
+
+
+    # Returns the validating factory of top_class: a function of a json
+    # fragment that returns the new object, or raises a ValidationError
+    def compile(self, top_class):
+        validator = self.get_validator(top_class)
+        code = compile("".join(self.source), "<compiled validators of " + top_class.fully_qualified_name() + ">", "exec")
+        exec(code, self.namespace)
+        validate = self.namespace[validator]
+
+        def create_object(json_fragment: dict):
+            errors = []
+            top_object = validate(json_fragment, None, errors)
+            if errors:
+                raise ValidationError(errors)
+            return top_object
+        return create_object
+
+
+    # Paths are built lazily, as (parent path, token) pairs (None for the
+    # root): the json pointer is only computed when an error is reported
+    @staticmethod
+    def get_pointer(path) -> str:
+        tokens = []
+        while path is not None:
+            path, token = path
+            tokens.append(str(token).replace("~", "~0").replace("/", "~1"))
+        return "".join("/" + token for token in reversed(tokens))
+
+
+    # Records an error on member 'name' of the fragment at 'path', and returns
+    # the value that replaces the faulty one (None)
+    @staticmethod
+    def report(errors: list, path, name: str, value, expected: str):
+        if value is ValidatorCompiler.MISSING:
+            message = "membre manquant"
+        else:
+            message = f"{expected} attendu, {type(value).__name__} trouvé ({value!r:.40})"
+        errors.append((ValidatorCompiler.get_pointer((path, name) if name is not None else path), message))
+        return None
+
+
+    # Returns the name, in the namespace, of the validating function of
+    # json_class, generating it if needed
+    def get_validator(self, json_class) -> str:
+        name = self.functions.get(json_class.name)
+        if name is not None:
+            return name
+        name = f"_validate_{json_class.name}"
+        # enregistré avant les relations, pour les relations récursives
+        self.functions[json_class.name] = name
+        json_class.get_factory()
+        self.namespace[f"_{json_class.name}_class"] = json_class.type
+        for attribute_name, interner in json_class.get_interners().items():
+            self.namespace[f"_intern_{json_class.name}_{attribute_name}"] = interner.intern
+
+        lines = [f"def {name}(json_fragment, path, errors):",
+                 "    if json_fragment.__class__ is not dict:",
+                 f"        return _report(errors, path, None, json_fragment, \"objet {json_class.name}\")",
+                 "    get = json_fragment.get"]
+        lines.extend(self.get_attribute_checks(json_class))
+
+        # 1. L'appel du constructeur, avec les valeurs vérifiées
+        constructor_arguments = ", ".join(f"value_{position}" for position in range(len(json_class.attributes)))
+        lines.append(f"    new_object = _{json_class.name}_class({constructor_arguments})")
+
+        # 2. La création (validée) des objets liés
+        for relation in json_class.relationships.values():
+            related_class = json_class.get_related_class(relation.destination_entity)
+            key = relation.json_key()
+            lines.append(f"    related_fragments = get(\"{key}\", _missing)")
+            if relation.multiplicity == Relationship.ONE_TO_ONE:
+                lines.append("    if related_fragments is _missing:")
+                lines.append(f"        _report(errors, path, \"{key}\", _missing, \"objet {related_class.name}\")")
+                lines.append("    elif related_fragments is not None:")
+                lines.append(f"        new_object.{relation.name} = {self.get_validator(related_class)}(related_fragments, (path, \"{key}\"), errors)")
+                continue
+            collection_class = "dict" if relation.is_indexed() else "list"
+            lines.append(f"    if related_fragments.__class__ is not {collection_class}:")
+            lines.append(f"        related_fragments = _report(errors, path, \"{key}\", related_fragments, \"{collection_class}\") or {collection_class}()")
+            lines.append(f"    collection_path = (path, \"{key}\")")
+            if relation.storage == Relationship.COLUMNS:
+                # les fragments valides sont ajoutés directement aux colonnes
+                lines.append(f"    add_{relation.name} = new_object.{key}.append_json")
+                validation = f"{self.get_checker(related_class)}(related_fragment, (collection_path, related_key), errors)"
+                addition = f"add_{relation.name}(related_fragment)"
+            else:
+                lines.append(f"    add_{relation.name} = new_object.add_{relation.name}")
+                validation = f"(related_object := {self.get_validator(related_class)}(related_fragment, (collection_path, related_key), errors)) is not None"
+                addition = f"add_{relation.name}(related_object)"
+            items = "related_fragments.items()" if relation.is_indexed() else "enumerate(related_fragments)"
+            lines.append(f"    for related_key, related_fragment in {items}:")
+            lines.append(f"        if {validation}:")
+            lines.append(f"            {addition}")
+        lines.append("    return new_object")
+
+        self.source.append("\n".join(lines) + "\n\n\n")
+        return name
+
+
+    # Returns the name of a function that checks a json fragment of json_class
+    # (attributes only) and tells whether it is a json object, for the
+    # relationships stored column-wise: their fragments are appended as is
+    def get_checker(self, json_class) -> str:
+        name = self.checkers.get(json_class.name)
+        if name is not None:
+            return name
+        name = f"_check_{json_class.name}"
+        self.checkers[json_class.name] = name
+        lines = [f"def {name}(json_fragment, path, errors):",
+                 "    if json_fragment.__class__ is not dict:",
+                 f"        _report(errors, path, None, json_fragment, \"objet {json_class.name}\")",
+                 "        return False",
+                 "    get = json_fragment.get"]
+        lines.extend(self.get_attribute_checks(json_class))
+        lines.append("    return True")
+        self.source.append("\n".join(lines) + "\n\n\n")
+        return name
+
+
+    # Returns the lines that read and check the attributes of a fragment: the
+    # value of the n-th attribute is left in value_<n>, after its interner for
+    # an interned attribute. A null value is accepted for every type, since
+    # build_class merges it into any type
+    def get_attribute_checks(self, json_class) -> list:
+        lines = []
+        for position, (attribute_name, attribute_type) in enumerate(json_class.attributes.items()):
+            variable = f"value_{position}"
+            lines.append(f"    {variable} = get(\"{attribute_name}\", _missing)")
+            accepted_classes = ValidatorCompiler.ACCEPTED_CLASSES.get(attribute_type)
+            if accepted_classes is None:
+                test = f"{variable} is _missing"
+            elif len(accepted_classes) == 1:
+                test = f"{variable}.__class__ is not {accepted_classes[0].__name__} and {variable} is not None"
+            else:
+                test = f"{variable}.__class__ not in ({', '.join(accepted.__name__ for accepted in accepted_classes)}) and {variable} is not None"
+            lines.append(f"    if {test}:")
+            lines.append(f"        {variable} = _report(errors, path, \"{attribute_name}\", {variable}, \"{attribute_type}\")")
+            if attribute_name in json_class.interned_attributes:
+                lines.append(f"    {variable} = _intern_{json_class.name}_{attribute_name}({variable})")
+        return lines
@@ -0,0 +1,88 @@
+import sys
+
+class ValueInterner:
+
+    # The interners, indexed by (fully qualified class name, attribute name).
+    # An interner outlives the reloads of its generated module, so that its
+    # table and statistics are kept
+    INTERNERS = dict()
+
+    # Default number of distinct values kept by an interner
+    DEFAULT_MAX_SIZE = 65536
+
+    # A ValueInterner deduplicates the strings of one attribute of a generated
+    # class: the generated from_json factory passes every value of the attribute
+    # through intern, which returns the first string seen with the same value,
+    # so that equal values read from many json fragments share a single object
+    # (the copies made by the parser are then freed with the fragments).
+    #
+    # Unlike sys.intern, the table is bounded: once it holds max_size values,
+    # the oldest value is evicted for each new one (first in, first out: a
+    # value evicted and seen again is simply interned again). The values that
+    # are not strings are returned as is (1 == 1.0 == True would otherwise be
+    # merged)
+    def __init__(self, class_name: str, attribute_name: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.class_name = class_name
+        self.attribute_name = attribute_name
+        self.max_size = max_size
+        # pour chaque valeur: [copie canonique, nombre de copies remplacées]
+        self.table = dict()
+        # copies remplacées, et octets économisés, par les valeurs évincées
+        self.evicted_hits = 0
+        self.evicted_bytes_saved = 0
+        self.evictions = 0
+
+
+    # Returns the interner of an attribute, creating it the first time (used
+    # by the generated modules, when they are imported)
+    @staticmethod
+    def get_interner(class_name: str, attribute_name: str, max_size: int = DEFAULT_MAX_SIZE):
+        interner = ValueInterner.INTERNERS.get((class_name, attribute_name))
+        if interner is None:
+            interner = ValueInterner(class_name, attribute_name, max_size)
+            ValueInterner.INTERNERS[(class_name, attribute_name)] = interner
+        interner.max_size = max_size
+        return interner
+
+
+    # The statistics are kept per value, and the sizes computed by
+    # get_statistics only: the path of a value already interned is a lookup
+    # and an increment
+    def intern(self, value):
+        if value.__class__ is not str:
+            return value
+        entry = self.table.get(value)
+        if entry is None:
+            table = self.table
+            if len(table) >= self.max_size:
+                canonical, hits = table.pop(next(iter(table)))
+                self.evicted_hits += hits
+                self.evicted_bytes_saved += hits * sys.getsizeof(canonical)
+                self.evictions += 1
+            table[value] = [value, 0]
+            return value
+        canonical = entry[0]
+        if canonical is not value:
+            entry[1] += 1
+        return canonical
+
+
+    # Forgets the values and the statistics
+    def clear(self):
+        self.table.clear()
+        self.evicted_hits = 0
+        self.evicted_bytes_saved = 0
+        self.evictions = 0
+
+
+    # Returns the number of values in the table, the number of copies replaced
+    # by a canonical value (hits), and the size of these copies (bytes_saved)
+    def get_statistics(self) -> dict:
+        hits = self.evicted_hits + sum(entry[1] for entry in self.table.values())
+        bytes_saved = self.evicted_bytes_saved + sum(entry[1] * sys.getsizeof(entry[0]) for entry in self.table.values())
+        return {"values": len(self.table), "hits": hits, "bytes_saved": bytes_saved, "evictions": self.evictions}
+
+
+    def __str__(self) -> str:
+        statistics = self.get_statistics()
+        return f"ValueInterner[{self.class_name}.{self.attribute_name}, values = {statistics['values']}, hits = {statistics['hits']}, bytes saved = {statistics['bytes_saved']}]"
@@ -0,0 +1,32 @@
+import importlib
+from ca.uqam.info.mgl7460.meta.memory_importer import InMemoryImporter
+
+# Ce module contient les fonctions exécutées par les processus de
+# json_loader.create_object_parallel. Elles sont définies au niveau du
+# module pour pouvoir être transmises aux processus (pickle).
+
+# Collections de fragments json à traiter, par clé de relation. Quand les
+# processus sont créés par fork, ils héritent de cette variable: seules les
+# bornes des morceaux leur sont alors transmises, et non les fragments
+SHARED_FRAGMENTS = None
+
+
+# Registers, in a new process, the modules generated in memory by the
+# parent process, so that the generated classes can be imported
+def init_worker(sources: dict):
+    importer = InMemoryImporter.get_instance()
+    for module_name, source in sources.items():
+        importer.add_module(module_name, source)
+
+
+# Creates the objects of a chunk of json fragments, with the from_json
+# factory of the generated class (resolved once per chunk)
+def build_objects(module_name: str, class_name: str, fragments: list) -> list:
+    factory = getattr(importlib.import_module(module_name), class_name).from_json
+    return [factory(fragment) for fragment in fragments]
+
+
+# Same as build_objects, for a chunk of the fragments inherited from the
+# parent process
+def build_shared_objects(module_name: str, class_name: str, key: str, start: int, end: int) -> list:
+    return build_objects(module_name, class_name, SHARED_FRAGMENTS[key][start:end])